@@ -0,0 +1,1872 @@
+"""Load-test and benchmark harness for the MenuMatch Lambda handlers.
+
+Every handler is imported in-process and invoked with API Gateway (payload
+v2) shaped events against local stand-ins: moto (or any endpoint such as
+DynamoDB Local / MinIO via --endpoint-url) for DynamoDB and S3, and
+`huskyeats_stub.HuskyEatsStub` for the Husky Eats API.
+
+    python bench.py run --rows 1000 --guesses 1000 --concurrency 1,8,32
+    python bench.py compare results/old.json results/new.json
+    python bench.py resilience --failure-rate 0.3 --hedge-after-ms 150
+    python bench.py multipart --size-mb 24 --part-mb 5
+"""
+import argparse
+import gc
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from huskyeats_stub import (
+    DINING_HALL_IDS,
+    MEALTIMES,
+    NAME_BASES,
+    NAME_DISHES,
+    NAME_STYLES,
+    HuskyEatsStub,
+    build_catalog,
+)
+
+BENCH_DIR = Path(__file__).resolve().parent
+LAMBDAS_DIR = BENCH_DIR.parent / "lambdas"
+# Modules packaged next to every handler in its Lambda zip.
+SHARED_DIR = LAMBDAS_DIR / "_shared"
+RESULTS_DIR = BENCH_DIR / "results"
+
+AUTH_TOKEN = "bench-token"
+BUCKET_NAME = "mml-bench-uploads"
+DIFFICULTIES = ("easy", "medium", "hard")
+BENCH_RUN_ID = "bench-run"
+PREDICTION_BATCH_SIZE = 100
+
+# Environment variable -> (table name, key schema as [(attribute, key type)]).
+TABLE_SPECS = {
+    "METADATA_TABLE": ("mml-bench-metadata", [("objectKey", "HASH")]),
+    "GUESTIMATE_TABLE": (
+        "mml-bench-guestimates",
+        [("sampleId", "HASH"), ("guessedAt", "RANGE")],
+    ),
+    "COVERAGE_TABLE": ("mml-bench-coverage", [("menuItemId", "HASH")]),
+    "ITEM_INDEX_TABLE": (
+        "mml-bench-item-index",
+        [("menuItemId", "HASH"), ("sortKey", "RANGE")],
+    ),
+    "CONTENT_HASH_TABLE": ("mml-bench-content-hashes", [("contentHash", "HASH")]),
+    "IDEMPOTENCY_TABLE": ("mml-bench-idempotency", [("idempotencyKey", "HASH")]),
+    "SESSION_ROLLUP_TABLE": ("mml-bench-session-rollups", [("rollupId", "HASH")]),
+    "PREDICTION_RUN_TABLE": (
+        "mml-bench-prediction-runs",
+        [("runId", "HASH"), ("sortKey", "RANGE")],
+    ),
+    "PHASH_INDEX_TABLE": (
+        "mml-bench-phash-index",
+        [("band", "HASH"), ("objectKey", "RANGE")],
+    ),
+}
+
+
+def _git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"],
+                cwd=BENCH_DIR,
+                stderr=subprocess.DEVNULL,
+            )
+            .decode("utf-8")
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        "min": latencies[0] if latencies else None,
+        "p50": _percentile(latencies, 0.50),
+        "p95": _percentile(latencies, 0.95),
+        "p99": _percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else None,
+        "mean": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+def _max_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage / divisor
+
+
+def _load_handler(name):
+    if str(SHARED_DIR) not in sys.path:
+        sys.path.insert(0, str(SHARED_DIR))
+    path = LAMBDAS_DIR / name / f"{name}.py"
+    spec = importlib.util.spec_from_file_location(f"bench_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def api_event(method, path, query=None, body=None, path_params=None, headers=None):
+    """Build an API Gateway HTTP API (payload v2) event."""
+    event_headers = {"x-api-key": AUTH_TOKEN, "content-type": "application/json"}
+    event_headers.update(headers or {})
+    return {
+        "version": "2.0",
+        "rawPath": path,
+        "headers": event_headers,
+        "queryStringParameters": query,
+        "pathParameters": path_params,
+        "requestContext": {"http": {"method": method, "path": path}},
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+
+def _configure_environment(args, husky_base_url):
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    if args.endpoint_url:
+        os.environ["AWS_ENDPOINT_URL"] = args.endpoint_url
+
+    for env_name, (table_name, _schema) in TABLE_SPECS.items():
+        os.environ[env_name] = table_name
+    os.environ["UPLOAD_BUCKET"] = BUCKET_NAME
+    os.environ["AUTH_TOKEN"] = AUTH_TOKEN
+    os.environ["HUSKYEATS_BASE_URL"] = husky_base_url
+    os.environ["DINING_HALL_IDS"] = ",".join(DINING_HALL_IDS)
+    os.environ["CATALOG_BUCKET"] = BUCKET_NAME
+    os.environ["DATASET_BUCKET"] = BUCKET_NAME
+    os.environ["GUESS_ARCHIVE_BUCKET"] = BUCKET_NAME
+
+
+def _create_resources(boto3):
+    dynamodb = boto3.resource("dynamodb")
+    existing = {table.name for table in dynamodb.tables.all()}
+    for table_name, schema in TABLE_SPECS.values():
+        if table_name in existing:
+            continue
+        dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[{"AttributeName": name, "KeyType": kind} for name, kind in schema],
+            AttributeDefinitions=[
+                {"AttributeName": name, "AttributeType": "S"} for name, _kind in schema
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        ).wait_until_exists()
+
+    s3 = boto3.client("s3")
+    try:
+        s3.create_bucket(Bucket=BUCKET_NAME)
+    except s3.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    return dynamodb, s3
+
+
+def _synthetic_phash(index):
+    # Drawn from its own generator so adding it left the seeded rows unchanged.
+    # Every tenth upload is a near duplicate (3 flipped bits) of the one before.
+    base = random.Random(index - (index % 10 == 9)).getrandbits(64)
+    if index % 10 == 9:
+        base ^= (1 << 3) | (1 << 29) | (1 << 51)
+    return f"{base:016x}"
+
+
+def _synthetic_record(rng, index, catalog_size, start):
+    created_at = start + timedelta(seconds=index)
+    item_count = rng.choice((1, 1, 2, 3, 4))
+    return {
+        "objectKey": f"v1/bench-{index:08d}.jpg",
+        "bucket": BUCKET_NAME,
+        "mealtime": rng.choice(MEALTIMES),
+        "mealDate": created_at.date().isoformat(),
+        "diningHallId": rng.choice(DINING_HALL_IDS),
+        "difficulty": rng.choice(DIFFICULTIES),
+        "items": [
+            {
+                "menuItemId": str(rng.randint(1, catalog_size)),
+                "servings": Decimal(str(rng.choice((0.5, 1, 1, 1.5, 2, 3)))),
+            }
+            for _ in range(item_count)
+        ],
+        "createdAt": created_at.isoformat(),
+        "uploadedBy": f"netid{rng.randint(1, 50)}",
+        "perceptualHash": _synthetic_phash(index),
+    }
+
+
+def _synthetic_guess(rng, record, index, start):
+    guessed_at = (start + timedelta(microseconds=index)).isoformat(timespec="microseconds")
+    ground_truth = {
+        "kcal": Decimal(str(rng.randint(100, 1500))),
+        "protein_g": Decimal(str(round(rng.uniform(0, 80), 2))),
+        "carb_g": Decimal(str(round(rng.uniform(0, 200), 2))),
+        "fat_g": Decimal(str(round(rng.uniform(0, 70), 2))),
+    }
+    guess = {
+        field: Decimal(str(round(float(value) * rng.uniform(0.5, 1.5), 2)))
+        for field, value in ground_truth.items()
+    }
+    return {
+        "sampleId": record["objectKey"],
+        "guessedAt": guessed_at,
+        "guess": guess,
+        "groundTruth": ground_truth,
+        "sampleMeta": {
+            "bucket": record["bucket"],
+            "mealDate": record["mealDate"],
+            "mealtime": record["mealtime"],
+            "diningHallId": record["diningHallId"],
+            "difficulty": record["difficulty"],
+        },
+        "clientSessionId": f"session-{rng.randint(1, 200)}",
+        "createdAt": guessed_at,
+    }
+
+
+def seed_dataset(dynamodb, rows, guesses, catalog_size, seed=0):
+    """Write synthetic metadata rows and guesses; return the seeded records."""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    metadata_table = dynamodb.Table(TABLE_SPECS["METADATA_TABLE"][0])
+    guestimate_table = dynamodb.Table(TABLE_SPECS["GUESTIMATE_TABLE"][0])
+
+    records = []
+    with metadata_table.batch_writer() as batch:
+        for index in range(rows):
+            record = _synthetic_record(rng, index, catalog_size, start)
+            batch.put_item(Item=record)
+            records.append(record)
+
+    if records:
+        with guestimate_table.batch_writer() as batch:
+            for index in range(guesses):
+                batch.put_item(Item=_synthetic_guess(rng, rng.choice(records), index, start))
+
+    # A registered model run for the prediction scenarios to submit into.
+    dynamodb.Table(TABLE_SPECS["PREDICTION_RUN_TABLE"][0]).put_item(
+        Item={
+            "runId": BENCH_RUN_ID,
+            "sortKey": "#run",
+            "name": "bench-model",
+            "createdAt": start.isoformat(),
+            "updatedAt": start.isoformat(),
+            "predictionCount": 0,
+            "batchCount": 0,
+        }
+    )
+    return records
+
+
+class ScenarioContext:
+    """Shared state that scenario event factories draw from."""
+
+    def __init__(self, records, catalog_size, s3=None):
+        self.object_keys = [record["objectKey"] for record in records]
+        self.catalog_size = catalog_size
+        self.s3 = s3
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+
+def _guess_body(rng, object_key):
+    return {
+        "objectKey": object_key,
+        "guess": {
+            "kcal": rng.randint(100, 1200),
+            "protein_g": rng.randint(0, 60),
+            "carb_g": rng.randint(0, 150),
+            "fat_g": rng.randint(0, 60),
+        },
+        "clientSessionId": f"bench-{rng.randint(1, 20)}",
+    }
+
+
+def _retried_guess_event(ctx, rng):
+    # A small key pool means most requests replay a stored response.
+    key = rng.randrange(16)
+    return api_event(
+        "POST",
+        "/guestimate/guess",
+        body=_guess_body(random.Random(key), ctx.object_keys[key % len(ctx.object_keys)]),
+        headers={"idempotency-key": f"bench-retry-{key}"},
+    )
+
+
+def _prediction_batch_event(ctx, rng):
+    object_keys = rng.sample(ctx.object_keys, min(PREDICTION_BATCH_SIZE, len(ctx.object_keys)))
+    return api_event(
+        "POST",
+        f"/guestimate/runs/{BENCH_RUN_ID}/predictions",
+        path_params={"runId": BENCH_RUN_ID},
+        body={
+            "batchId": f"bench-{ctx.next_id():08d}",
+            "predictions": [
+                {"objectKey": object_key, **_guess_body(rng, object_key)["guess"]}
+                for object_key in object_keys
+            ],
+        },
+    )
+
+
+def _metadata_body(ctx, rng):
+    object_key = f"v1/bench-new-{ctx.next_id():08d}-{rng.getrandbits(32):08x}.jpg"
+    # upload_metadata verifies the image exists, so upload it first (untimed).
+    ctx.s3.put_object(Bucket=BUCKET_NAME, Key=object_key, Body=object_key.encode("utf-8"))
+    return {
+        "objectKey": object_key,
+        "bucket": BUCKET_NAME,
+        "mealtime": rng.choice(MEALTIMES),
+        "date": "2025-02-01",
+        "diningHallId": rng.choice(DINING_HALL_IDS),
+        "difficulty": rng.choice(DIFFICULTIES),
+        "uploadedBy": "benchuser",
+        "perceptualHash": f"{rng.getrandbits(64):016x}",
+        "items": [
+            {"menuItemId": str(rng.randint(1, ctx.catalog_size)), "servings": 1}
+            for _ in range(rng.randint(1, 3))
+        ],
+    }
+
+
+# Scenario name -> (handler module, event factory(ctx, rng)).
+SCENARIOS = {
+    "get_dataset": (
+        "get_dataset",
+        lambda ctx, rng: api_event("GET", "/dataset"),
+    ),
+    "get_dataset_gzip": (
+        "get_dataset",
+        lambda ctx, rng: api_event("GET", "/dataset", headers={"accept-encoding": "gzip, br"}),
+    ),
+    "get_dataset_manifest": (
+        "get_dataset",
+        lambda ctx, rng: api_event("GET", "/dataset/manifest"),
+    ),
+    "get_dataset_by_item": (
+        "get_dataset",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/dataset",
+            query={"menuItemId": str(rng.randint(1, ctx.catalog_size))},
+        ),
+    ),
+    "get_dataset_item": (
+        "get_dataset_item",
+        lambda ctx, rng: (
+            lambda key: api_event(
+                "GET", f"/dataset/{key}", path_params={"objectKey": key}
+            )
+        )(rng.choice(ctx.object_keys)),
+    ),
+    "presign_upload": (
+        "presign_upload",
+        lambda ctx, rng: api_event(
+            "POST",
+            "/uploads/presign",
+            body={"filename": "plate.jpg", "contentType": "image/jpeg"},
+        ),
+    ),
+    "presign_download": (
+        "presign_download",
+        lambda ctx, rng: api_event(
+            "POST", "/downloads/presign", body={"objectKey": rng.choice(ctx.object_keys)}
+        ),
+    ),
+    "upload_metadata": (
+        "upload_metadata",
+        lambda ctx, rng: api_event("POST", "/uploads/metadata", body=_metadata_body(ctx, rng)),
+    ),
+    "get_coverage": (
+        "get_coverage",
+        lambda ctx, rng: api_event("GET", "/dataset/coverage"),
+    ),
+    "get_coverage_menu": (
+        "get_coverage",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/dataset/coverage",
+            query={"date": "2026-01-15", "hallId": rng.choice(DINING_HALL_IDS)},
+        ),
+    ),
+    "get_duplicates": (
+        "get_duplicates",
+        lambda ctx, rng: api_event("GET", "/dataset/duplicates"),
+    ),
+    "get_duplicates_by_item": (
+        "get_duplicates",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/dataset/duplicates",
+            query={"objectKey": rng.choice(ctx.object_keys)},
+        ),
+    ),
+    "guestimate_sample": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={"index": str(rng.randrange(len(ctx.object_keys)))},
+        ),
+    ),
+    "guestimate_sample_batch": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={
+                "index": str(rng.randrange(len(ctx.object_keys))),
+                "seed": f"bench-{rng.randint(1, 5)}",
+                "count": "5",
+            },
+        ),
+    ),
+    "guestimate_sample_stratified": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={
+                "index": str(rng.randrange(len(ctx.object_keys))),
+                "seed": f"bench-{rng.randint(1, 5)}",
+                "strategy": "stratified",
+                "stratifyBy": "diningHallId,mealtime",
+            },
+        ),
+    ),
+    "guestimate_sample_least_guessed": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={
+                "index": str(rng.randrange(len(ctx.object_keys))),
+                "strategy": "least_guessed",
+            },
+        ),
+    ),
+    "guestimate_sample_exclude_guessed": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={
+                "index": "0",
+                "strategy": "exclude_guessed",
+                "clientSessionId": f"session-{rng.randint(1, 200)}",
+            },
+        ),
+    ),
+    "guestimate_sample_seeded": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/sample",
+            query={
+                "index": str(rng.randrange(len(ctx.object_keys))),
+                "seed": f"bench-{rng.randint(1, 5)}",
+            },
+        ),
+    ),
+    "guestimate_guess": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "POST", "/guestimate/guess", body=_guess_body(rng, rng.choice(ctx.object_keys))
+        ),
+    ),
+    "guestimate_guess_retry": ("guestimate", _retried_guess_event),
+    "guestimate_analysis": (
+        "guestimate",
+        lambda ctx, rng: api_event("GET", "/guestimate/analysis"),
+    ),
+    "guestimate_analysis_bootstrap": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/analysis",
+            query={"bootstrap": "1000", "seed": str(rng.randint(1, 4))},
+        ),
+    ),
+    "guestimate_run_predictions": ("guestimate", _prediction_batch_event),
+    "guestimate_runs_compare": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET", "/guestimate/runs/compare", query={"runIds": BENCH_RUN_ID}
+        ),
+    ),
+    "menu_search": (
+        "search_menu_items",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/menu/search",
+            query={"q": f"{rng.choice(NAME_STYLES)} {rng.choice(NAME_DISHES)[:-1]}"},
+        ),
+    ),
+    "menu_search_filtered": (
+        "search_menu_items",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/menu/search",
+            query={
+                "q": rng.choice(NAME_BASES)[:4],
+                "hallId": rng.choice(DINING_HALL_IDS),
+                "meal": rng.choice(MEALTIMES),
+                "date": "2025-01-15",
+            },
+        ),
+    ),
+    "guestimate_leaderboard": (
+        "guestimate",
+        lambda ctx, rng: api_event(
+            "GET",
+            "/guestimate/leaderboard",
+            query={
+                "metric": rng.choice(("pmae", "mae")),
+                "field": rng.choice(("kcal", "protein_g")),
+                "minCount": "5",
+            },
+        ),
+    ),
+}
+
+
+# Handler module -> direct-invocation events run once after seeding so derived
+# tables (item index, coverage, session rollups) reflect the seeded data.
+SETUP_EVENTS = {
+    "publish_dataset": [{}],
+    "sync_catalog": [{"source": "aws.events", "detail-type": "Scheduled Event"}],
+    "upload_metadata": [{"action": "backfill_index"}],
+    "get_coverage": [{"action": "rebuild"}],
+    "guestimate": [{"action": "rebuild_rollups"}],
+}
+
+
+def _mock_aws():
+    """moto's in-process backends are not thread-safe (concurrent calls fail
+    with RuntimeError, and moto server mode races the same way), so requests
+    into them are serialized. Handlers still run concurrently; time spent
+    queued for the one stand-in backend counts toward their latency."""
+    from moto import mock_aws
+    from moto.core.models import botocore_stubber
+
+    if not getattr(botocore_stubber, "benchSerialized", False):
+        process_request = botocore_stubber.process_request
+        backend_lock = threading.Lock()
+
+        def serialized_process_request(request):
+            with backend_lock:
+                return process_request(request)
+
+        botocore_stubber.process_request = serialized_process_request
+        botocore_stubber.benchSerialized = True
+    return mock_aws()
+
+
+def _is_success(status):
+    return status.isdigit() and 200 <= int(status) < 300
+
+
+def run_scenario(handler, factory, ctx, concurrency, requests, seed, trace_memory):
+    """Invoke `handler` `requests` times across `concurrency` threads."""
+    rng_lock = threading.Lock()
+    rng = random.Random(seed)
+    latencies = []
+    status_counts = {}
+    results_lock = threading.Lock()
+
+    def invoke(_):
+        with rng_lock:
+            event = factory(ctx, rng)
+        started = time.perf_counter()
+        try:
+            response = handler(event, None)
+            status = str((response or {}).get("statusCode"))
+        except Exception as error:  # noqa: BLE001 - surface handler crashes in the report
+            status = f"exception:{type(error).__name__}"
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with results_lock:
+            # Failed calls are counted, not timed, so they cannot pass for
+            # latency changes in `compare`.
+            if _is_success(status):
+                latencies.append(elapsed_ms)
+            status_counts[status] = status_counts.get(status, 0) + 1
+
+    if trace_memory:
+        tracemalloc.start()
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(invoke, range(requests)))
+    wall_seconds = time.perf_counter() - wall_started
+    peak_traced_mb = None
+    if trace_memory:
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_traced_mb = peak / (1024 * 1024)
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "wallSeconds": wall_seconds,
+        "throughputRps": requests / wall_seconds if wall_seconds > 0 else None,
+        "latencyMs": _latency_summary(latencies),
+        "statusCounts": status_counts,
+        "errorCount": requests - len(latencies),
+        "tracedPeakMb": peak_traced_mb,
+        "maxRssMb": _max_rss_mb(),
+    }
+
+
+def command_run(args):
+    selected = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+    concurrency_levels = [int(value) for value in args.concurrency.split(",")]
+
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    stub = HuskyEatsStub(
+        catalog,
+        latency_ms=args.husky_latency_ms,
+        jitter_ms=args.husky_jitter_ms,
+        failure_rate=args.husky_failure_rate,
+    )
+
+    with stub:
+        _configure_environment(args, stub.base_url)
+
+        if args.endpoint_url:
+            aws_mock = nullcontext()
+        else:
+            try:
+                aws_mock = _mock_aws()
+            except ImportError as exc:
+                raise SystemExit(
+                    "moto is required unless --endpoint-url points at local services."
+                ) from exc
+
+        with aws_mock:
+            import boto3
+
+            dynamodb, s3 = _create_resources(boto3)
+            seed_started = time.perf_counter()
+            records = seed_dataset(
+                dynamodb, args.rows, args.guesses, args.catalog_size, seed=args.seed
+            )
+            seed_seconds = time.perf_counter() - seed_started
+            if not records:
+                raise SystemExit("--rows must be at least 1.")
+
+            ctx = ScenarioContext(records, args.catalog_size, s3=s3)
+            handlers = {}
+            for module_name, setup_events in SETUP_EVENTS.items():
+                handlers[module_name] = _load_handler(module_name).lambda_handler
+                for setup_event in setup_events:
+                    handlers[module_name](setup_event, None)
+
+            results = []
+            for name in selected:
+                module_name, factory = SCENARIOS[name]
+                if module_name not in handlers:
+                    handlers[module_name] = _load_handler(module_name).lambda_handler
+                for concurrency in concurrency_levels:
+                    outcome = run_scenario(
+                        handlers[module_name],
+                        factory,
+                        ctx,
+                        concurrency,
+                        args.requests,
+                        args.seed,
+                        args.trace_memory,
+                    )
+                    outcome["scenario"] = name
+                    results.append(outcome)
+                    latency = outcome["latencyMs"]
+                    print(
+                        f"{name:28s} c={concurrency:<4d} "
+                        f"{outcome['throughputRps']:9.1f} req/s  "
+                        f"p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms "
+                        f"p99={latency['p99']:8.2f}ms  {outcome['statusCounts']}"
+                    )
+
+    report = {
+        "commit": _git_commit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "rows": args.rows,
+            "guesses": args.guesses,
+            "catalogSize": args.catalog_size,
+            "requests": args.requests,
+            "concurrency": concurrency_levels,
+            "huskyLatencyMs": args.husky_latency_ms,
+            "huskyJitterMs": args.husky_jitter_ms,
+            "huskyFailureRate": args.husky_failure_rate,
+            "endpointUrl": args.endpoint_url,
+            "seed": args.seed,
+        },
+        "seedSeconds": seed_seconds,
+        "huskyEatsRequests": stub.request_count,
+        "results": results,
+    }
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR
+        / f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{report['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+    failed = [
+        f"{result['scenario']}@c={result['concurrency']}"
+        for result in results
+        if result["errorCount"]
+    ]
+    if failed:
+        print(f"Requests failed in: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def _index_results(report):
+    return {
+        (result["scenario"], result["concurrency"]): result
+        for result in report.get("results", [])
+    }
+
+
+def command_compare(args):
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    baseline_results = _index_results(baseline)
+    regressions = []
+
+    print(f"baseline {baseline.get('commit')}  ->  candidate {candidate.get('commit')}")
+    for key, result in sorted(_index_results(candidate).items()):
+        previous = baseline_results.get(key)
+        if previous is None:
+            continue
+        changes = []
+        for metric in ("p50", "p95", "p99"):
+            before = previous["latencyMs"][metric]
+            after = result["latencyMs"][metric]
+            if not before or after is None:
+                continue
+            ratio = (after - before) / before
+            changes.append(f"{metric} {before:8.2f} -> {after:8.2f} ({ratio:+.0%})")
+            if metric == "p95" and ratio > args.max_regression:
+                regressions.append(key)
+        print(f"{key[0]:28s} c={key[1]:<4d} " + "  ".join(changes))
+
+    if regressions:
+        names = ", ".join(f"{name}@c={concurrency}" for name, concurrency in regressions)
+        print(f"p95 regressed more than {args.max_regression:.0%}: {names}")
+        return 1
+    return 0
+
+
+def _timed_fetch(fetch, item_id):
+    started = time.perf_counter()
+    try:
+        fetch(item_id)
+        ok = True
+    except RuntimeError:
+        ok = False
+    return ok, (time.perf_counter() - started) * 1000.0
+
+
+def _summarize_fetches(outcomes):
+    latencies = sorted(latency for _ok, latency in outcomes)
+    return {
+        "requests": len(outcomes),
+        "successRate": (
+            sum(1 for ok, _latency in outcomes if ok) / len(outcomes) if outcomes else None
+        ),
+        "latencyMs": {
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+        },
+    }
+
+
+def command_resilience(args):
+    """Drive guestimate's Husky Eats client against a flaky, then dead, stub."""
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    stub = HuskyEatsStub(
+        catalog,
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+    )
+    with stub:
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ["HUSKYEATS_BASE_URL"] = stub.base_url
+        os.environ["HUSKYEATS_HEDGE_AFTER_SECONDS"] = str(args.hedge_after_ms / 1000.0)
+        # Every lookup goes upstream, so cached entries are only ever served stale.
+        os.environ["NUTRITION_CACHE_TTL_SECONDS"] = "0"
+        os.environ["CATALOG_BUCKET"] = ""
+        guestimate = _load_handler("guestimate")
+        # The handler sets the root logger to INFO; keep per-retry warnings quiet.
+        logging.getLogger().setLevel(logging.CRITICAL)
+        item_ids = [str(index) for index in range(1, args.catalog_size + 1)]
+
+        flaky = [_timed_fetch(guestimate._fetch_nutrition, item_id) for item_id in item_ids]
+        upstream_calls = stub.request_count
+
+        stub.down = True
+        outage_cached = [
+            _timed_fetch(guestimate._fetch_nutrition, item_id) for item_id in item_ids[:50]
+        ]
+        guestimate.nutrition_cache.clear()
+        outage_uncached = [
+            _timed_fetch(guestimate._fetch_nutrition, item_id) for item_id in item_ids[:50]
+        ]
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "flaky": _summarize_fetches(flaky) | {"upstreamRequests": upstream_calls},
+        "outageStaleCache": _summarize_fetches(outage_cached),
+        "outageNoCache": _summarize_fetches(outage_uncached),
+        "breakerOpenAtEnd": guestimate._breaker_is_open(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+class PartitionThrottle:
+    """Model DynamoDB's per-partition write limit on top of moto.
+
+    Writes to one partition key are admitted at most `writes_per_second`,
+    queueing behind each other (as adaptive capacity plus SDK retries would),
+    while writes to different keys proceed independently.
+    """
+
+    def __init__(self, writes_per_second):
+        self.interval = 1.0 / writes_per_second
+        self.hash_keys = {
+            table_name: next(name for name, kind in schema if kind == "HASH")
+            for table_name, schema in TABLE_SPECS.values()
+        }
+        self.next_free = {}
+        self.writes = {}
+        self._lock = threading.Lock()
+
+    def attach(self, client):
+        client.meta.events.register("provide-client-params.dynamodb.PutItem", self._on_put)
+        client.meta.events.register("provide-client-params.dynamodb.UpdateItem", self._on_update)
+        client.meta.events.register(
+            "provide-client-params.dynamodb.TransactWriteItems", self._on_transaction
+        )
+
+    def _admit(self, table_name, key_value):
+        partition = (table_name, str(key_value))
+        with self._lock:
+            now = time.monotonic()
+            start = max(self.next_free.get(partition, now), now)
+            self.next_free[partition] = start + self.interval
+            self.writes[partition] = self.writes.get(partition, 0) + 1
+        if start > now:
+            time.sleep(start - now)
+
+    def _on_put(self, params, **_kwargs):
+        table_name = params["TableName"]
+        self._admit(table_name, params["Item"].get(self.hash_keys.get(table_name)))
+
+    def _on_update(self, params, **_kwargs):
+        table_name = params["TableName"]
+        self._admit(table_name, params["Key"].get(self.hash_keys.get(table_name)))
+
+    def _on_transaction(self, params, **_kwargs):
+        for action in params["TransactItems"]:
+            (kind, request), = action.items()
+            table_name = request["TableName"]
+            item = request.get("Item") if kind == "Put" else request.get("Key")
+            self._admit(table_name, (item or {}).get(self.hash_keys.get(table_name)))
+
+
+def command_hotkey(args):
+    """Post concurrent guesses on a single sample through PartitionThrottle,
+    once with one partition per sample and once with GUESS_SHARDS."""
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    with HuskyEatsStub(catalog) as stub:
+        args.endpoint_url = None
+        _configure_environment(args, stub.base_url)
+        if not args.rollups:
+            os.environ["SESSION_ROLLUP_TABLE"] = ""
+        try:
+            from moto import mock_aws
+        except ImportError as exc:
+            raise SystemExit("moto is required for the hot-key check.") from exc
+
+        with mock_aws():
+            import boto3
+
+            dynamodb, s3 = _create_resources(boto3)
+            records = seed_dataset(dynamodb, args.rows, 0, args.catalog_size, seed=args.seed)
+            _load_handler("sync_catalog").lambda_handler({}, None)
+            ctx = ScenarioContext(records, args.catalog_size, s3=s3)
+            # Every evaluator starts an unseeded run at index 0.
+            hot_key = ctx.object_keys[0]
+
+            def hot_guess(_ctx, rng):
+                return api_event("POST", "/guestimate/guess", body=_guess_body(rng, hot_key))
+
+            phases = []
+            for shards in sorted({1, args.shards}):
+                os.environ["GUESS_SHARDS"] = str(shards)
+                guestimate = _load_handler("guestimate")
+                throttle = PartitionThrottle(args.partition_wps)
+                throttle.attach(guestimate.dynamodb.meta.client)
+                outcome = run_scenario(
+                    guestimate.lambda_handler,
+                    hot_guess,
+                    ctx,
+                    args.concurrency,
+                    args.requests,
+                    args.seed,
+                    False,
+                )
+                guess_partitions = {
+                    key: count
+                    for (table_name, key), count in throttle.writes.items()
+                    if table_name == TABLE_SPECS["GUESTIMATE_TABLE"][0]
+                }
+                outcome["shards"] = shards
+                outcome["guessPartitions"] = len(guess_partitions)
+                outcome["hottestPartitionWrites"] = max(guess_partitions.values(), default=0)
+                phases.append(outcome)
+                latency = outcome["latencyMs"]
+                print(
+                    f"shards={shards:<3d} c={args.concurrency:<4d} "
+                    f"{outcome['throughputRps']:9.1f} req/s  "
+                    f"p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms  "
+                    f"partitions={outcome['guessPartitions']} {outcome['statusCounts']}"
+                )
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "phases": phases,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+# Deep enough that allocations made inside moto's recursive deepcopy still
+# show a moto frame.
+MEMORY_TRACE_FRAMES = 8
+
+
+def command_memory(args):
+    """Measure the resident size of guestimate's cached sample index per record,
+    built from a metadata scan and from a published manifest."""
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    with HuskyEatsStub(catalog) as stub:
+        args.endpoint_url = None
+        _configure_environment(args, stub.base_url)
+        try:
+            from moto import mock_aws
+        except ImportError as exc:
+            raise SystemExit("moto is required for the memory check.") from exc
+
+        with mock_aws():
+            import boto3
+
+            dynamodb, _s3 = _create_resources(boto3)
+            seed_dataset(dynamodb, args.rows, 0, args.catalog_size, seed=args.seed)
+
+            phases = []
+            for source in ("scan", "manifest"):
+                if source == "manifest":
+                    _load_handler("publish_dataset").lambda_handler({}, None)
+                guestimate = _load_handler("guestimate")
+                # Build once so botocore's lazily loaded models are not counted,
+                # then drop the cached index and records.
+                guestimate._load_sample_index()
+                guestimate.sample_index.clear()
+                guestimate.sample_index["builtAt"] = None
+                guestimate.manifest_records.clear()
+                gc.collect()
+                tracemalloc.start(MEMORY_TRACE_FRAMES)
+                before = tracemalloc.take_snapshot()
+                index = guestimate._load_sample_index()
+                gc.collect()
+                after = tracemalloc.take_snapshot()
+                _current, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                # moto keeps copies of the items it scanned; a real table would not.
+                without_moto = [tracemalloc.Filter(False, "*/moto/*", all_frames=True)]
+                resident = sum(
+                    stat.size_diff
+                    for stat in after.filter_traces(without_moto).compare_to(
+                        before.filter_traces(without_moto), "filename"
+                    )
+                )
+                count = len(index["records"])
+                phase = {
+                    "source": source,
+                    "records": count,
+                    "manifestVersion": index["manifestVersion"],
+                    "residentBytesPerRecord": resident / count,
+                    "peakTracedMb": peak / (1024 * 1024),
+                }
+                phases.append(phase)
+                print(
+                    f"{source:<9s} records={count:<7d} "
+                    f"resident={phase['residentBytesPerRecord']:8.1f} B/record  "
+                    f"peak={phase['peakTracedMb']:8.1f} MB (incl. moto)"
+                )
+                del index
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "phases": phases,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    over_budget = [
+        phase["source"]
+        for phase in phases
+        if phase["residentBytesPerRecord"] > args.budget_bytes
+    ]
+    if over_budget:
+        print(
+            f"Over the {args.budget_bytes:.0f} B/record budget: {', '.join(over_budget)}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+def _analysis_summary(response):
+    body = json.loads(response["body"])
+    return {
+        "guessCount": body["guessCount"],
+        "sampleCount": body["sampleCount"],
+        "metrics": body["metrics"],
+        "latest": [guess["guessedAt"] for guess in body["latestGuesses"]],
+    }
+
+
+def _analysis_matches(expected, actual):
+    if {key: expected[key] for key in ("guessCount", "sampleCount", "latest")} != {
+        key: actual[key] for key in ("guessCount", "sampleCount", "latest")
+    }:
+        return False
+    return all(
+        (value is None and actual["metrics"][name] is None)
+        or abs(value - actual["metrics"][name]) <= 1e-9 * max(1.0, abs(value))
+        for name, value in expected["metrics"].items()
+    )
+
+
+def command_compaction(args):
+    """Seed guesses spread over --days, then time GET /guestimate/analysis
+    before compaction, after it, and after TTL has removed the hot copies."""
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    with HuskyEatsStub(catalog) as stub:
+        args.endpoint_url = None
+        _configure_environment(args, stub.base_url)
+        os.environ["GUESS_HOT_DAYS"] = str(args.hot_days)
+        try:
+            from moto import mock_aws
+        except ImportError as exc:
+            raise SystemExit("moto is required for the compaction check.") from exc
+
+        with mock_aws():
+            import boto3
+
+            dynamodb, _s3 = _create_resources(boto3)
+            records = seed_dataset(dynamodb, args.rows, 0, args.catalog_size, seed=args.seed)
+            rng = random.Random(args.seed)
+            end = datetime.now(timezone.utc)
+            guestimate_table = dynamodb.Table(TABLE_SPECS["GUESTIMATE_TABLE"][0])
+            with guestimate_table.batch_writer() as batch:
+                for index in range(args.guesses):
+                    guess = _synthetic_guess(rng, rng.choice(records), index, end)
+                    guessed_at = end - timedelta(
+                        seconds=args.days * 86400 * (index + 1) / (args.guesses + 1)
+                    )
+                    guess["guessedAt"] = guessed_at.isoformat(timespec="microseconds")
+                    guess["createdAt"] = guess["guessedAt"]
+                    batch.put_item(Item=guess)
+
+            guestimate = _load_handler("guestimate")
+            event = api_event("GET", "/guestimate/analysis")
+
+            def timed_analysis(phase):
+                latencies = []
+                response = None
+                for _ in range(args.requests):
+                    started = time.perf_counter()
+                    response = guestimate.lambda_handler(event, None)
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                latencies.sort()
+                summary = _analysis_summary(response)
+                print(
+                    f"{phase:<16s} guesses={summary['guessCount']:<7d} "
+                    f"p50={_percentile(latencies, 0.50):8.2f}ms "
+                    f"p95={_percentile(latencies, 0.95):8.2f}ms"
+                )
+                return {"phase": phase, "p50Ms": _percentile(latencies, 0.50)}, summary
+
+            phases = []
+            outcome, baseline = timed_analysis("before")
+            phases.append(outcome)
+
+            compaction = guestimate.lambda_handler({"action": "compact_guesses"}, None)
+            print(f"compaction       {compaction}")
+            outcome, compacted = timed_analysis("compacted")
+            phases.append(outcome)
+
+            # moto does not run TTL, so delete the expired copies here.
+            expired = [
+                {"sampleId": item["sampleId"], "guessedAt": item["guessedAt"]}
+                for item in guestimate._scan_all(guestimate_table)
+                if "expiresAt" in item
+            ]
+            with guestimate_table.batch_writer() as batch:
+                for key in expired:
+                    batch.delete_item(Key=key)
+            outcome, expired_summary = timed_analysis("after-ttl")
+            phases.append(outcome)
+
+    mismatched = [
+        phase
+        for phase, summary in (("compacted", compacted), ("after-ttl", expired_summary))
+        if not _analysis_matches(baseline, summary)
+    ]
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "compaction": compaction,
+        "phases": phases,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if mismatched:
+        print(f"Analysis changed after: {', '.join(mismatched)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+QUANTILE_DISTRIBUTIONS = {
+    "lognormal": lambda rng: rng.lognormvariate(3.0, 1.0),
+    "exponential": lambda rng: rng.expovariate(1 / 15),
+    "uniform": lambda rng: rng.uniform(0, 200),
+    "pareto": lambda rng: 5 * rng.paretovariate(1.5),
+    "half-exact": lambda rng: 0.0 if rng.random() < 0.5 else rng.uniform(0, 40),
+}
+
+
+def command_quantiles(args):
+    """Check guestimate's mergeable error sketches against exact quantiles.
+    Each distribution is sketched in partitions that are then merged, as
+    rollup rows and the cold tier are."""
+    args.endpoint_url = None
+    _configure_environment(args, "")
+    guestimate = _load_handler("guestimate")
+    rng = random.Random(args.seed)
+    field = guestimate.MACRO_FIELDS[0]
+    accuracy = guestimate.QUANTILE_RELATIVE_ACCURACY
+    min_value = guestimate.QUANTILE_MIN_VALUE
+
+    results = []
+    failures = []
+    for name, draw in QUANTILE_DISTRIBUTIONS.items():
+        errors = [draw(rng) for _ in range(args.samples)]
+        records = [
+            {"guess": {field: error}, "groundTruth": {field: 0}} for error in errors
+        ]
+        single = guestimate._new_error_sketches()
+        partitions = [guestimate._new_error_sketches() for _ in range(args.partitions)]
+        for index, record in enumerate(records):
+            guestimate._accumulate_error_sketches(single, record)
+            guestimate._accumulate_error_sketches(partitions[index % args.partitions], record)
+        merged = guestimate._new_error_sketches()
+        for partition in partitions:
+            # JSON round trip, as archived aggregates are stored.
+            guestimate._merge_error_sketches(merged, json.loads(json.dumps(partition)))
+        if merged != single:
+            failures.append(f"{name}: merged sketch differs from a single pass")
+
+        errors.sort()
+        estimates = guestimate._error_quantiles(merged[field])
+        for label, fraction in guestimate.ERROR_QUANTILES.items():
+            exact = errors[int(fraction * (len(errors) - 1))]
+            estimate = estimates[label]
+            relative = abs(estimate - exact) / exact if exact else 0.0
+            allowed = accuracy * exact + (min_value if exact < min_value else 0)
+            ok = abs(estimate - exact) <= allowed * (1 + 1e-9)
+            if not ok:
+                failures.append(f"{name} {label}: {estimate:.4f} vs exact {exact:.4f}")
+            results.append(
+                {
+                    "distribution": name,
+                    "quantile": label,
+                    "exact": exact,
+                    "estimate": estimate,
+                    "relativeError": relative,
+                    "buckets": len(merged[field]),
+                }
+            )
+            print(
+                f"{name:<12s} {label} exact={exact:10.4f} estimate={estimate:10.4f} "
+                f"rel={relative:.4%} buckets={len(merged[field]):4d} {'ok' if ok else 'FAIL'}"
+            )
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "relativeAccuracy": accuracy,
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        return 1
+    return 0
+
+
+def _typo(rng, word):
+    """One deletion, transposition or substitution inside `word`."""
+    position = rng.randrange(1, len(word) - 1)
+    edit = rng.choice(("delete", "swap", "substitute"))
+    if edit == "delete":
+        return word[:position] + word[position + 1:]
+    if edit == "swap":
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    return word[:position] + rng.choice("aeiourstln") + word[position + 1:]
+
+
+SEARCH_QUERY_MODES = {
+    "exact": lambda rng, name: name,
+    # As typed: leading words plus part of the next one.
+    "prefix": lambda rng, name: " ".join(
+        name.split()[:-1] + [name.split()[-1][:3]]
+    ),
+    "typo": lambda rng, name: " ".join(
+        _typo(rng, word) if len(word) >= 5 else word for word in name.split()
+    ),
+}
+
+
+def command_search(args):
+    """Time the menu search index build and warm queries, and check that
+    exact, as-typed and misspelled names find their item."""
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    with HuskyEatsStub(catalog) as stub:
+        args.endpoint_url = None
+        _configure_environment(args, stub.base_url)
+        try:
+            from moto import mock_aws
+        except ImportError as exc:
+            raise SystemExit("moto is required for the search check.") from exc
+
+        with mock_aws():
+            import boto3
+
+            _create_resources(boto3)
+            _load_handler("sync_catalog").lambda_handler({}, None)
+            search = _load_handler("search_menu_items")
+
+            build_ms = []
+            for _ in range(args.builds):
+                search.catalog_index["version"] = None
+                search._load_catalog_index(force=True)
+                build_ms.append(search.catalog_index["buildMs"])
+            build_ms.sort()
+            index = search.catalog_index["index"]
+            gc.collect()
+            tracemalloc.start()
+            rebuilt = search._build_index(
+                (item_id, index["names"][position], index["servingSizes"][position], "")
+                for position, item_id in enumerate(index["ids"])
+            )
+            index_bytes, _peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del rebuilt
+            print(
+                f"index    items={len(index['ids'])} trigrams={len(index['grams'])} "
+                f"build p50={_percentile(build_ms, 0.5):.1f} ms "
+                f"max={build_ms[-1]:.1f} ms  {index_bytes / len(index['ids']):.0f} B/item"
+            )
+
+            rng = random.Random(args.seed)
+            items = list(catalog.values())
+            phases = []
+            for mode, make_query in SEARCH_QUERY_MODES.items():
+                latencies = []
+                found = 0
+                for _ in range(args.queries):
+                    target = rng.choice(items)
+                    event = api_event(
+                        "GET",
+                        "/menu/search",
+                        query={"q": make_query(rng, target["name"]), "limit": str(args.limit)},
+                    )
+                    started = time.perf_counter()
+                    response = search.lambda_handler(event, None)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    names = {item["name"] for item in json.loads(response["body"])["items"]}
+                    # Several items can share a name; any of them is a hit.
+                    found += target["name"] in names
+                latencies.sort()
+                phase = {
+                    "mode": mode,
+                    "queries": args.queries,
+                    "recallAtLimit": found / args.queries,
+                    "p50Ms": _percentile(latencies, 0.5),
+                    "p95Ms": _percentile(latencies, 0.95),
+                    "p99Ms": _percentile(latencies, 0.99),
+                }
+                phases.append(phase)
+                print(
+                    f"{mode:<8s} recall@{args.limit}={phase['recallAtLimit']:.3f} "
+                    f"p50={phase['p50Ms']:.2f} ms p95={phase['p95Ms']:.2f} ms "
+                    f"p99={phase['p99Ms']:.2f} ms"
+                )
+
+    report = {
+        "commit": _git_commit(),
+        "parameters": vars(args) | {"func": None},
+        "index": {
+            "items": len(index["ids"]),
+            "trigrams": len(index["grams"]),
+            "buildMs": build_ms,
+            "bytesPerItem": index_bytes / len(index["ids"]),
+        },
+        "phases": phases,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    missed = [phase["mode"] for phase in phases if phase["recallAtLimit"] < args.min_recall]
+    if missed:
+        print(f"Recall under {args.min_recall}: {', '.join(missed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def _read_capture(paths):
+    """Captured request records from JSON Lines files (optionally gzipped) or
+    directories of them, in arrival order."""
+    records = []
+    for raw_path in paths:
+        path = Path(raw_path)
+        files = sorted(path.rglob("*.jsonl*")) if path.is_dir() else [path]
+        for capture_file in files:
+            data = capture_file.read_bytes()
+            if capture_file.suffix == ".gz":
+                data = gzip.decompress(data)
+            records.extend(
+                json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()
+            )
+    records.sort(key=lambda record: record["at"])
+    return records
+
+
+def _replay_value(ctx, field, value):
+    """Map a captured value onto the seeded stand-ins; hashed identifiers
+    ("~<hex>") always map to the same seeded entity."""
+    if field == "menuItemId" and str(value).isdigit():
+        return str(int(value) % ctx.catalog_size + 1)
+    if not (isinstance(value, str) and value.startswith("~")):
+        return value
+    if field in ("objectKey", "sampleId"):
+        return ctx.object_keys[int(value[1:], 16) % len(ctx.object_keys)]
+    if field in ("runId", "runIds"):
+        return BENCH_RUN_ID
+    if field == "bucket":
+        return BUCKET_NAME
+    if field == "perceptualHash":
+        return value[1:17]
+    return value
+
+
+def _replay_shape(ctx, value, field=None):
+    if isinstance(value, dict):
+        return {name: _replay_shape(ctx, item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_replay_shape(ctx, item, field) for item in value]
+    return _replay_value(ctx, field, value)
+
+
+def _replay_event(ctx, record, uploaded):
+    """Rebuild an API event from a captured record (untimed setup)."""
+    path_params = _replay_shape(ctx, record.get("pathParameters") or {})
+    path = record["path"]
+    for name, value in path_params.items():
+        path = path.replace(f"{{{name}}}", value)
+    body = record.get("body")
+    raw_body = None
+    if isinstance(body, dict) and "~bytes" in body:
+        raw_body, body = "x" * body["~bytes"], None
+    elif body is not None:
+        captured_key = body.get("objectKey") if isinstance(body, dict) else None
+        body = _replay_shape(ctx, body)
+        if record["function"] == "upload_metadata" and captured_key:
+            # New uploads need their own image in S3, as in the upload scenario.
+            body["objectKey"] = f"v1/replay-{captured_key.lstrip('~')}.jpg"
+            if body["objectKey"] not in uploaded:
+                uploaded.add(body["objectKey"])
+                ctx.s3.put_object(
+                    Bucket=BUCKET_NAME, Key=body["objectKey"], Body=body["objectKey"].encode("utf-8")
+                )
+    event = api_event(
+        record["method"],
+        path,
+        query=_replay_shape(ctx, record.get("query")) or None,
+        body=body,
+        path_params=path_params or None,
+        headers=_replay_shape(ctx, record.get("headers") or {}),
+    )
+    if raw_body is not None:
+        event["body"] = raw_body
+    return event
+
+
+def command_replay(args):
+    """Re-drive captured traffic against seeded stand-ins on its original
+    schedule (scaled by --rate) and report latency per route."""
+    records = _read_capture(args.capture)
+    if args.limit:
+        records = records[: args.limit]
+    if not records:
+        raise SystemExit("No captured requests found.")
+    # Replayed requests must not be captured again.
+    os.environ.pop("TRAFFIC_CAPTURE", None)
+
+    # Arrival offsets, with idle gaps capped and the rest scaled.
+    offsets = []
+    offset = 0.0
+    previous_at = records[0]["at"]
+    for record in records:
+        offset += min(record["at"] - previous_at, args.max_gap_seconds) / args.rate
+        previous_at = record["at"]
+        offsets.append(offset)
+
+    catalog = build_catalog(args.catalog_size, seed=args.seed)
+    stub = HuskyEatsStub(catalog, latency_ms=args.husky_latency_ms)
+    with stub:
+        _configure_environment(args, stub.base_url)
+        if args.endpoint_url:
+            aws_mock = nullcontext()
+        else:
+            try:
+                aws_mock = _mock_aws()
+            except ImportError as exc:
+                raise SystemExit(
+                    "moto is required unless --endpoint-url points at local services."
+                ) from exc
+
+        with aws_mock:
+            import boto3
+
+            dynamodb, s3 = _create_resources(boto3)
+            seeded = seed_dataset(
+                dynamodb, args.rows, args.guesses, args.catalog_size, seed=args.seed
+            )
+            if not seeded:
+                raise SystemExit("--rows must be at least 1.")
+            ctx = ScenarioContext(seeded, args.catalog_size, s3=s3)
+            handlers = {}
+            for module_name, setup_events in SETUP_EVENTS.items():
+                handlers[module_name] = _load_handler(module_name).lambda_handler
+                for setup_event in setup_events:
+                    handlers[module_name](setup_event, None)
+            for record in records:
+                if record["function"] not in handlers:
+                    handlers[record["function"]] = _load_handler(record["function"]).lambda_handler
+
+            uploaded = set()
+            events = [_replay_event(ctx, record, uploaded) for record in records]
+            routes = [f"{record['method']} {record['path']}" for record in records]
+            latencies = {}
+            status_counts = {}
+            start_lags = []
+            results_lock = threading.Lock()
+
+            def invoke(index, replay_started):
+                started = time.perf_counter()
+                try:
+                    response = handlers[records[index]["function"]](events[index], None)
+                    status = str((response or {}).get("statusCode"))
+                except Exception as error:  # noqa: BLE001 - surface handler crashes in the report
+                    status = f"exception:{type(error).__name__}"
+                elapsed_ms = (time.perf_counter() - started) * 1000.0
+                with results_lock:
+                    latencies.setdefault(routes[index], []).append(elapsed_ms)
+                    counts = status_counts.setdefault(routes[index], {})
+                    counts[status] = counts.get(status, 0) + 1
+                    start_lags.append((started - replay_started - offsets[index]) * 1000.0)
+
+            # Open loop: requests start on schedule whether or not earlier
+            # ones have finished; a full pool shows up as start lag.
+            with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                replay_started = time.perf_counter()
+                for index, due in enumerate(offsets):
+                    delay = replay_started + due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    pool.submit(invoke, index, replay_started)
+            wall_seconds = time.perf_counter() - replay_started
+
+    captured = {}
+    for record, route in zip(records, routes):
+        if record.get("durationMs") is not None:
+            captured.setdefault(route, []).append(record["durationMs"])
+    results = []
+    for route in sorted(latencies):
+        result = {
+            "scenario": f"replay {route}",
+            "concurrency": args.concurrency,
+            "requests": len(latencies[route]),
+            "latencyMs": _latency_summary(latencies[route]),
+            "capturedLatencyMs": _latency_summary(captured.get(route, [])),
+            "statusCounts": status_counts[route],
+        }
+        results.append(result)
+        latency = result["latencyMs"]
+        print(
+            f"{route:40s} n={result['requests']:<6d} "
+            f"p50={latency['p50']:8.2f}ms p95={latency['p95']:8.2f}ms "
+            f"p99={latency['p99']:8.2f}ms  {result['statusCounts']}"
+        )
+    lag = _latency_summary(start_lags)
+    print(
+        f"{len(records)} requests over {wall_seconds:.1f}s (captured span "
+        f"{records[-1]['at'] - records[0]['at']:.1f}s, rate x{args.rate:g}); "
+        f"start lag p50={lag['p50']:.2f}ms p99={lag['p99']:.2f}ms"
+    )
+
+    report = {
+        "commit": _git_commit(),
+        "startedAt": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args) | {"func": None},
+        "wallSeconds": wall_seconds,
+        "startLagMs": lag,
+        "results": results,
+    }
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR
+        / f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{report['commit']}-replay.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+
+def _put_part(part, data):
+    request = Request(
+        part["uploadUrl"],
+        data=data,
+        method="PUT",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    with urlopen(request, timeout=60) as response:
+        return {"partNumber": part["partNumber"], "etag": response.headers["ETag"]}
+
+
+def command_multipart(args):
+    """Upload through the multipart endpoints against a local S3 server,
+    dropping one part on the first pass and resuming it."""
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as exc:
+        raise SystemExit("moto[server] is required for the multipart check.") from exc
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=args.port)
+    server.start()
+    try:
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+        os.environ["AWS_ENDPOINT_URL"] = f"http://127.0.0.1:{args.port}"
+        os.environ["UPLOAD_BUCKET"] = BUCKET_NAME
+        os.environ["AUTH_TOKEN"] = AUTH_TOKEN
+
+        import boto3
+
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=BUCKET_NAME)
+        handler = _load_handler("presign_upload").lambda_handler
+
+        def call(path, body):
+            response = handler(api_event("POST", path, body=body), None)
+            return response["statusCode"], json.loads(response["body"])
+
+        payload = os.urandom(int(args.size_mb * 1024 * 1024))
+        part_size = int(args.part_mb * 1024 * 1024)
+        chunks = [payload[start:start + part_size] for start in range(0, len(payload), part_size)]
+
+        status, started = call(
+            "/uploads/presign",
+            {"filename": "large.bin", "multipart": True, "partCount": len(chunks)},
+        )
+        assert status == 200, started
+        upload = {"objectKey": started["objectKey"], "uploadId": started["uploadId"]}
+
+        # First pass: upload every part but one in parallel, as if the last
+        # request was lost when the phone dropped off Wi-Fi.
+        dropped = len(chunks)
+        timer = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.parallel) as pool:
+            list(
+                pool.map(
+                    lambda part: _put_part(part, chunks[part["partNumber"] - 1]),
+                    [part for part in started["parts"] if part["partNumber"] != dropped],
+                )
+            )
+
+        status, resumed = call(
+            "/uploads/multipart/parts", {**upload, "partNumbers": [dropped]}
+        )
+        assert status == 200, resumed
+        uploaded = {part["partNumber"]: part["etag"] for part in resumed["uploadedParts"]}
+        missing = [number for number in range(1, len(chunks) + 1) if number not in uploaded]
+        assert missing == [dropped], missing
+        for part in resumed["parts"]:
+            uploaded[part["partNumber"]] = _put_part(part, chunks[part["partNumber"] - 1])["etag"]
+
+        status, completed = call(
+            "/uploads/multipart/complete",
+            {
+                **upload,
+                "parts": [
+                    {"partNumber": number, "etag": etag} for number, etag in uploaded.items()
+                ],
+            },
+        )
+        elapsed = time.perf_counter() - timer
+        assert status == 200, completed
+
+        stored = s3.get_object(Bucket=BUCKET_NAME, Key=upload["objectKey"])["Body"].read()
+        assert hashlib.sha256(stored).digest() == hashlib.sha256(payload).digest()
+
+        status, aborted_start = call(
+            "/uploads/presign", {"filename": "abandoned.bin", "multipart": True, "partCount": 2}
+        )
+        status, aborted = call(
+            "/uploads/multipart/abort",
+            {"objectKey": aborted_start["objectKey"], "uploadId": aborted_start["uploadId"]},
+        )
+        assert status == 200, aborted
+
+        print(
+            json.dumps(
+                {
+                    "sizeMb": args.size_mb,
+                    "parts": len(chunks),
+                    "resumedParts": missing,
+                    "uploadSeconds": elapsed,
+                    "verified": True,
+                },
+                indent=2,
+            )
+        )
+    finally:
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Seed stand-ins and run scenarios.")
+    run_parser.add_argument("--rows", type=int, default=1000, help="Metadata rows to seed.")
+    run_parser.add_argument("--guesses", type=int, default=1000, help="Guesses to seed.")
+    run_parser.add_argument("--catalog-size", type=int, default=500)
+    run_parser.add_argument("--requests", type=int, default=200, help="Requests per scenario.")
+    run_parser.add_argument("--concurrency", default="1,8", help="Comma-separated levels.")
+    run_parser.add_argument("--scenarios", help="Comma-separated subset of scenarios.")
+    run_parser.add_argument("--husky-latency-ms", type=float, default=25.0)
+    run_parser.add_argument("--husky-jitter-ms", type=float, default=0.0)
+    run_parser.add_argument("--husky-failure-rate", type=float, default=0.0)
+    run_parser.add_argument(
+        "--endpoint-url",
+        help="Use running local services (e.g. DynamoDB Local) instead of moto.",
+    )
+    run_parser.add_argument("--trace-memory", action="store_true")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", help="Result file (default: results/<time>-<commit>.json).")
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--max-regression", type=float, default=0.2)
+    compare_parser.set_defaults(func=command_compare)
+
+    resilience_parser = subparsers.add_parser(
+        "resilience", help="Exercise the Husky Eats client against a flaky stub."
+    )
+    resilience_parser.add_argument("--catalog-size", type=int, default=200)
+    resilience_parser.add_argument("--latency-ms", type=float, default=10.0)
+    resilience_parser.add_argument("--failure-rate", type=float, default=0.3)
+    resilience_parser.add_argument("--slow-rate", type=float, default=0.05)
+    resilience_parser.add_argument("--slow-ms", type=float, default=2000.0)
+    resilience_parser.add_argument("--hedge-after-ms", type=float, default=0.0)
+    resilience_parser.add_argument("--seed", type=int, default=0)
+    resilience_parser.add_argument("--output")
+    resilience_parser.set_defaults(func=command_resilience)
+
+    hotkey_parser = subparsers.add_parser(
+        "hotkey", help="Compare guess throughput on one hot sample with and without sharding."
+    )
+    hotkey_parser.add_argument("--shards", type=int, default=8)
+    hotkey_parser.add_argument(
+        "--partition-wps",
+        type=float,
+        default=50.0,
+        help="Modeled writes per second per partition (scaled down from DynamoDB's 1000).",
+    )
+    hotkey_parser.add_argument("--concurrency", type=int, default=16)
+    hotkey_parser.add_argument("--requests", type=int, default=400)
+    hotkey_parser.add_argument("--rows", type=int, default=50)
+    hotkey_parser.add_argument("--catalog-size", type=int, default=200)
+    hotkey_parser.add_argument(
+        "--rollups",
+        action="store_true",
+        help="Also write session rollups (moto transactions are slow and not thread-safe).",
+    )
+    hotkey_parser.add_argument("--seed", type=int, default=0)
+    hotkey_parser.add_argument("--output")
+    hotkey_parser.set_defaults(func=command_hotkey)
+
+    memory_parser = subparsers.add_parser(
+        "memory", help="Check guestimate's cached sample index against a per-record budget."
+    )
+    memory_parser.add_argument("--rows", type=int, default=5000)
+    memory_parser.add_argument("--catalog-size", type=int, default=500)
+    memory_parser.add_argument(
+        "--budget-bytes",
+        type=float,
+        default=320.0,
+        help="Fail if the index holds more than this many bytes per record.",
+    )
+    memory_parser.add_argument("--seed", type=int, default=0)
+    memory_parser.add_argument("--output")
+    memory_parser.set_defaults(func=command_memory)
+
+    compaction_parser = subparsers.add_parser(
+        "compaction", help="Check analysis results and latency across guess compaction."
+    )
+    compaction_parser.add_argument("--rows", type=int, default=200)
+    compaction_parser.add_argument("--guesses", type=int, default=5000)
+    compaction_parser.add_argument("--days", type=int, default=180, help="Age of the oldest guess.")
+    compaction_parser.add_argument("--hot-days", type=int, default=30)
+    compaction_parser.add_argument("--requests", type=int, default=20)
+    compaction_parser.add_argument("--catalog-size", type=int, default=200)
+    compaction_parser.add_argument("--seed", type=int, default=0)
+    compaction_parser.add_argument("--output")
+    compaction_parser.set_defaults(func=command_compaction)
+
+    quantiles_parser = subparsers.add_parser(
+        "quantiles", help="Check merged error sketches against exact quantiles."
+    )
+    quantiles_parser.add_argument("--samples", type=int, default=100000)
+    quantiles_parser.add_argument("--partitions", type=int, default=16)
+    quantiles_parser.add_argument("--seed", type=int, default=0)
+    quantiles_parser.add_argument("--output")
+    quantiles_parser.set_defaults(func=command_quantiles)
+
+    search_parser = subparsers.add_parser(
+        "search", help="Time the menu search index build and check ranked matches."
+    )
+    search_parser.add_argument("--catalog-size", type=int, default=5000)
+    search_parser.add_argument("--builds", type=int, default=5)
+    search_parser.add_argument("--queries", type=int, default=2000, help="Per query mode.")
+    search_parser.add_argument("--limit", type=int, default=10)
+    search_parser.add_argument(
+        "--min-recall",
+        type=float,
+        default=0.95,
+        help="Fail if fewer queries than this find their item in the top --limit.",
+    )
+    search_parser.add_argument("--seed", type=int, default=0)
+    search_parser.add_argument("--output")
+    search_parser.set_defaults(func=command_search)
+
+    replay_parser = subparsers.add_parser(
+        "replay", help="Re-drive captured API traffic and report latency per route."
+    )
+    replay_parser.add_argument(
+        "capture", nargs="+", help="TRAFFIC_CAPTURE files (.jsonl or .jsonl.gz) or directories."
+    )
+    replay_parser.add_argument(
+        "--rate", type=float, default=1.0, help="Speed-up over the captured arrival rate."
+    )
+    replay_parser.add_argument(
+        "--max-gap-seconds",
+        type=float,
+        default=30.0,
+        help="Cap idle gaps between captured requests before scaling.",
+    )
+    replay_parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight.")
+    replay_parser.add_argument("--limit", type=int, help="Replay only the first N requests.")
+    replay_parser.add_argument("--rows", type=int, default=1000)
+    replay_parser.add_argument("--guesses", type=int, default=1000)
+    replay_parser.add_argument("--catalog-size", type=int, default=500)
+    replay_parser.add_argument("--husky-latency-ms", type=float, default=0.0)
+    replay_parser.add_argument("--endpoint-url")
+    replay_parser.add_argument("--seed", type=int, default=0)
+    replay_parser.add_argument("--output")
+    replay_parser.set_defaults(func=command_replay)
+
+    multipart_parser = subparsers.add_parser(
+        "multipart", help="Verify multipart upload/resume against a local S3 server."
+    )
+    multipart_parser.add_argument("--size-mb", type=float, default=12.0)
+    multipart_parser.add_argument("--part-mb", type=float, default=5.0)
+    multipart_parser.add_argument("--parallel", type=int, default=4)
+    multipart_parser.add_argument("--port", type=int, default=5055)
+    multipart_parser.set_defaults(func=command_multipart)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""Local stand-in for the Husky Eats API used by the benchmark harness."""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DINING_HALL_IDS = ("1", "2", "3", "4", "5", "6", "7", "8")
+MEALTIMES = ("breakfast", "lunch", "dinner")
+
+
+# Dish names are drawn from these, so catalogs repeat names across items the
+# way dining-hall menus do.
+NAME_STYLES = (
+    "Grilled", "Roasted", "Baked", "Fried", "Steamed", "Spicy", "Honey", "Garlic",
+    "Lemon", "BBQ", "Teriyaki", "Cajun", "Herb", "Buffalo", "Sesame", "Smoked",
+)
+NAME_BASES = (
+    "Chicken", "Salmon", "Tofu", "Beef", "Pork", "Turkey", "Shrimp", "Vegetable",
+    "Mushroom", "Cheese", "Black Bean", "Chickpea", "Egg", "Potato", "Quinoa", "Broccoli",
+)
+NAME_DISHES = (
+    "Sandwich", "Wrap", "Salad", "Soup", "Pizza", "Pasta", "Tacos", "Burrito",
+    "Stir Fry", "Rice Bowl", "Curry", "Burger", "Flatbread", "Casserole", "Omelet",
+    "Quesadilla",
+)
+
+
+def build_catalog(size, seed=0):
+    """Build a deterministic synthetic `/menuitem` catalog."""
+    rng = random.Random(seed)
+    # Separate stream, so names do not shift the nutrition values.
+    name_rng = random.Random(f"names-{seed}")
+    catalog = {}
+    for index in range(1, size + 1):
+        item_id = str(index)
+        name = " ".join(
+            name_rng.choice(words) for words in (NAME_STYLES, NAME_BASES, NAME_DISHES)
+        )
+        catalog[item_id] = {
+            "id": index,
+            "name": name,
+            "servingsize": "1 each",
+            "calories": rng.randint(20, 900),
+            "protein_g": round(rng.uniform(0, 60), 1),
+            "totalcarbohydrate_g": round(rng.uniform(0, 120), 1),
+            "totalfat_g": round(rng.uniform(0, 50), 1),
+        }
+    return catalog
+
+
+class HuskyEatsStub:
+    """Serve a synthetic catalog over HTTP with configurable latency and faults."""
+
+    def __init__(
+        self,
+        catalog,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        failure_rate=0.0,
+        slow_rate=0.0,
+        slow_ms=0.0,
+    ):
+        self.catalog = catalog
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        # Set to True to simulate a full outage (every request returns 503).
+        self.down = False
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def _delay(self):
+        with self._lock:
+            self.request_count += 1
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.down or self._rng.random() < self.failure_rate
+            slow = self._rng.random() < self.slow_rate
+        delay_ms = self.latency_ms + jitter + (self.slow_ms if slow else 0.0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+        return fail
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes; avoid Nagle/delayed-ACK stalls.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *_args):
+                return
+
+            def _send(self, status_code, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if stub._delay():
+                    self._send(503, {"message": "Injected failure."})
+                    return
+
+                parsed = urlparse(self.path)
+                path = parsed.path.rstrip("/")
+                if path == "/api/menuitem":
+                    self._send(200, list(stub.catalog.values()))
+                    return
+                if path.startswith("/api/menuitem/"):
+                    item = stub.catalog.get(path.rsplit("/", 1)[1])
+                    if item is None:
+                        self._send(404, {"message": "Not found."})
+                    else:
+                        self._send(200, item)
+                    return
+                if path == "/api/menu":
+                    query = parse_qs(parsed.query)
+                    seed = "|".join(
+                        (query.get(name) or [""])[0] for name in ("hallid", "meal", "date")
+                    )
+                    ids = sorted(stub.catalog)
+                    picked = random.Random(seed).sample(ids, min(40, len(ids)))
+                    self._send(200, [stub.catalog[item_id] for item_id in picked])
+                    return
+                self._send(404, {"message": "Not found."})
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_exc):
+        self.stop()
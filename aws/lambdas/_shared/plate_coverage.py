@@ -0,0 +1,60 @@
+"""Per-menu-item coverage counters contributed by one labeled plate.
+
+Packaged next to `upload_metadata`, which adds them to the coverage table on
+every upload, and `get_coverage`, which recomputes the table from the
+metadata on `{"action": "rebuild"}`. Sharing one implementation keeps the
+two from counting a plate differently.
+"""
+
+from decimal import Decimal
+
+COUNTER_FIELDS = (
+    "total",
+    "multiCount",
+    "solo0to1",
+    "solo1to2",
+    "solo2plus",
+    "servingsSum",
+)
+# Per-context counters are stored as "ctx#<diningHallId>#<mealtime>".
+CONTEXT_PREFIX = "ctx#"
+
+
+def coverage_increments(record):
+    """Map each menuItemId on a plate to the counters it contributes."""
+    items = [item for item in record.get("items") or [] if isinstance(item, dict)]
+    plate_has_multiple = len(items) > 1
+    context_attr = (
+        f"{CONTEXT_PREFIX}{record.get('diningHallId') or ''}#{record.get('mealtime') or ''}"
+    )
+    increments = {}
+
+    for item in items:
+        menu_item_id = str(item.get("menuItemId") or "").strip()
+        if not menu_item_id:
+            continue
+
+        try:
+            servings = Decimal(str(item.get("servings")))
+        except ArithmeticError:
+            servings = None
+        if servings is not None and not servings.is_finite():
+            servings = None
+
+        counters = increments.setdefault(menu_item_id, {})
+        counters["total"] = counters.get("total", 0) + 1
+        counters[context_attr] = counters.get(context_attr, 0) + 1
+        if servings is not None:
+            counters["servingsSum"] = counters.get("servingsSum", Decimal(0)) + servings
+
+        if plate_has_multiple:
+            bucket = "multiCount"
+        elif servings is None or servings <= 1:
+            bucket = "solo0to1"
+        elif servings <= 2:
+            bucket = "solo1to2"
+        else:
+            bucket = "solo2plus"
+        counters[bucket] = counters.get(bucket, 0) + 1
+
+    return increments
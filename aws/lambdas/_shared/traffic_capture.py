@@ -0,0 +1,167 @@
+"""Opt-in capture of API request shapes and timings for `bench.py replay`.
+
+Packaged next to each API handler (see the `archive_file` blocks in
+`infra/main.tf`), so handlers import it as a top-level module. Each handler
+routes its invocations through `invoke` under its own function name.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# TRAFFIC_CAPTURE is "" (off), a local JSON Lines path, or s3://bucket/prefix.
+TRAFFIC_CAPTURE = os.environ.get("TRAFFIC_CAPTURE", "")
+TRAFFIC_CAPTURE_FLUSH_RECORDS = int(os.environ.get("TRAFFIC_CAPTURE_FLUSH_RECORDS", "500"))
+TRAFFIC_CAPTURE_FLUSH_SECONDS = float(os.environ.get("TRAFFIC_CAPTURE_FLUSH_SECONDS", "60"))
+# Identifiers and free text are replaced by a stable hash; auth headers and
+# the token parameter are never recorded.
+CAPTURE_HASHED_FIELDS = frozenset(
+    (
+        "objectKey", "sampleId", "clientSessionId", "sessionId", "runId", "runIds",
+        "uploadId", "uploadedBy", "filename", "name", "bucket", "ETag",
+        "perceptualHash", "idempotency-key",
+    )
+)
+CAPTURE_HEADERS = ("accept-encoding", "content-type", "idempotency-key", "if-none-match")
+# S3 captures are buffered per function and written as one object per flush.
+# function name -> {"lines", "flushedAt", "part"}
+capture_buffers = {}
+# Invocations per function name, so the first one in a container is marked cold.
+capture_invocations = {}
+capture_state = {"containerId": None, "s3Client": None}
+capture_lock = threading.Lock()
+
+
+def invoke(function_name, handle, event, context):
+    """Run `handle(event, context)`, capturing the request when TRAFFIC_CAPTURE is set."""
+    if not TRAFFIC_CAPTURE:
+        return handle(event, context)
+    with capture_lock:
+        capture_invocations[function_name] = capture_invocations.get(function_name, 0) + 1
+        cold_start = capture_invocations[function_name] == 1
+    arrived_at = time.time()
+    started = time.perf_counter()
+    response = handle(event, context)
+    _capture_request(function_name, event, response, arrived_at, started, cold_start)
+    return response
+
+
+def _capture_hash(value):
+    return "~" + hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:16]
+
+
+def _capture_sanitize(value, key=None):
+    if key in CAPTURE_HASHED_FIELDS and value not in (None, ""):
+        return _capture_hash(value)
+    if isinstance(value, dict):
+        return {name: _capture_sanitize(item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_capture_sanitize(item, key) for item in value]
+    return value
+
+
+def _capture_request(function_name, event, response, arrived_at, started, cold_start):
+    """Record one API request's sanitized shape, status and duration."""
+    event = event or {}
+    method = (
+        event.get("httpMethod")
+        or ((event.get("requestContext") or {}).get("http") or {}).get("method")
+        or ""
+    ).upper()
+    if not method:
+        return
+
+    path_params = event.get("pathParameters") or {}
+    path = str(event.get("rawPath") or event.get("path") or "")
+    for name, value in path_params.items():
+        for form in (str(value), quote(str(value))):
+            path = path.replace(form, f"{{{name}}}")
+    headers = {str(key).lower(): value for key, value in (event.get("headers") or {}).items()}
+    query = {
+        key: value
+        for key, value in (event.get("queryStringParameters") or {}).items()
+        if key != "token"
+    }
+    raw_body = event.get("body")
+    body = None
+    if raw_body:
+        try:
+            body = _capture_sanitize(json.loads(raw_body))
+        except ValueError:
+            body = {"~bytes": len(raw_body)}
+    response_body = (response or {}).get("body") or ""
+    record = {
+        "at": round(arrived_at, 3),
+        "function": function_name,
+        "method": method,
+        "path": path,
+        "pathParameters": _capture_sanitize(path_params) or None,
+        "query": _capture_sanitize(query) or None,
+        "headers": {
+            name: _capture_sanitize(headers[name], name)
+            for name in CAPTURE_HEADERS
+            if headers.get(name)
+        },
+        "body": body,
+        "status": (response or {}).get("statusCode"),
+        "responseBytes": len(response_body),
+        "durationMs": round((time.perf_counter() - started) * 1000, 2),
+        "coldStart": cold_start,
+    }
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+
+    if not TRAFFIC_CAPTURE.startswith("s3://"):
+        try:
+            with capture_lock, open(TRAFFIC_CAPTURE, "a", encoding="utf-8") as handle:
+                handle.write(line)
+        except OSError as error:
+            logger.warning("Could not write captured request: %s", error)
+        return
+
+    now = time.monotonic()
+    with capture_lock:
+        buffer = capture_buffers.setdefault(
+            function_name, {"lines": [], "flushedAt": now, "part": 0}
+        )
+        buffer["lines"].append(line)
+        if (
+            len(buffer["lines"]) < TRAFFIC_CAPTURE_FLUSH_RECORDS
+            and now - buffer["flushedAt"] < TRAFFIC_CAPTURE_FLUSH_SECONDS
+        ):
+            return
+        lines = buffer["lines"]
+        buffer["lines"] = []
+        buffer["flushedAt"] = now
+        buffer["part"] += 1
+        part = buffer["part"]
+        if capture_state["s3Client"] is None:
+            capture_state["s3Client"] = boto3.client("s3")
+        if capture_state["containerId"] is None:
+            # Chosen at the first flush so forked server workers differ.
+            capture_state["containerId"] = os.urandom(6).hex()
+
+    bucket, _separator, prefix = TRAFFIC_CAPTURE[len("s3://"):].partition("/")
+    prefix = f"{prefix.strip('/')}/" if prefix.strip("/") else ""
+    key = (
+        f"{prefix}{function_name}/{time.strftime('%Y-%m-%d', time.gmtime())}/"
+        f"{capture_state['containerId']}-{part:05d}.jsonl.gz"
+    )
+    try:
+        capture_state["s3Client"].put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=gzip.compress("".join(lines).encode("utf-8")),
+            ContentType="application/x-ndjson",
+        )
+    except ClientError as error:
+        logger.warning("Could not write %s captured requests: %s", len(lines), error)
@@ -0,0 +1,447 @@
+"""Return per-menu-item labeling coverage aggregated from dataset metadata."""
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import boto3
+from botocore.exceptions import ClientError
+
+import traffic_capture
+from plate_coverage import CONTEXT_PREFIX, COUNTER_FIELDS, coverage_increments
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+METADATA_TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+COVERAGE_TABLE_NAME = os.environ.get("COVERAGE_TABLE", "mml-coverage")
+COVERAGE_CACHE_SECONDS = int(os.environ.get("COVERAGE_CACHE_SECONDS", "60"))
+AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+# Item names come from the catalog mirror published by sync_catalog, so the
+# coverage page needs no catalog download of its own.
+CATALOG_BUCKET = os.environ.get("CATALOG_BUCKET") or os.environ.get(
+    "UPLOAD_BUCKET", ""
+)
+CATALOG_PREFIX = os.environ.get("CATALOG_PREFIX", "catalog/")
+CATALOG_REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", "900"))
+HUSKYEATS_BASE_URL = os.environ.get(
+    "HUSKYEATS_BASE_URL", "https://husky-eats.onrender.com/api"
+).rstrip("/")
+HUSKYEATS_TIMEOUT_SECONDS = float(os.environ.get("HUSKYEATS_TIMEOUT_SECONDS", "5"))
+# Menus for one hall, meal and date are fetched once per MENU_CACHE_SECONDS.
+MENU_CACHE_SECONDS = float(os.environ.get("MENU_CACHE_SECONDS", "900"))
+MENU_CACHE_MAX_ENTRIES = int(os.environ.get("MENU_CACHE_MAX_ENTRIES", "256"))
+MENU_FETCH_CONCURRENCY = int(os.environ.get("MENU_FETCH_CONCURRENCY", "8"))
+# Halls and meals covered when a menu context leaves them out. The halls
+# come from Terraform's dining_hall_ids; unset, a menu context needs hallId.
+DINING_HALL_IDS = tuple(
+    hall_id.strip()
+    for hall_id in os.environ.get("DINING_HALL_IDS", "").split(",")
+    if hall_id.strip()
+)
+MENU_MEALS = tuple(
+    meal.strip()
+    for meal in os.environ.get("MENU_MEALS", "breakfast,lunch,dinner").split(",")
+    if meal.strip()
+)
+
+dynamodb = boto3.resource("dynamodb")
+metadata_table = (
+    dynamodb.Table(METADATA_TABLE_NAME) if METADATA_TABLE_NAME else None
+)
+coverage_table = (
+    dynamodb.Table(COVERAGE_TABLE_NAME) if COVERAGE_TABLE_NAME else None
+)
+s3_client = boto3.client("s3")
+coverage_cache = {"expiresAt": 0.0, "payload": None, "catalogVersion": None}
+catalog_names = {"version": None, "names": None, "checkedAt": None}
+catalog_names_lock = threading.Lock()
+# (hallId, meal, date) -> {"expiresAt", "itemIds"}
+menu_cache = {}
+menu_cache_lock = threading.Lock()
+menu_executor = None
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "get_coverage"
+
+_DEFAULT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Methods": "OPTIONS,GET",
+}
+
+
+def _response(status_code, payload):
+    return {
+        "statusCode": status_code,
+        "headers": _DEFAULT_HEADERS,
+        "body": json.dumps(payload),
+    }
+
+
+def _http_method(event):
+    return (
+        (event or {}).get("httpMethod")
+        or ((event or {}).get("requestContext") or {})
+        .get("http", {})
+        .get("method")
+        or ""
+    ).upper()
+
+
+def _extract_auth_token(event):
+    raw_headers = (event or {}).get("headers") or {}
+    headers = {str(key).lower(): value for key, value in raw_headers.items()}
+    token = headers.get("x-api-key")
+
+    if not token:
+        auth_header = headers.get("authorization", "")
+        if auth_header.lower().startswith("bearer "):
+            token = auth_header.split(" ", 1)[1].strip()
+
+    if not token and (event or {}).get("queryStringParameters"):
+        token = (event["queryStringParameters"] or {}).get("token")
+
+    return token
+
+
+def _to_number(value):
+    if isinstance(value, Decimal):
+        if value % 1 == 0:
+            return int(value)
+        return float(value)
+    return value
+
+
+def _rebuild_coverage():
+    """Recompute every coverage row from the metadata table in one scan."""
+    aggregates = {}
+    scan_kwargs = {
+        "ProjectionExpression": "#items, diningHallId, mealtime",
+        "ExpressionAttributeNames": {"#items": "items"},
+    }
+    scanned = 0
+
+    while True:
+        result = metadata_table.scan(**scan_kwargs)
+        for record in result.get("Items", []):
+            scanned += 1
+            for menu_item_id, counters in coverage_increments(record).items():
+                row = aggregates.setdefault(menu_item_id, {})
+                for attr, amount in counters.items():
+                    row[attr] = row.get(attr, 0) + amount
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    existing_ids = {row["menuItemId"] for row in _scan_coverage_rows()}
+    with coverage_table.batch_writer() as batch:
+        for menu_item_id, counters in aggregates.items():
+            batch.put_item(
+                Item={
+                    "menuItemId": menu_item_id,
+                    **{
+                        attr: amount if isinstance(amount, Decimal) else Decimal(amount)
+                        for attr, amount in counters.items()
+                    },
+                }
+            )
+        for stale_id in existing_ids - set(aggregates):
+            batch.delete_item(Key={"menuItemId": stale_id})
+
+    coverage_cache["expiresAt"] = 0.0
+    return {"scannedCount": scanned, "menuItemCount": len(aggregates)}
+
+
+def _scan_coverage_rows():
+    rows = []
+    scan_kwargs = {}
+    while True:
+        result = coverage_table.scan(**scan_kwargs)
+        rows.extend(result.get("Items", []))
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return rows
+
+
+def _coverage_entry(row):
+    entry = {"menuItemId": str(row["menuItemId"])}
+    for field in COUNTER_FIELDS:
+        entry[field] = _to_number(row.get(field, 0))
+
+    contexts = []
+    for attr, value in row.items():
+        if not attr.startswith(CONTEXT_PREFIX):
+            continue
+        hall_id, _, mealtime = attr[len(CONTEXT_PREFIX):].partition("#")
+        contexts.append(
+            {"diningHallId": hall_id, "mealtime": mealtime, "count": _to_number(value)}
+        )
+    entry["contexts"] = sorted(
+        contexts, key=lambda context: (context["diningHallId"], context["mealtime"])
+    )
+    return entry
+
+
+def _catalog_key(name):
+    normalized_prefix = CATALOG_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _load_catalog_names():
+    """menuItemId -> name from the latest catalog mirror (None until one is
+    published), re-checking the pointer every CATALOG_REFRESH_SECONDS."""
+    if not CATALOG_BUCKET:
+        return None
+
+    with catalog_names_lock:
+        now = time.monotonic()
+        checked_at = catalog_names["checkedAt"]
+        if checked_at is not None and now - checked_at < CATALOG_REFRESH_SECONDS:
+            return catalog_names["names"]
+        catalog_names["checkedAt"] = now
+
+        try:
+            pointer = json.loads(
+                s3_client.get_object(Bucket=CATALOG_BUCKET, Key=_catalog_key("latest.json"))[
+                    "Body"
+                ].read()
+            )
+            if pointer.get("version") == catalog_names["version"]:
+                return catalog_names["names"]
+
+            body = s3_client.get_object(Bucket=CATALOG_BUCKET, Key=pointer["objectKey"])[
+                "Body"
+            ].read()
+            blob = json.loads(gzip.decompress(body))
+        except (ClientError, KeyError, OSError, ValueError) as error:
+            logger.warning("Catalog mirror unavailable; coverage rows keep no names: %s", error)
+            return catalog_names["names"]
+
+        name_column = blob["fields"].index("name")
+        catalog_names["names"] = {
+            str(item_id): str(row[name_column] or "") for item_id, row in blob["items"].items()
+        }
+        catalog_names["version"] = blob.get("version") or pointer.get("version")
+        return catalog_names["names"]
+
+
+def _load_coverage():
+    """Coverage for every catalog item (zeros for unlabeled ones) plus any
+    labeled IDs the catalog no longer lists, with item names."""
+    now = time.monotonic()
+    names = _load_catalog_names()
+    if (
+        coverage_cache["payload"] is not None
+        and now < coverage_cache["expiresAt"]
+        and coverage_cache["catalogVersion"] == catalog_names["version"]
+    ):
+        return coverage_cache["payload"]
+
+    entries = {
+        entry["menuItemId"]: entry
+        for entry in (_coverage_entry(row) for row in _scan_coverage_rows() if row.get("menuItemId"))
+    }
+    for menu_item_id in names or ():
+        entries.setdefault(
+            menu_item_id,
+            {"menuItemId": menu_item_id, **dict.fromkeys(COUNTER_FIELDS, 0), "contexts": []},
+        )
+    for menu_item_id, entry in entries.items():
+        entry["name"] = (names or {}).get(menu_item_id, "")
+
+    items = sorted(entries.values(), key=lambda entry: entry["menuItemId"])
+    payload = {
+        "items": items,
+        "count": len(items),
+        "catalogCount": len(names) if names is not None else None,
+        "coveredCount": sum(
+            1 for entry in items if entry["total"] and (names is None or entry["menuItemId"] in names)
+        ),
+        "catalogVersion": catalog_names["version"],
+        "generatedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    coverage_cache["payload"] = payload
+    coverage_cache["expiresAt"] = now + COVERAGE_CACHE_SECONDS
+    coverage_cache["catalogVersion"] = catalog_names["version"]
+    return payload
+
+
+def _menu_item_ids(hall_id, meal, date):
+    """IDs on one hall's menu for a meal and date, cached per MENU_CACHE_SECONDS."""
+    cache_key = (hall_id, meal, date)
+    now = time.monotonic()
+    with menu_cache_lock:
+        cached = menu_cache.get(cache_key)
+    if cached is not None and now < cached["expiresAt"]:
+        return cached["itemIds"]
+
+    request = Request(
+        f"{HUSKYEATS_BASE_URL}/menu?" + urlencode({"hallid": hall_id, "meal": meal, "date": date}),
+        headers={"Accept": "application/json", "User-Agent": "MenuMatch-Labeler-Coverage/1.0"},
+    )
+    with urlopen(request, timeout=HUSKYEATS_TIMEOUT_SECONDS) as response:
+        payload = json.loads(response.read().decode("utf-8"))
+    if not isinstance(payload, list):
+        raise ValueError("Unexpected /menu response format.")
+    item_ids = [
+        str(item["id"]) for item in payload if isinstance(item, dict) and item.get("id") is not None
+    ]
+
+    with menu_cache_lock:
+        menu_cache[cache_key] = {"expiresAt": now + MENU_CACHE_SECONDS, "itemIds": item_ids}
+        while len(menu_cache) > MENU_CACHE_MAX_ENTRIES:
+            # Dicts keep insertion order, so the first entry is the oldest.
+            menu_cache.pop(next(iter(menu_cache)))
+    return item_ids
+
+
+def _menu_coverage(payload, date, hall_id, meal):
+    """Coverage restricted to the items served in a menu context, each with
+    the halls and meals it was served at."""
+    global menu_executor
+
+    menus = [
+        (menu_hall, menu_meal)
+        for menu_hall in ((hall_id,) if hall_id else DINING_HALL_IDS)
+        for menu_meal in ((meal,) if meal else MENU_MEALS)
+    ]
+    if menu_executor is None:
+        menu_executor = ThreadPoolExecutor(max_workers=MENU_FETCH_CONCURRENCY)
+    served = {}
+    for (menu_hall, menu_meal), item_ids in zip(
+        menus, menu_executor.map(lambda menu: _menu_item_ids(menu[0], menu[1], date), menus)
+    ):
+        for item_id in item_ids:
+            contexts = served.setdefault(item_id, [])
+            if {"hallId": menu_hall, "meal": menu_meal} not in contexts:
+                contexts.append({"hallId": menu_hall, "meal": menu_meal})
+
+    names = _load_catalog_names() or {}
+    by_id = {entry["menuItemId"]: entry for entry in payload["items"]}
+    items = [
+        {
+            **(
+                by_id.get(item_id)
+                or {
+                    "menuItemId": item_id,
+                    **dict.fromkeys(COUNTER_FIELDS, 0),
+                    "contexts": [],
+                    "name": names.get(item_id, ""),
+                }
+            ),
+            "menuContexts": contexts,
+        }
+        for item_id, contexts in sorted(served.items())
+    ]
+    return {
+        **payload,
+        "items": items,
+        "count": len(items),
+        "coveredCount": sum(1 for entry in items if entry["total"]),
+        "menu": {"date": date, "hallId": hall_id or None, "meal": meal or None},
+    }
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        if coverage_table is not None:
+            primed["coverageItems"] = _load_coverage()["count"]
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if (event or {}).get("action") == "rebuild":
+        # Direct invocation (console/CLI) used to backfill or reconcile the table.
+        summary = _rebuild_coverage()
+        logger.info("Rebuilt coverage table: %s", summary)
+        return summary
+
+    if _http_method(event) == "OPTIONS":
+        return {
+            "statusCode": 204,
+            "headers": _DEFAULT_HEADERS,
+            "body": "",
+        }
+
+    if metadata_table is None or coverage_table is None:
+        logger.error("Missing required DynamoDB table configuration.")
+        return _response(500, {"message": "Server is not configured for coverage."})
+
+    http_method = _http_method(event)
+    if http_method and http_method != "GET":
+        return _response(405, {"message": f"Method {http_method} not allowed."})
+
+    if AUTH_TOKEN:
+        provided_token = _extract_auth_token(event)
+        if provided_token != AUTH_TOKEN:
+            logger.warning("Unauthorized coverage request.")
+            return _response(401, {"message": "Unauthorized"})
+
+    query = (event or {}).get("queryStringParameters") or {}
+    date = str(query.get("date") or "").strip()
+    hall_id = str(query.get("hallId") or "").strip()
+    meal = str(query.get("meal") or "").strip().lower()
+    if (hall_id or meal) and not date:
+        return _response(400, {"message": "hallId and meal require a date."})
+    if date and not hall_id and not DINING_HALL_IDS:
+        return _response(400, {"message": "hallId is required; DINING_HALL_IDS is not configured."})
+    if meal and meal not in MENU_MEALS:
+        return _response(400, {"message": f"meal must be one of: {', '.join(MENU_MEALS)}."})
+
+    try:
+        payload = _load_coverage()
+    except ClientError as error:
+        logger.exception("Failed to read coverage table: %s", error)
+        return _response(500, {"message": "Could not read coverage. Try again later."})
+
+    if date:
+        try:
+            payload = _menu_coverage(payload, date, hall_id, meal)
+        except (OSError, ValueError) as error:
+            logger.warning("Could not load Husky Eats menus for %s: %s", date, error)
+            return _response(502, {"message": "Could not load the Husky Eats menu."})
+
+    return _response(200, payload)
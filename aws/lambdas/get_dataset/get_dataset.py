@@ -1,27 +1,79 @@
 """Return dataset metadata stored in DynamoDB for MenuMatch labeling."""
+import base64
+import gzip
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict
 from decimal import Decimal
 
 import boto3
+from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+import traffic_capture
+
+try:
+    import brotli
+except ImportError:  # Not bundled with the Lambda runtime; gzip is used instead.
+    brotli = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+ITEM_INDEX_TABLE_NAME = os.environ.get("ITEM_INDEX_TABLE", "")
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+# Responses smaller than this are sent uncompressed.
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+
+DATASET_BUCKET = os.environ.get("DATASET_BUCKET", "")
+DATASET_PREFIX = os.environ.get("DATASET_PREFIX", "dataset/")
+# How long a container trusts its copy of the latest-version pointer.
+MANIFEST_REFRESH_SECONDS = float(os.environ.get("MANIFEST_REFRESH_SECONDS", "30"))
+URL_EXPIRATION_SECONDS = int(os.environ.get("URL_EXPIRATION_SECONDS", "900"))
+
+# BatchGetItem accepts at most 100 keys per request.
+BATCH_GET_LIMIT = 100
+# Compressed manifests kept per container; each version is immutable.
+MAX_CACHED_MANIFESTS = 4
 
 dynamodb = boto3.resource("dynamodb")
+s3_client = boto3.client("s3")
 metadata_table = dynamodb.Table(TABLE_NAME) if TABLE_NAME else None
+item_index_table = (
+    dynamodb.Table(ITEM_INDEX_TABLE_NAME) if ITEM_INDEX_TABLE_NAME else None
+)
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "get_dataset"
 
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization,If-None-Match",
     "Access-Control-Allow-Methods": "OPTIONS,GET",
+    "Access-Control-Expose-Headers": "ETag",
+}
+# Clients may cache but must revalidate with If-None-Match.
+_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+# A pinned manifest version never changes.
+_IMMUTABLE_CACHE_HEADERS = {
+    "Cache-Control": "private, max-age=31536000, immutable",
+    "Vary": "Accept-Encoding",
 }
 
+manifest_pointer = {"pointer": None, "checkedAt": None}
+manifest_bodies = OrderedDict()
+manifest_lock = threading.Lock()
+
 
 def _response(status_code, payload):
     return {
@@ -31,6 +83,96 @@ def _response(status_code, payload):
     }
 
 
+def _request_headers(event):
+    raw_headers = (event or {}).get("headers") or {}
+    return {str(key).lower(): str(value) for key, value in raw_headers.items()}
+
+
+def _accepts_encoding(event, encoding):
+    """True if Accept-Encoding allows `encoding`, honoring q=0 exclusions."""
+    accepted = {}
+    for token in _request_headers(event).get("accept-encoding", "").split(","):
+        name, _, params = token.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+def _preferred_encoding(event):
+    """Pick br or gzip from Accept-Encoding."""
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if _accepts_encoding(event, encoding):
+            return encoding
+    return None
+
+
+def _version_etag(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _etag_matches(event, version):
+    """True if If-None-Match names this version in any content coding."""
+    header = _request_headers(event).get("if-none-match", "")
+    if not header or not version:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        candidate = candidate.strip('"')
+        if candidate.split("-", 1)[0] == version:
+            return True
+    return False
+
+
+def _not_modified(version):
+    return {
+        "statusCode": 304,
+        "headers": {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "ETag": f'"{version}"'},
+        "body": "",
+    }
+
+
+def _encoded_response(event, status_code, payload, version=None):
+    """Serialize, compress per Accept-Encoding, and tag with a strong ETag."""
+    body = json.dumps(payload).encode("utf-8")
+    headers = {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "Content-Type": "application/json"}
+    encoding = _preferred_encoding(event) if len(body) >= COMPRESSION_MIN_BYTES else None
+
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+
+    if version:
+        # Each content coding is its own representation, so it gets its own tag.
+        headers["ETag"] = f'"{version}-{encoding}"' if encoding else f'"{version}"'
+    if encoding is None:
+        return {"statusCode": status_code, "headers": headers, "body": body.decode("utf-8")}
+
+    headers["Content-Encoding"] = encoding
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": base64.b64encode(body).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
 def _extract_auth_token(event):
     raw_headers = (event or {}).get("headers") or {}
     headers = {str(key).lower(): value for key, value in raw_headers.items()}
@@ -59,7 +201,225 @@ def _to_serializable(value):
     return value
 
 
-def lambda_handler(event, _context):
+def _query_item_index(menu_item_id):
+    """Return index rows (objectKey, sortKey) for `menu_item_id`, oldest first."""
+    query_kwargs = {
+        "KeyConditionExpression": Key("menuItemId").eq(menu_item_id),
+        "ProjectionExpression": "objectKey, sortKey",
+    }
+    rows = []
+    scanned = 0
+
+    while True:
+        result = item_index_table.query(**query_kwargs)
+        rows.extend(result.get("Items", []))
+        scanned += result.get("ScannedCount", 0)
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    return rows, scanned
+
+
+def _batch_get_metadata(object_keys):
+    """Fetch metadata records for `object_keys`, preserving their order."""
+    found = {}
+    for start in range(0, len(object_keys), BATCH_GET_LIMIT):
+        request_items = {
+            TABLE_NAME: {
+                "Keys": [
+                    {"objectKey": key}
+                    for key in object_keys[start:start + BATCH_GET_LIMIT]
+                ]
+            }
+        }
+        while request_items:
+            result = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in result.get("Responses", {}).get(TABLE_NAME, []):
+                found[item["objectKey"]] = item
+            request_items = result.get("UnprocessedKeys") or None
+
+    return [found[key] for key in object_keys if key in found]
+
+
+def _handle_menu_item_query(event, menu_item_id):
+    if item_index_table is None:
+        logger.error("Missing required env var ITEM_INDEX_TABLE.")
+        return _response(500, {"message": "Server is not configured for item lookups."})
+
+    try:
+        rows, scanned = _query_item_index(menu_item_id)
+        # Metadata records are write-once, so the index sort keys
+        # (createdAt#objectKey) identify the response without fetching it.
+        version = _version_etag("menuItem", menu_item_id, *(row["sortKey"] for row in rows))
+        if _etag_matches(event, version):
+            return _not_modified(version)
+        records = _batch_get_metadata([row["objectKey"] for row in rows])
+    except ClientError as error:
+        logger.exception("Failed to query item index for %s: %s", menu_item_id, error)
+        return _response(500, {"message": "Could not read dataset. Try again later."})
+
+    items = [_to_serializable(record) for record in records]
+    return _encoded_response(
+        event,
+        200,
+        {
+            "items": items,
+            "count": len(items),
+            "scannedCount": scanned,
+            "menuItemId": menu_item_id,
+        },
+        version,
+    )
+
+
+def _manifest_key(name):
+    normalized_prefix = DATASET_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _latest_manifest_pointer():
+    """Return the published latest.json pointer, re-read every MANIFEST_REFRESH_SECONDS."""
+    if not DATASET_BUCKET:
+        return None
+
+    with manifest_lock:
+        checked_at = manifest_pointer["checkedAt"]
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < MANIFEST_REFRESH_SECONDS:
+            return manifest_pointer["pointer"]
+
+        try:
+            body = s3_client.get_object(
+                Bucket=DATASET_BUCKET, Key=_manifest_key("latest.json")
+            )["Body"].read()
+            manifest_pointer["pointer"] = json.loads(body)
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in ("NoSuchKey", "404", "AccessDenied"):
+                raise
+            manifest_pointer["pointer"] = None
+        manifest_pointer["checkedAt"] = now
+        return manifest_pointer["pointer"]
+
+
+def _manifest_body(version):
+    """Return the gzip-compressed manifest for `version`, or None if unpublished."""
+    with manifest_lock:
+        if version in manifest_bodies:
+            manifest_bodies.move_to_end(version)
+            return manifest_bodies[version]
+
+    try:
+        body = s3_client.get_object(
+            Bucket=DATASET_BUCKET, Key=_manifest_key(f"manifests/dataset-{version}.json.gz")
+        )["Body"].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+
+    with manifest_lock:
+        manifest_bodies[version] = body
+        if len(manifest_bodies) > MAX_CACHED_MANIFESTS:
+            manifest_bodies.popitem(last=False)
+    return body
+
+
+def _manifest_response(event, version, pinned):
+    """Serve a published manifest as stored, without re-serializing it."""
+    cache_headers = _IMMUTABLE_CACHE_HEADERS if pinned else _CACHE_HEADERS
+    if _etag_matches(event, version):
+        return {
+            "statusCode": 304,
+            "headers": {**_DEFAULT_HEADERS, **cache_headers, "ETag": f'"{version}"'},
+            "body": "",
+        }
+
+    body = _manifest_body(version)
+    if body is None:
+        return None
+
+    headers = {**_DEFAULT_HEADERS, **cache_headers, "Content-Type": "application/json"}
+    # Manifests are stored gzip-compressed; pass them through untouched.
+    if _accepts_encoding(event, "gzip"):
+        headers["Content-Encoding"] = "gzip"
+        headers["ETag"] = f'"{version}-gzip"'
+        return {
+            "statusCode": 200,
+            "headers": headers,
+            "body": base64.b64encode(body).decode("ascii"),
+            "isBase64Encoded": True,
+        }
+
+    headers["ETag"] = f'"{version}"'
+    return {"statusCode": 200, "headers": headers, "body": gzip.decompress(body).decode("utf-8")}
+
+
+def _handle_manifest_pointer():
+    try:
+        pointer = _latest_manifest_pointer()
+        if not pointer:
+            return _response(404, {"message": "No dataset manifest has been published."})
+        urls = {
+            name: s3_client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": DATASET_BUCKET, "Key": pointer[key]},
+                ExpiresIn=URL_EXPIRATION_SECONDS,
+            )
+            for name, key in (("manifestUrl", "manifestKey"), ("sampleOrderUrl", "sampleOrderKey"))
+        }
+    except ClientError as error:
+        logger.exception("Failed to read dataset manifest pointer: %s", error)
+        return _response(500, {"message": "Could not read dataset manifest."})
+
+    return {
+        "statusCode": 200,
+        "headers": {**_DEFAULT_HEADERS, "Cache-Control": "no-cache"},
+        "body": json.dumps({**pointer, **urls, "expiresIn": URL_EXPIRATION_SECONDS}),
+    }
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        pointer = _latest_manifest_pointer()
+        if pointer:
+            body = _manifest_body(pointer["version"])
+            primed["manifestVersion"] = pointer["version"]
+            primed["manifestBytes"] = len(body or b"")
+        elif metadata_table is not None:
+            metadata_table.load()
+            primed["table"] = TABLE_NAME
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
     if (event or {}).get("httpMethod") == "OPTIONS":
         return {
             "statusCode": 204,
@@ -85,6 +445,40 @@ def lambda_handler(event, _context):
             logger.warning("Unauthorized dataset request.")
             return _response(401, {"message": "Unauthorized"})
 
+    if ((event or {}).get("rawPath") or (event or {}).get("path") or "").rstrip("/").endswith(
+        "/dataset/manifest"
+    ):
+        return _handle_manifest_pointer()
+
+    params = (event or {}).get("queryStringParameters") or {}
+    menu_item_id = str(params.get("menuItemId") or "").strip()
+    if menu_item_id:
+        return _handle_menu_item_query(event, menu_item_id)
+
+    pinned_version = str(params.get("version") or "").strip()
+    if pinned_version:
+        try:
+            response = (
+                _manifest_response(event, pinned_version, pinned=True) if DATASET_BUCKET else None
+            )
+        except ClientError as error:
+            logger.exception("Failed to read dataset manifest %s: %s", pinned_version, error)
+            return _response(500, {"message": "Could not read dataset. Try again later."})
+        if response is None:
+            return _response(404, {"message": f"Dataset version {pinned_version} not found."})
+        return response
+
+    try:
+        pointer = _latest_manifest_pointer()
+        response = (
+            _manifest_response(event, pointer["version"], pinned=False) if pointer else None
+        )
+        if response is not None:
+            return response
+    except ClientError as error:
+        # The scan below still answers if the manifest bucket is unreadable.
+        logger.exception("Failed to read dataset manifest: %s", error)
+
     scan_kwargs = {}
     collected_items = []
     total_scanned = 0
@@ -93,7 +487,7 @@ def lambda_handler(event, _context):
         while True:
             result = metadata_table.scan(**scan_kwargs)
             raw_items = result.get("Items", [])
-            collected_items.extend(_to_serializable(item) for item in raw_items)
+            collected_items.extend(raw_items)
             total_scanned += result.get("ScannedCount", len(raw_items))
 
             last_evaluated_key = result.get("LastEvaluatedKey")
@@ -105,11 +499,23 @@ def lambda_handler(event, _context):
         logger.exception("Failed to scan metadata table: %s", error)
         return _response(500, {"message": "Could not read dataset. Try again later."})
 
-    return _response(
+    # Records are write-once, so (objectKey, createdAt) pairs version the
+    # dataset; a match skips serialization entirely.
+    version = _version_etag(
+        "dataset",
+        *sorted(f"{item.get('objectKey')}|{item.get('createdAt')}" for item in collected_items),
+    )
+    if _etag_matches(event, version):
+        return _not_modified(version)
+
+    items = [_to_serializable(item) for item in collected_items]
+    return _encoded_response(
+        event,
         200,
         {
-            "items": collected_items,
-            "count": len(collected_items),
+            "items": items,
+            "count": len(items),
             "scannedCount": total_scanned,
         },
+        version,
     )
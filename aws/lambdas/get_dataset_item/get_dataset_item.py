@@ -1,27 +1,51 @@
 """Return a single dataset item from DynamoDB by objectKey."""
+import base64
+import gzip
+import hashlib
 import json
 import logging
 import os
+import time
 from decimal import Decimal
 from urllib.parse import unquote
 
 import boto3
 from botocore.exceptions import ClientError
 
+import traffic_capture
+
+try:
+    import brotli
+except ImportError:  # Not bundled with the Lambda runtime; gzip is used instead.
+    brotli = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+# Responses smaller than this are sent uncompressed.
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
 
 dynamodb = boto3.resource("dynamodb")
 metadata_table = dynamodb.Table(TABLE_NAME) if TABLE_NAME else None
 
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "get_dataset_item"
+
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization,If-None-Match",
     "Access-Control-Allow-Methods": "OPTIONS,GET",
+    "Access-Control-Expose-Headers": "ETag",
 }
+# Clients may cache but must revalidate with If-None-Match.
+_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
 
 
 def _response(status_code, payload):
@@ -32,6 +56,92 @@ def _response(status_code, payload):
     }
 
 
+def _request_headers(event):
+    raw_headers = (event or {}).get("headers") or {}
+    return {str(key).lower(): str(value) for key, value in raw_headers.items()}
+
+
+def _preferred_encoding(event):
+    """Pick br or gzip from Accept-Encoding, honoring q=0 exclusions."""
+    accepted = {}
+    for token in _request_headers(event).get("accept-encoding", "").split(","):
+        name, _, params = token.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _version_etag(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _etag_matches(event, version):
+    """True if If-None-Match names this version in any content coding."""
+    header = _request_headers(event).get("if-none-match", "")
+    if not header or not version:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        candidate = candidate.strip('"')
+        if candidate.split("-", 1)[0] == version:
+            return True
+    return False
+
+
+def _not_modified(version):
+    return {
+        "statusCode": 304,
+        "headers": {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "ETag": f'"{version}"'},
+        "body": "",
+    }
+
+
+def _encoded_response(event, status_code, payload, version=None):
+    """Serialize, compress per Accept-Encoding, and tag with a strong ETag."""
+    body = json.dumps(payload).encode("utf-8")
+    headers = {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "Content-Type": "application/json"}
+    encoding = _preferred_encoding(event) if len(body) >= COMPRESSION_MIN_BYTES else None
+
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+
+    if version:
+        # Each content coding is its own representation, so it gets its own tag.
+        headers["ETag"] = f'"{version}-{encoding}"' if encoding else f'"{version}"'
+    if encoding is None:
+        return {"statusCode": status_code, "headers": headers, "body": body.decode("utf-8")}
+
+    headers["Content-Encoding"] = encoding
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": base64.b64encode(body).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
 def _extract_auth_token(event):
     raw_headers = (event or {}).get("headers") or {}
     headers = {str(key).lower(): value for key, value in raw_headers.items()}
@@ -80,7 +190,38 @@ def _get_object_key(event):
         return str(raw_key)
 
 
-def lambda_handler(event, _context):
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        if metadata_table is not None:
+            metadata_table.load()
+            primed["table"] = TABLE_NAME
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
     if (event or {}).get("httpMethod") == "OPTIONS":
         return {
             "statusCode": 204,
@@ -119,6 +260,11 @@ def lambda_handler(event, _context):
     if "Item" not in result:
         return _response(404, {"message": "Dataset item not found."})
 
+    # Records are write-once, so objectKey + createdAt identify the content.
+    version = _version_etag("item", object_key, result["Item"].get("createdAt"))
+    if _etag_matches(event, version):
+        return _not_modified(version)
+
     item = _to_serializable(result["Item"])
 
-    return _response(200, {"item": item})
+    return _encoded_response(event, 200, {"item": item}, version)
@@ -0,0 +1,345 @@
+"""List likely near-duplicate plate photos from the perceptual-hash index."""
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import traffic_capture
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+METADATA_TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+PHASH_INDEX_TABLE_NAME = os.environ.get("PHASH_INDEX_TABLE", "mml-phash-index")
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "8"))
+# Bands shared by more uploads than this (e.g. all-dark photos) are skipped
+# in the full listing instead of being compared pairwise.
+MAX_BAND_SIZE = int(os.environ.get("MAX_BAND_SIZE", "2000"))
+DUPLICATES_CACHE_SECONDS = int(os.environ.get("DUPLICATES_CACHE_SECONDS", "60"))
+AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+
+# Must match upload_metadata.PHASH_BANDS.
+PHASH_BANDS = 9
+
+dynamodb = boto3.resource("dynamodb")
+metadata_table = (
+    dynamodb.Table(METADATA_TABLE_NAME) if METADATA_TABLE_NAME else None
+)
+phash_index_table = (
+    dynamodb.Table(PHASH_INDEX_TABLE_NAME) if PHASH_INDEX_TABLE_NAME else None
+)
+duplicates_cache = {"expiresAt": 0.0, "payload": None}
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Created on the first near-duplicate lookup.
+_band_executor = None
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "get_duplicates"
+
+_DEFAULT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Methods": "OPTIONS,GET",
+}
+
+
+def _response(status_code, payload):
+    return {
+        "statusCode": status_code,
+        "headers": _DEFAULT_HEADERS,
+        "body": json.dumps(payload),
+    }
+
+
+def _http_method(event):
+    return (
+        (event or {}).get("httpMethod")
+        or ((event or {}).get("requestContext") or {})
+        .get("http", {})
+        .get("method")
+        or ""
+    ).upper()
+
+
+def _extract_auth_token(event):
+    raw_headers = (event or {}).get("headers") or {}
+    headers = {str(key).lower(): value for key, value in raw_headers.items()}
+    token = headers.get("x-api-key")
+
+    if not token:
+        auth_header = headers.get("authorization", "")
+        if auth_header.lower().startswith("bearer "):
+            token = auth_header.split(" ", 1)[1].strip()
+
+    if not token and (event or {}).get("queryStringParameters"):
+        token = (event["queryStringParameters"] or {}).get("token")
+
+    return token
+
+
+def _phash_bands(perceptual_hash):
+    """Split a hex perceptual hash into PHASH_BANDS contiguous bit ranges,
+    keyed by position and value, e.g. "2:5f"."""
+    value = int(perceptual_hash, 16)
+    bits = len(perceptual_hash) * 4
+    bands = []
+    end = bits
+    for index in range(PHASH_BANDS):
+        width = bits // PHASH_BANDS + (1 if index < bits % PHASH_BANDS else 0)
+        end -= width
+        bands.append(f"{index}:{(value >> end) & ((1 << width) - 1):x}")
+    return bands
+
+
+def _hamming_distance(left, right):
+    return bin(int(left, 16) ^ int(right, 16)).count("1")
+
+
+def _query_band(band):
+    rows = []
+    query_kwargs = {
+        "KeyConditionExpression": Key("band").eq(band),
+        "ProjectionExpression": "objectKey, perceptualHash",
+    }
+    while True:
+        result = phash_index_table.query(**query_kwargs)
+        rows.extend(result.get("Items", []))
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return rows
+
+
+def _find_neighbors(object_key, perceptual_hash, max_distance):
+    """Query each band of the hash; any hash within PHASH_BANDS - 1 bits
+    shares at least one band exactly, so those matches are never missed."""
+    global _band_executor
+
+    if _band_executor is None:
+        _band_executor = ThreadPoolExecutor(max_workers=PHASH_BANDS)
+    matches = {}
+    # One query per band, all in parallel.
+    for rows in _band_executor.map(_query_band, _phash_bands(perceptual_hash)):
+        for row in rows:
+            candidate_key = row.get("objectKey")
+            if not candidate_key or candidate_key == object_key or candidate_key in matches:
+                continue
+            distance = _hamming_distance(perceptual_hash, row["perceptualHash"])
+            if distance <= max_distance:
+                matches[candidate_key] = distance
+
+    return [
+        {"objectKey": key, "distance": distance}
+        for key, distance in sorted(matches.items(), key=lambda entry: (entry[1], entry[0]))
+    ]
+
+
+def _scan_bands():
+    bands = {}
+    scan_kwargs = {"ProjectionExpression": "band, objectKey, perceptualHash"}
+    while True:
+        result = phash_index_table.scan(**scan_kwargs)
+        for row in result.get("Items", []):
+            bands.setdefault(row["band"], []).append(
+                (row["objectKey"], row["perceptualHash"])
+            )
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return bands
+
+
+def _duplicate_groups(bands, max_distance):
+    """Compare uploads only within shared bands and union matching pairs."""
+    pairs = {}
+    skipped_bands = []
+    indexed = set()
+
+    for band, members in bands.items():
+        indexed.update(object_key for object_key, _hash in members)
+        if len(members) < 2:
+            continue
+        if len(members) > MAX_BAND_SIZE:
+            skipped_bands.append({"band": band, "size": len(members)})
+            continue
+        for index, (left_key, left_hash) in enumerate(members):
+            for right_key, right_hash in members[index + 1:]:
+                pair = (left_key, right_key) if left_key < right_key else (right_key, left_key)
+                if pair in pairs:
+                    continue
+                distance = _hamming_distance(left_hash, right_hash)
+                if distance <= max_distance:
+                    pairs[pair] = distance
+
+    parent = {}
+
+    def find(key):
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    for left_key, right_key in pairs:
+        parent[find(left_key)] = find(right_key)
+
+    groups = {}
+    for (left_key, right_key), distance in pairs.items():
+        group = groups.setdefault(find(left_key), {"objectKeys": set(), "pairs": []})
+        group["objectKeys"].update((left_key, right_key))
+        group["pairs"].append(
+            {"objectKeys": [left_key, right_key], "distance": distance}
+        )
+
+    ordered = []
+    for group in groups.values():
+        ordered.append(
+            {
+                "objectKeys": sorted(group["objectKeys"]),
+                "pairs": sorted(
+                    group["pairs"],
+                    key=lambda pair: (pair["distance"], pair["objectKeys"]),
+                ),
+            }
+        )
+    ordered.sort(key=lambda group: (-len(group["objectKeys"]), group["objectKeys"][0]))
+
+    return {
+        "groups": ordered,
+        "count": len(ordered),
+        "pairCount": len(pairs),
+        "indexedCount": len(indexed),
+        "skippedBands": skipped_bands,
+        # Every pair within max_distance is listed only below PHASH_BANDS
+        # bits and when no band was skipped.
+        "exhaustive": max_distance < PHASH_BANDS and not skipped_bands,
+    }
+
+
+def _load_duplicates(max_distance):
+    now = time.monotonic()
+    cached = duplicates_cache["payload"]
+    if (
+        cached is not None
+        and cached["maxDistance"] == max_distance
+        and now < duplicates_cache["expiresAt"]
+    ):
+        return cached
+
+    payload = _duplicate_groups(_scan_bands(), max_distance)
+    payload["maxDistance"] = max_distance
+    payload["generatedAt"] = datetime.now(timezone.utc).isoformat()
+    duplicates_cache["payload"] = payload
+    duplicates_cache["expiresAt"] = now + DUPLICATES_CACHE_SECONDS
+    return payload
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        if phash_index_table is not None:
+            primed["duplicateGroups"] = _load_duplicates(NEAR_DUPLICATE_DISTANCE)["count"]
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if _http_method(event) == "OPTIONS":
+        return {
+            "statusCode": 204,
+            "headers": _DEFAULT_HEADERS,
+            "body": "",
+        }
+
+    if metadata_table is None or phash_index_table is None:
+        logger.error("Missing required DynamoDB table configuration.")
+        return _response(500, {"message": "Server is not configured for duplicates."})
+
+    http_method = _http_method(event)
+    if http_method and http_method != "GET":
+        return _response(405, {"message": f"Method {http_method} not allowed."})
+
+    if AUTH_TOKEN:
+        provided_token = _extract_auth_token(event)
+        if provided_token != AUTH_TOKEN:
+            logger.warning("Unauthorized duplicates request.")
+            return _response(401, {"message": "Unauthorized"})
+
+    query = (event or {}).get("queryStringParameters") or {}
+    max_distance = NEAR_DUPLICATE_DISTANCE
+    if query.get("maxDistance"):
+        try:
+            max_distance = int(query["maxDistance"])
+        except ValueError:
+            return _response(400, {"message": "maxDistance must be an integer."})
+        if not 0 <= max_distance <= 64:
+            return _response(400, {"message": "maxDistance must be between 0 and 64."})
+
+    object_key = (query.get("objectKey") or "").strip()
+    try:
+        if not object_key:
+            return _response(200, _load_duplicates(max_distance))
+
+        record = metadata_table.get_item(
+            Key={"objectKey": object_key},
+            ProjectionExpression="objectKey, perceptualHash",
+        ).get("Item")
+        if not record:
+            return _response(404, {"message": "Item not found."})
+        if not record.get("perceptualHash"):
+            return _response(
+                409, {"message": "This upload has no perceptual hash to compare."}
+            )
+
+        neighbors = _find_neighbors(object_key, record["perceptualHash"], max_distance)
+    except ClientError as error:
+        logger.exception("Failed to read perceptual-hash index: %s", error)
+        return _response(500, {"message": "Could not read duplicates. Try again later."})
+
+    return _response(
+        200,
+        {
+            "objectKey": object_key,
+            "perceptualHash": record["perceptualHash"],
+            "maxDistance": max_distance,
+            "exhaustive": max_distance < PHASH_BANDS,
+            "items": neighbors,
+            "count": len(neighbors),
+        },
+    )
@@ -1,30 +1,114 @@
 """Guestimate endpoints for human nutrition-estimation benchmarks."""
 import base64
+import gzip
+import hashlib
+import http.client
 import json
 import logging
 import math
 import os
 import random
-from datetime import datetime, timezone
+import sys
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal, InvalidOperation
-from urllib.error import HTTPError, URLError
-from urllib.parse import quote
-from urllib.request import Request, urlopen
+from itertools import chain, compress
+from operator import itemgetter, mul, sub, truediv
+from urllib.parse import quote, urlsplit
 
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 
+import traffic_capture
+
+try:
+    import brotli
+except ImportError:  # Not bundled with the Lambda runtime; gzip is used instead.
+    brotli = None
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 METADATA_TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
 GUESTIMATE_TABLE_NAME = os.environ.get("GUESTIMATE_TABLE", "mml-guestimates")
+IDEMPOTENCY_TABLE_NAME = os.environ.get("IDEMPOTENCY_TABLE", "")
+# How long a completed guess can be replayed for the same Idempotency-Key.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long an unfinished request holds its key before a retry may take over.
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "30"))
+SESSION_ROLLUP_TABLE_NAME = os.environ.get("SESSION_ROLLUP_TABLE", "")
+PREDICTION_RUN_TABLE_NAME = os.environ.get("PREDICTION_RUN_TABLE", "")
+# Sessions need at least this many scored guesses to be ranked by default.
+LEADERBOARD_MIN_COUNT = int(os.environ.get("LEADERBOARD_MIN_COUNT", "10"))
+LEADERBOARD_CACHE_SECONDS = int(os.environ.get("LEADERBOARD_CACHE_SECONDS", "30"))
+MAX_LEADERBOARD_SIZE = 100
 S3_BUCKET = os.environ.get("UPLOAD_BUCKET", "")
 URL_EXPIRATION_SECONDS = int(os.environ.get("URL_EXPIRATION_SECONDS", "900"))
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+# Responses smaller than this are sent uncompressed.
+COMPRESSION_MIN_BYTES = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
 HUSKYEATS_BASE_URL = os.environ.get(
     "HUSKYEATS_BASE_URL", "https://husky-eats.onrender.com/api"
 ).rstrip("/")
+HUSKYEATS_CONNECT_TIMEOUT_SECONDS = float(
+    os.environ.get("HUSKYEATS_CONNECT_TIMEOUT_SECONDS", "2")
+)
+HUSKYEATS_READ_TIMEOUT_SECONDS = float(
+    os.environ.get("HUSKYEATS_READ_TIMEOUT_SECONDS", "5")
+)
+HUSKYEATS_MAX_ATTEMPTS = int(os.environ.get("HUSKYEATS_MAX_ATTEMPTS", "3"))
+HUSKYEATS_RETRY_BASE_SECONDS = float(
+    os.environ.get("HUSKYEATS_RETRY_BASE_SECONDS", "0.2")
+)
+HUSKYEATS_DEADLINE_SECONDS = float(os.environ.get("HUSKYEATS_DEADLINE_SECONDS", "8"))
+# Send a second, hedged request when the first has not answered in this
+# many seconds. 0 disables hedging.
+HUSKYEATS_HEDGE_AFTER_SECONDS = float(
+    os.environ.get("HUSKYEATS_HEDGE_AFTER_SECONDS", "0")
+)
+HUSKYEATS_BREAKER_THRESHOLD = int(os.environ.get("HUSKYEATS_BREAKER_THRESHOLD", "5"))
+HUSKYEATS_BREAKER_COOLDOWN_SECONDS = float(
+    os.environ.get("HUSKYEATS_BREAKER_COOLDOWN_SECONDS", "30")
+)
+HUSKYEATS_POOL_SIZE = int(os.environ.get("HUSKYEATS_POOL_SIZE", "4"))
+NUTRITION_CACHE_TTL_SECONDS = float(
+    os.environ.get("NUTRITION_CACHE_TTL_SECONDS", "3600")
+)
+CATALOG_BUCKET = os.environ.get("CATALOG_BUCKET", S3_BUCKET)
+CATALOG_PREFIX = os.environ.get("CATALOG_PREFIX", "catalog/")
+CATALOG_REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", "900"))
+# How long a container reuses its sample index before rescanning metadata
+# and guesses. Guesses posted to the same container are applied immediately.
+SAMPLE_INDEX_TTL_SECONDS = float(os.environ.get("SAMPLE_INDEX_TTL_SECONDS", "60"))
+# Published dataset manifests (see publish_dataset); unset falls back to scans.
+DATASET_BUCKET = os.environ.get("DATASET_BUCKET", "")
+DATASET_PREFIX = os.environ.get("DATASET_PREFIX", "dataset/")
+# Cold tier for old guesses, written by {"action": "compact_guesses"}; unset
+# keeps every guess in the table.
+GUESS_ARCHIVE_BUCKET = os.environ.get("GUESS_ARCHIVE_BUCKET", "")
+GUESS_ARCHIVE_PREFIX = os.environ.get("GUESS_ARCHIVE_PREFIX", "guesses/")
+GUESS_HOT_DAYS = int(os.environ.get("GUESS_HOT_DAYS", "30"))
+# Archived guesses stay in the table this long before TTL removes them, so
+# containers pick up the new archive index first.
+GUESS_ARCHIVE_EXPIRY_SECONDS = int(os.environ.get("GUESS_ARCHIVE_EXPIRY_SECONDS", "86400"))
+GUESS_ARCHIVE_REFRESH_SECONDS = float(os.environ.get("GUESS_ARCHIVE_REFRESH_SECONDS", "60"))
+# Guesses archived per batch; a run keeps compacting batches from one scan
+# until it runs out of guesses or time.
+GUESS_COMPACTION_MAX_ITEMS = int(os.environ.get("GUESS_COMPACTION_MAX_ITEMS", "10000"))
+# Time a run keeps back to write, mark, index and expire a collected batch.
+# With less left it stops and the next run resumes.
+GUESS_COMPACTION_RESERVE_SECONDS = float(
+    os.environ.get("GUESS_COMPACTION_RESERVE_SECONDS", "120")
+)
+# Expiring hot copies stops this close to the timeout; a later run finishes it.
+COMPACTION_FINAL_MARGIN_SECONDS = 5
 
 MACRO_FIELDS = ("kcal", "protein_g", "carb_g", "fat_g")
 PERCENT_MIN_GROUND_TRUTH = {
@@ -33,6 +117,79 @@ PERCENT_MIN_GROUND_TRUTH = {
     "carb_g": 5.0,
     "fat_g": 5.0,
 }
+# Running sums kept per field; `_metrics_from_sums` turns them into the
+# analysis metrics, so rollups and full scans report identical numbers.
+ERROR_SUM_STATS = (
+    "count",
+    "absSum",
+    "sqSum",
+    "signedSum",
+    "percentCount",
+    "percentSum",
+    "lowGroundTruthCount",
+)
+# Absolute errors are also counted in log-spaced buckets per macro (a
+# DDSketch). Counts merge by addition, so rollup rows take them with the
+# same ADD as the sums, and each quantile read back is within
+# QUANTILE_RELATIVE_ACCURACY of the exact order statistic.
+QUANTILE_RELATIVE_ACCURACY = 0.01
+# Errors below this count as 0.
+QUANTILE_MIN_VALUE = 0.001
+ERROR_QUANTILES = {"p50": 0.5, "p90": 0.9}
+SKETCH_ATTRIBUTE_PREFIX = "absErr_"
+_SKETCH_GAMMA = (1 + QUANTILE_RELATIVE_ACCURACY) / (1 - QUANTILE_RELATIVE_ACCURACY)
+_SKETCH_LOG_GAMMA = math.log(_SKETCH_GAMMA)
+LEADERBOARD_METRICS = ("pmae", "mae", "rmse")
+BOOTSTRAP_METRICS = ("mae", "rmse", "pmae")
+MAX_BOOTSTRAP_RESAMPLES = int(os.environ.get("MAX_BOOTSTRAP_RESAMPLES", "5000"))
+MAX_CACHED_BOOTSTRAPS = 16
+MAX_LATEST_GUESSES = 10
+# Columns of an archived guess file; guess/groundTruth are split per macro
+# ("guess.kcal", ...) and errors are recomputed on read.
+ARCHIVE_SCALAR_COLUMNS = ("sampleId", "guessedAt", "clientSessionId", "manifestVersion")
+ARCHIVE_OBJECT_COLUMNS = ("sourceItems", "sampleMeta")
+ARCHIVE_MACRO_SOURCES = ("guess", "groundTruth")
+# Predictions per bulk submission; one batch is stored as a single columnar
+# item, which keeps it well under DynamoDB's 400 KB item limit.
+MAX_PREDICTION_BATCH = int(os.environ.get("MAX_PREDICTION_BATCH", "500"))
+MAX_COMPARED_RUNS = 10
+RUN_HEADER_KEY = "#run"
+BATCH_KEY_PREFIX = "batch#"
+# Partitions per sample in the guestimate table. Above 1, each guess is
+# written under sampleId "<objectKey>#<shard>" so evaluators on the same
+# plate spread their writes; reads fan back in. Lowering it needs
+# {"action": "reshard_guesses"}.
+GUESS_SHARDS = max(1, int(os.environ.get("GUESS_SHARDS", "1")))
+SHARD_SEPARATOR = "#"
+OVERALL_ROLLUP_ID = "overall"
+# Every guess adds to the overall rollup, so it is always split into
+# "overall#<n>" rows that reads sum; one row would make concurrent guess
+# transactions conflict.
+OVERALL_ROLLUP_SHARDS = max(1, int(os.environ.get("OVERALL_ROLLUP_SHARDS", "16")))
+# Guess transactions cancelled by a concurrent one are retried with jitter.
+GUESS_TRANSACTION_ATTEMPTS = int(os.environ.get("GUESS_TRANSACTION_ATTEMPTS", "4"))
+GUESS_TRANSACTION_RETRY_BASE_SECONDS = float(
+    os.environ.get("GUESS_TRANSACTION_RETRY_BASE_SECONDS", "0.05")
+)
+SESSION_ROLLUP_PREFIX = "session#"
+SAMPLE_STRATEGIES = ("sequential", "stratified", "least_guessed", "exclude_guessed")
+STRATIFY_FIELDS = ("diningHallId", "mealtime", "difficulty")
+SAMPLE_RECORD_FIELDS = (
+    "objectKey",
+    "bucket",
+    "createdAt",
+    "mealDate",
+    "mealtime",
+    "diningHallId",
+    "difficulty",
+)
+# What cached sample records keep once sorted; createdAt only orders them.
+SAMPLE_PAYLOAD_FIELDS = tuple(field for field in SAMPLE_RECORD_FIELDS if field != "createdAt")
+MAX_CACHED_ORDERINGS = 64
+# Sample indexes kept for manifest versions pinned by benchmark clients.
+MAX_PINNED_INDEXES = 4
+# Upper bound for `count=` on GET /guestimate/sample.
+MAX_SAMPLE_BATCH = int(os.environ.get("MAX_SAMPLE_BATCH", "20"))
 GUESS_ALIASES = {
     "kcal": ("kcal", "calories", "calories_kcal"),
     "protein_g": ("protein_g", "protein", "proteins", "proteinGrams"),
@@ -48,13 +205,58 @@ metadata_table = (
 guestimate_table = (
     dynamodb.Table(GUESTIMATE_TABLE_NAME) if GUESTIMATE_TABLE_NAME else None
 )
+idempotency_table = (
+    dynamodb.Table(IDEMPOTENCY_TABLE_NAME) if IDEMPOTENCY_TABLE_NAME else None
+)
+session_rollup_table = (
+    dynamodb.Table(SESSION_ROLLUP_TABLE_NAME) if SESSION_ROLLUP_TABLE_NAME else None
+)
 nutrition_cache = {}
+nutrition_cache_loaded_at = {}
+# In-memory copy of the catalog mirror published by the sync_catalog Lambda.
+catalog_mirror = {"version": None, "items": {}, "checkedAt": None}
+# Sorted sample records plus precomputed per-stratum position lists, guess
+# counts and per-session guessed positions; see `_load_sample_index`.
+sample_index = {"builtAt": None}
+sample_index_lock = threading.Lock()
+# Manifest version -> sample index built from that immutable manifest.
+pinned_sample_indexes = OrderedDict()
+# Manifest version -> projected sample records, in sample order.
+manifest_records = OrderedDict()
+leaderboard_cache = {"expiresAt": 0.0, "entries": None}
+# (analysis version, resamples, seed, confidence) -> intervals per nutrient.
+bootstrap_cache = OrderedDict()
+# Merged aggregates of every archived batch; replaced, never mutated.
+guess_archive = {"checkedAt": None, "cold": None}
+guess_archive_lock = threading.Lock()
+prediction_run_table = (
+    dynamodb.Table(PREDICTION_RUN_TABLE_NAME) if PREDICTION_RUN_TABLE_NAME else None
+)
+
+_huskyeats_url = urlsplit(HUSKYEATS_BASE_URL)
+_connection_pool = []
+_connection_pool_lock = threading.Lock()
+_breaker_state = {"consecutiveFailures": 0, "openUntil": 0.0}
+_breaker_lock = threading.Lock()
+_hedge_executor = None
+_fan_in_executor = None
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "guestimate"
 
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization,If-None-Match,Idempotency-Key",
     "Access-Control-Allow-Methods": "OPTIONS,GET,POST",
+    "Access-Control-Expose-Headers": "ETag",
 }
+# Clients may cache but must revalidate with If-None-Match.
+_CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
 
 
 def _response(status_code, payload):
@@ -65,6 +267,92 @@ def _response(status_code, payload):
     }
 
 
+def _request_headers(event):
+    raw_headers = (event or {}).get("headers") or {}
+    return {str(key).lower(): str(value) for key, value in raw_headers.items()}
+
+
+def _preferred_encoding(event):
+    """Pick br or gzip from Accept-Encoding, honoring q=0 exclusions."""
+    accepted = {}
+    for token in _request_headers(event).get("accept-encoding", "").split(","):
+        name, _, params = token.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _version_etag(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def _etag_matches(event, version):
+    """True if If-None-Match names this version in any content coding."""
+    header = _request_headers(event).get("if-none-match", "")
+    if not header or not version:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        candidate = candidate[2:] if candidate.startswith("W/") else candidate
+        candidate = candidate.strip('"')
+        if candidate.split("-", 1)[0] == version:
+            return True
+    return False
+
+
+def _not_modified(version):
+    return {
+        "statusCode": 304,
+        "headers": {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "ETag": f'"{version}"'},
+        "body": "",
+    }
+
+
+def _encoded_response(event, status_code, payload, version=None):
+    """Serialize, compress per Accept-Encoding, and tag with a strong ETag."""
+    body = json.dumps(payload).encode("utf-8")
+    headers = {**_DEFAULT_HEADERS, **_CACHE_HEADERS, "Content-Type": "application/json"}
+    encoding = _preferred_encoding(event) if len(body) >= COMPRESSION_MIN_BYTES else None
+
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+
+    if version:
+        # Each content coding is its own representation, so it gets its own tag.
+        headers["ETag"] = f'"{version}-{encoding}"' if encoding else f'"{version}"'
+    if encoding is None:
+        return {"statusCode": status_code, "headers": headers, "body": body.decode("utf-8")}
+
+    headers["Content-Encoding"] = encoding
+    return {
+        "statusCode": status_code,
+        "headers": headers,
+        "body": base64.b64encode(body).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
 def _http_method(event):
     return (
         (event or {}).get("httpMethod")
@@ -190,33 +478,310 @@ def _scan_all(table):
     return items
 
 
-def _sorted_dataset_items():
-    raw_items = _scan_all(metadata_table)
-    items = [
-        _to_serializable(item)
-        for item in raw_items
-        if item.get("objectKey")
-    ]
+def _guess_shard(object_key, guessed_at, client_session_id):
+    if GUESS_SHARDS == 1:
+        return None
+    return _guess_token_hash(object_key, guessed_at, client_session_id) % GUESS_SHARDS
+
+
+def _guess_token_hash(object_key, guessed_at, client_session_id):
+    token = f"{object_key}|{guessed_at}|{client_session_id or ''}"
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def _guess_partition_key(object_key, shard):
+    return object_key if shard is None else f"{object_key}{SHARD_SEPARATOR}{shard}"
+
+
+def _unshard_guess(record):
+    """Give a stored guess its logical sampleId back."""
+    object_key = record.pop("objectKey", None)
+    if object_key is not None:
+        record["sampleId"] = object_key
+    record.pop("shard", None)
+    return record
+
+
+def _scan_guesses(fields=None):
+    """Scan the guestimate table with sharded partition keys folded back."""
+    if fields is None:
+        records = _scan_all(guestimate_table)
+    else:
+        records = _scan_projected(guestimate_table, tuple(fields) + ("objectKey",))
+    return [_unshard_guess(record) for record in records]
+
+
+def _query_partition(partition_key):
+    items = []
+    query_kwargs = {"KeyConditionExpression": Key("sampleId").eq(partition_key)}
+    while True:
+        result = guestimate_table.query(**query_kwargs)
+        items.extend(result.get("Items", []))
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return items
+
+
+def _query_sample_guesses(object_key):
+    """All guesses on one sample: the unsharded key plus every shard, in parallel."""
+    global _fan_in_executor
+
+    partition_keys = [object_key]
+    if GUESS_SHARDS > 1:
+        partition_keys.extend(_guess_partition_key(object_key, shard) for shard in range(GUESS_SHARDS))
+        if _fan_in_executor is None:
+            _fan_in_executor = ThreadPoolExecutor(max_workers=min(GUESS_SHARDS + 1, 16))
+        partitions = _fan_in_executor.map(_query_partition, partition_keys)
+    else:
+        partitions = map(_query_partition, partition_keys)
+
+    records = [_unshard_guess(item) for items in partitions for item in items]
+    records.sort(key=lambda record: str(record.get("guessedAt") or ""))
+    return records
+
+
+def _scan_projected(table, fields):
+    names = {f"#f{index}": field for index, field in enumerate(fields)}
+    items = []
+    scan_kwargs = {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+    while True:
+        result = table.scan(**scan_kwargs)
+        items.extend(result.get("Items", []))
 
-    def sort_key(item):
-        return (
-            str(item.get("createdAt") or ""),
-            str(item.get("objectKey") or ""),
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    return items
+
+
+def _dataset_key(name):
+    normalized_prefix = DATASET_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _latest_manifest_version():
+    if not DATASET_BUCKET:
+        return None
+    try:
+        body = s3_client.get_object(Bucket=DATASET_BUCKET, Key=_dataset_key("latest.json"))[
+            "Body"
+        ].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+    return json.loads(body).get("version")
+
+
+class _SampleRecord:
+    """A cached sample: slots instead of a dict, and the few repeated values
+    (bucket, date, hall, mealtime, difficulty) interned so records share them."""
+
+    __slots__ = SAMPLE_PAYLOAD_FIELDS
+
+    def __init__(self, item):
+        self.objectKey = str(item["objectKey"])
+        for field in SAMPLE_PAYLOAD_FIELDS[1:]:
+            value = _to_serializable(item.get(field))
+            setattr(self, field, sys.intern(value) if isinstance(value, str) else value)
+
+
+def _load_manifest_records(version):
+    """Return the sample records of an immutable manifest, or None if unpublished."""
+    if version in manifest_records:
+        manifest_records.move_to_end(version)
+        return manifest_records[version]
+    if not DATASET_BUCKET:
+        return None
+
+    try:
+        body = s3_client.get_object(
+            Bucket=DATASET_BUCKET, Key=_dataset_key(f"manifests/dataset-{version}.json.gz")
+        )["Body"].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+
+    records = [_SampleRecord(item) for item in json.loads(gzip.decompress(body))["items"]]
+    manifest_records[version] = records
+    if len(manifest_records) > MAX_PINNED_INDEXES + 1:
+        manifest_records.popitem(last=False)
+    return records
+
+
+def _build_sample_index(pinned_version=None):
+    if pinned_version:
+        manifest_version = pinned_version
+        records = _load_manifest_records(pinned_version)
+        if records is None:
+            raise LookupError(f"Dataset version {pinned_version} not found.")
+    else:
+        manifest_version = _latest_manifest_version()
+        records = _load_manifest_records(manifest_version) if manifest_version else None
+    if records is None:
+        # Nothing published yet: order a projected scan the way the publisher does.
+        manifest_version = None
+        items = [
+            item
+            for item in _scan_projected(metadata_table, SAMPLE_RECORD_FIELDS)
+            if item.get("objectKey")
+        ]
+        items.sort(
+            key=lambda item: (str(item.get("createdAt") or ""), str(item["objectKey"]))
         )
+        records = [_SampleRecord(item) for item in items]
+        del items
+    positions = {record.objectKey: position for position, record in enumerate(records)}
+
+    strata = {}
+    for field in STRATIFY_FIELDS:
+        strata[(field,)] = _group_positions(records, (field,))
+
+    guess_counts = array("I", bytes(4 * len(records)))
+    session_guesses = {}
+    cold = _load_guess_archive()
+    for sample_id, entry in cold["all"]["samples"].items():
+        position = positions.get(sample_id)
+        if position is not None:
+            guess_counts[position] += entry["guessCount"]
+    for session_id, sample_ids in cold["sessionSamples"].items():
+        guessed = {positions[sample_id] for sample_id in sample_ids if sample_id in positions}
+        if guessed:
+            session_guesses[session_id] = guessed
+    for guess in _scan_guesses(("sampleId", "clientSessionId", "archivedIn")):
+        if guess.get("archivedIn") in cold["batches"]:
+            continue
+        position = positions.get(guess.get("sampleId"))
+        if position is None:
+            continue
+        guess_counts[position] += 1
+        if guess.get("clientSessionId"):
+            session_guesses.setdefault(str(guess["clientSessionId"]), set()).add(position)
 
-    return sorted(items, key=sort_key)
+    return {
+        "builtAt": time.monotonic(),
+        "records": records,
+        "positions": positions,
+        "strata": strata,
+        "guessCounts": guess_counts,
+        "sessionGuesses": session_guesses,
+        "orderings": {},
+        "manifestVersion": manifest_version,
+    }
 
 
-def _ordered_dataset_items(seed=None):
-    items = _sorted_dataset_items()
+def _load_sample_index(pinned_version=None):
+    with sample_index_lock:
+        if pinned_version:
+            index = pinned_sample_indexes.setdefault(pinned_version, {"builtAt": None})
+            pinned_sample_indexes.move_to_end(pinned_version)
+        else:
+            index = sample_index
+        built_at = index.get("builtAt")
+        if built_at is None or time.monotonic() - built_at >= SAMPLE_INDEX_TTL_SECONDS:
+            try:
+                rebuilt = _build_sample_index(pinned_version)
+            except LookupError:
+                pinned_sample_indexes.pop(pinned_version, None)
+                raise
+            index.clear()
+            index.update(rebuilt)
+        if len(pinned_sample_indexes) > MAX_PINNED_INDEXES:
+            pinned_sample_indexes.popitem(last=False)
+        return dict(index)
+
+
+def _record_sample_guess(object_key, client_session_id):
+    """Apply a new guess to the cached indexes without rescanning."""
+    with sample_index_lock:
+        for index in (sample_index, *pinned_sample_indexes.values()):
+            position = (index.get("positions") or {}).get(object_key)
+            if position is None:
+                continue
+            # Counts feed orderings that clients page through, so only the
+            # next rebuild reorders least_guessed; session exclusions apply
+            # at once.
+            index["guessCounts"][position] += 1
+            if client_session_id:
+                index["sessionGuesses"].setdefault(str(client_session_id), set()).add(
+                    position
+                )
+
+
+def _group_positions(records, fields):
+    groups = {}
+    for position, record in enumerate(records):
+        key = tuple(str(getattr(record, field) or "") for field in fields)
+        groups.setdefault(key, array("I")).append(position)
+    return groups
+
+
+def _stratum_groups(index, fields):
+    groups = index["strata"].get(fields)
+    if groups is None:
+        groups = _group_positions(index["records"], fields)
+        index["strata"][fields] = groups
+    return groups
+
+
+def _seeded_order(count, seed):
+    order = list(range(count))
     if seed:
-        random.Random(str(seed)).shuffle(items)
-    return items
+        random.Random(str(seed)).shuffle(order)
+    return order
+
+
+def _sample_ordering(index, strategy, seed, stratify_fields):
+    """Return sample positions in presentation order (cached per index)."""
+    cache_key = (strategy, seed or "", stratify_fields)
+    ordering = index["orderings"].get(cache_key)
+    if ordering is not None:
+        return ordering
+
+    count = len(index["records"])
+    if strategy == "stratified":
+        # Round-robin across strata so each hall/mealtime/difficulty shows up
+        # equally often until the smaller strata run out.
+        queues = []
+        for key, members in sorted(_stratum_groups(index, stratify_fields).items()):
+            members = list(members)
+            if seed:
+                random.Random(f"{seed}|{'|'.join(key)}").shuffle(members)
+            queues.append(members)
+        ordering = []
+        for round_index in range(max((len(queue) for queue in queues), default=0)):
+            ordering.extend(queue[round_index] for queue in queues if round_index < len(queue))
+    elif strategy == "least_guessed":
+        tiebreak = {position: rank for rank, position in enumerate(_seeded_order(count, seed))}
+        guess_counts = index["guessCounts"]
+        ordering = sorted(range(count), key=lambda position: (guess_counts[position], tiebreak[position]))
+    else:
+        ordering = _seeded_order(count, seed)
+
+    # Packed, so the cached orderings cost 4 bytes per sample each.
+    ordering = array("I", ordering)
+    if len(index["orderings"]) >= MAX_CACHED_ORDERINGS:
+        index["orderings"].clear()
+    index["orderings"][cache_key] = ordering
+    return ordering
 
 
 def _sample_payload(record, index, total_count):
-    object_key = record["objectKey"]
-    bucket = record.get("bucket") or S3_BUCKET
+    object_key = record.objectKey
+    bucket = record.bucket or S3_BUCKET
     if not bucket:
         raise RuntimeError("No S3 bucket is configured for sample images.")
 
@@ -235,18 +800,46 @@ def _sample_payload(record, index, total_count):
             "bucket": bucket,
             "imageUrl": download_url,
             "expiresIn": URL_EXPIRATION_SECONDS,
-            "mealDate": record.get("mealDate"),
-            "mealtime": record.get("mealtime"),
-            "diningHallId": record.get("diningHallId"),
-            "difficulty": record.get("difficulty"),
+            "mealDate": record.mealDate,
+            "mealtime": record.mealtime,
+            "diningHallId": record.diningHallId,
+            "difficulty": record.difficulty,
         },
     }
 
 
+def _parse_sample_strategy(params):
+    strategy = (params.get("strategy") or "sequential").strip().lower()
+    if strategy not in SAMPLE_STRATEGIES:
+        raise ValueError(f"strategy must be one of: {', '.join(SAMPLE_STRATEGIES)}.")
+
+    stratify_fields = ()
+    if strategy == "stratified":
+        raw_fields = params.get("stratifyBy") or "diningHallId"
+        stratify_fields = tuple(
+            field.strip() for field in raw_fields.split(",") if field.strip()
+        )
+        unknown = [field for field in stratify_fields if field not in STRATIFY_FIELDS]
+        if unknown or not stratify_fields:
+            raise ValueError(
+                f"stratifyBy must list fields from: {', '.join(STRATIFY_FIELDS)}."
+            )
+
+    exclude_guessed = strategy == "exclude_guessed" or str(
+        params.get("excludeGuessed") or ""
+    ).lower() in ("1", "true", "yes")
+    client_session_id = str(params.get("clientSessionId") or "").strip()
+    if exclude_guessed and not client_session_id:
+        raise ValueError("clientSessionId is required to exclude guessed samples.")
+
+    return strategy, stratify_fields, exclude_guessed, client_session_id
+
+
 def _handle_get_sample(event):
     params = (event or {}).get("queryStringParameters") or {}
     raw_index = params.get("index", "0")
     seed = params.get("seed")
+    raw_count = params.get("count")
 
     try:
         index = int(raw_index)
@@ -256,13 +849,35 @@ def _handle_get_sample(event):
     if index < 0:
         return _response(400, {"message": "index cannot be negative."})
 
+    count = None
+    if raw_count not in (None, ""):
+        try:
+            count = int(raw_count)
+        except (TypeError, ValueError):
+            return _response(400, {"message": "count must be an integer."})
+        if not 1 <= count <= MAX_SAMPLE_BATCH:
+            return _response(
+                400, {"message": f"count must be between 1 and {MAX_SAMPLE_BATCH}."}
+            )
+
+    try:
+        strategy, stratify_fields, exclude_guessed, client_session_id = (
+            _parse_sample_strategy(params)
+        )
+    except ValueError as error:
+        return _response(400, {"message": str(error)})
+
+    pinned_version = str(params.get("manifestVersion") or "").strip() or None
     try:
-        dataset_items = _ordered_dataset_items(seed)
+        dataset_index = _load_sample_index(pinned_version)
+    except LookupError as error:
+        return _response(404, {"message": str(error)})
     except ClientError as error:
-        logger.exception("Failed to scan metadata table: %s", error)
+        logger.exception("Failed to build sample index: %s", error)
         return _response(500, {"message": "Could not read samples."})
 
-    total_count = len(dataset_items)
+    records = dataset_index["records"]
+    total_count = len(records)
     if total_count == 0:
         return _response(404, {"message": "No samples are available.", "totalCount": 0})
     if index >= total_count:
@@ -274,8 +889,35 @@ def _handle_get_sample(event):
             },
         )
 
+    ordering = _sample_ordering(dataset_index, strategy, seed, stratify_fields)
+    remaining_count = None
+    window = range(index, min(total_count, index + (count or 1)))
+    if exclude_guessed:
+        # Skip forward past guessed samples instead of re-indexing, so a
+        # client paging with index + 1 never misses a sample.
+        guessed = dataset_index["sessionGuesses"].get(client_session_id, set())
+        remaining_count = total_count - len(guessed)
+        window = []
+        for position in range(index, total_count):
+            if ordering[position] not in guessed:
+                window.append(position)
+                if len(window) >= (count or 1):
+                    break
+        if not window:
+            return _response(
+                404,
+                {
+                    "message": "No unguessed samples remain for this session.",
+                    "totalCount": total_count,
+                    "remainingCount": remaining_count,
+                },
+            )
+
     try:
-        return _response(200, _sample_payload(dataset_items[index], index, total_count))
+        batch = [
+            _sample_payload(records[ordering[position]], position, total_count)
+            for position in window
+        ]
     except ClientError as error:
         logger.exception("Failed to create sample image URL: %s", error)
         return _response(500, {"message": "Could not prepare sample image."})
@@ -283,36 +925,276 @@ def _handle_get_sample(event):
         logger.error("Sample image configuration error: %s", error)
         return _response(500, {"message": str(error)})
 
+    # The first sample keeps the single-sample response shape; `count=`
+    # adds the whole window so clients can prefetch the next images.
+    payload = dict(batch[0])
+    if count is not None:
+        payload["samples"] = [
+            {"index": entry["index"], "sample": entry["sample"]} for entry in batch
+        ]
+        payload["nextIndex"] = batch[-1]["index"] + 1
+        payload["hasNext"] = batch[-1]["hasNext"]
+    payload["strategy"] = strategy
+    # Passing this back as manifestVersion= replays the same sample set.
+    payload["manifestVersion"] = dataset_index["manifestVersion"]
+    if remaining_count is not None:
+        payload["remainingCount"] = remaining_count
+    return _response(200, payload)
+
 
 def _get_metadata_item(object_key):
     result = metadata_table.get_item(Key={"objectKey": object_key})
     return result.get("Item")
 
 
+class _UpstreamError(RuntimeError):
+    """A failed Husky Eats request; `retryable` marks transient failures."""
+
+    def __init__(self, message, retryable):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+def _new_connection():
+    connection_class = (
+        http.client.HTTPSConnection
+        if _huskyeats_url.scheme == "https"
+        else http.client.HTTPConnection
+    )
+    connection = connection_class(
+        _huskyeats_url.hostname,
+        _huskyeats_url.port,
+        timeout=HUSKYEATS_CONNECT_TIMEOUT_SECONDS,
+    )
+    connection.connect()
+    connection.sock.settimeout(HUSKYEATS_READ_TIMEOUT_SECONDS)
+    return connection
+
+
+def _checkout_connection():
+    with _connection_pool_lock:
+        if _connection_pool:
+            return _connection_pool.pop(), True
+    return _new_connection(), False
+
+
+def _release_connection(connection):
+    with _connection_pool_lock:
+        if len(_connection_pool) < HUSKYEATS_POOL_SIZE:
+            _connection_pool.append(connection)
+            return
+    connection.close()
+
+
+def _huskyeats_get_once(path):
+    """Issue one GET over a pooled keep-alive connection."""
+    full_path = f"{_huskyeats_url.path.rstrip('/')}{path}"
+    headers = {
+        "Accept": "application/json",
+        "User-Agent": "MenuMatch-Labeler-Guestimate/1.0",
+        "Connection": "keep-alive",
+    }
+
+    # A pooled connection may have been closed by the server while the
+    # container was idle; retry once on a fresh connection in that case.
+    for _ in range(2):
+        try:
+            connection, reused = _checkout_connection()
+        except (OSError, http.client.HTTPException) as error:
+            raise _UpstreamError(f"Could not connect to Husky Eats: {error}", True) from error
+
+        try:
+            connection.request("GET", full_path, headers=headers)
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as error:
+            connection.close()
+            if reused and isinstance(
+                error, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+            ):
+                continue
+            raise _UpstreamError(f"Husky Eats request failed: {error}", True) from error
+
+        if response.will_close:
+            connection.close()
+        else:
+            _release_connection(connection)
+        break
+    else:
+        raise _UpstreamError("Husky Eats closed pooled connections", True)
+
+    if response.status >= 400:
+        retryable = response.status >= 500 or response.status == 429
+        raise _UpstreamError(f"Husky Eats returned HTTP {response.status}", retryable)
+
+    try:
+        return json.loads(body.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as error:
+        raise _UpstreamError("Husky Eats returned invalid JSON", False) from error
+
+
+def _huskyeats_get_hedged(path):
+    global _hedge_executor
+
+    if HUSKYEATS_HEDGE_AFTER_SECONDS <= 0:
+        return _huskyeats_get_once(path)
+
+    if _hedge_executor is None:
+        _hedge_executor = ThreadPoolExecutor(max_workers=HUSKYEATS_POOL_SIZE * 2)
+
+    pending = {_hedge_executor.submit(_huskyeats_get_once, path)}
+    done, pending = wait(pending, timeout=HUSKYEATS_HEDGE_AFTER_SECONDS)
+    if not done:
+        pending.add(_hedge_executor.submit(_huskyeats_get_once, path))
+
+    last_error = None
+    while done or pending:
+        for future in done:
+            try:
+                return future.result()
+            except _UpstreamError as error:
+                last_error = error
+        if not pending:
+            break
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    raise last_error
+
+
+def _breaker_is_open():
+    with _breaker_lock:
+        return time.monotonic() < _breaker_state["openUntil"]
+
+
+def _record_upstream_result(success):
+    with _breaker_lock:
+        if success:
+            _breaker_state["consecutiveFailures"] = 0
+            _breaker_state["openUntil"] = 0.0
+            return
+
+        _breaker_state["consecutiveFailures"] += 1
+        if _breaker_state["consecutiveFailures"] >= HUSKYEATS_BREAKER_THRESHOLD:
+            # Open (or re-open after a failed half-open probe) the breaker.
+            _breaker_state["openUntil"] = (
+                time.monotonic() + HUSKYEATS_BREAKER_COOLDOWN_SECONDS
+            )
+
+
+def _huskyeats_get(path):
+    """GET a Husky Eats path with retries, jittered backoff and a breaker."""
+    if _breaker_is_open():
+        raise _UpstreamError("Husky Eats circuit breaker is open", True)
+
+    started = time.monotonic()
+    for attempt in range(1, HUSKYEATS_MAX_ATTEMPTS + 1):
+        try:
+            payload = _huskyeats_get_hedged(path)
+        except _UpstreamError as error:
+            if not error.retryable:
+                # The upstream answered (e.g. 404), so it is healthy.
+                _record_upstream_result(True)
+                raise
+
+            delay = random.uniform(0, HUSKYEATS_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            out_of_budget = (
+                time.monotonic() - started + delay > HUSKYEATS_DEADLINE_SECONDS
+            )
+            if attempt == HUSKYEATS_MAX_ATTEMPTS or out_of_budget:
+                _record_upstream_result(False)
+                raise
+
+            logger.warning(
+                "Husky Eats GET %s failed (attempt %s): %s", path, attempt, error
+            )
+            time.sleep(delay)
+            continue
+
+        _record_upstream_result(True)
+        return payload
+
+
+def _catalog_key(name):
+    normalized_prefix = CATALOG_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _load_catalog_mirror(force=False):
+    """Load the latest catalog mirror from S3, re-checking the pointer periodically."""
+    if not CATALOG_BUCKET:
+        return
+
+    now = time.monotonic()
+    checked_at = catalog_mirror["checkedAt"]
+    if not force and checked_at is not None and now - checked_at < CATALOG_REFRESH_SECONDS:
+        return
+    catalog_mirror["checkedAt"] = now
+
+    try:
+        pointer = json.loads(
+            s3_client.get_object(Bucket=CATALOG_BUCKET, Key=_catalog_key("latest.json"))[
+                "Body"
+            ].read()
+        )
+        if pointer.get("version") == catalog_mirror["version"]:
+            return
+
+        body = s3_client.get_object(Bucket=CATALOG_BUCKET, Key=pointer["objectKey"])[
+            "Body"
+        ].read()
+        blob = json.loads(gzip.decompress(body))
+    except (ClientError, KeyError, OSError, ValueError) as error:
+        logger.warning("Catalog mirror unavailable; using Husky Eats directly: %s", error)
+        return
+
+    fields = blob["fields"]
+    items = {}
+    for item_id, row in blob["items"].items():
+        values = dict(zip(fields, row))
+        items[item_id] = {
+            "id": item_id,
+            "name": values.get("name", ""),
+            "servingSize": values.get("servingSize", ""),
+            **{field: float(values[field]) for field in MACRO_FIELDS},
+        }
+
+    catalog_mirror["items"] = items
+    catalog_mirror["version"] = blob.get("version") or pointer.get("version")
+    logger.info(
+        "Loaded catalog mirror version %s (%s items).",
+        catalog_mirror["version"],
+        len(items),
+    )
+
+
 def _fetch_nutrition(menu_item_id):
     key = str(menu_item_id)
-    if key in nutrition_cache:
-        return nutrition_cache[key]
-
-    url = f"{HUSKYEATS_BASE_URL}/menuitem/{quote(key)}"
-    request = Request(
-        url,
-        headers={
-            "Accept": "application/json",
-            "User-Agent": "MenuMatch-Labeler-Guestimate/1.0",
-        },
-    )
+    cached = nutrition_cache.get(key)
+    if cached is not None and (
+        time.monotonic() - nutrition_cache_loaded_at.get(key, 0.0)
+        < NUTRITION_CACHE_TTL_SECONDS
+    ):
+        return cached
+
+    _load_catalog_mirror()
+    mirrored = catalog_mirror["items"].get(key)
+    if mirrored is not None:
+        return mirrored
 
     try:
-        with urlopen(request, timeout=20) as response:
-            payload = json.loads(response.read().decode("utf-8"))
-    except HTTPError as error:
-        logger.exception("Husky Eats returned HTTP %s for item %s", error.code, key)
-        raise RuntimeError(f"Could not load nutrition for menu item {key}.") from error
-    except (URLError, TimeoutError, json.JSONDecodeError) as error:
-        logger.exception("Failed to fetch Husky Eats item %s: %s", key, error)
+        payload = _huskyeats_get(f"/menuitem/{quote(key)}")
+    except _UpstreamError as error:
+        if cached is not None:
+            logger.warning("Serving stale nutrition for item %s: %s", key, error)
+            return cached
+        logger.error("Failed to fetch Husky Eats item %s: %s", key, error)
         raise RuntimeError(f"Could not load nutrition for menu item {key}.") from error
 
+    if not isinstance(payload, dict):
+        raise RuntimeError(f"Could not load nutrition for menu item {key}.")
+
     nutrition = {
         "kcal": _to_float(payload.get("calories"), f"calories for item {key}"),
         "protein_g": _to_float(
@@ -331,6 +1213,7 @@ def _fetch_nutrition(menu_item_id):
         "servingSize": str(payload.get("servingsize") or ""),
         **nutrition,
     }
+    nutrition_cache_loaded_at[key] = time.monotonic()
     return nutrition_cache[key]
 
 
@@ -400,6 +1283,201 @@ def _score_guess(guess, ground_truth):
     return errors
 
 
+def _idempotency_key(event):
+    key = _request_headers(event).get("idempotency-key", "").strip()
+    if not key:
+        return None
+    if len(key) > 255 or not key.isprintable() or not key.isascii():
+        raise ValueError("Idempotency-Key must be at most 255 printable ASCII characters.")
+    return key
+
+
+def _request_fingerprint(object_key, guess, client_session_id):
+    canonical = json.dumps(
+        {"objectKey": object_key, "guess": guess, "clientSessionId": client_session_id},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _replayed_response(record):
+    return {
+        "statusCode": int(record["statusCode"]),
+        "headers": {**_DEFAULT_HEADERS, "Idempotent-Replayed": "true"},
+        "body": record["responseBody"],
+    }
+
+
+def _claim_idempotency_key(key, fingerprint):
+    """Claim `key` for this request, or return the response a retry gets."""
+    now = int(time.time())
+    try:
+        idempotency_table.put_item(
+            Item={
+                "idempotencyKey": key,
+                "status": "in_progress",
+                "fingerprint": fingerprint,
+                "lockedUntil": now + IDEMPOTENCY_LOCK_SECONDS,
+                "expiresAt": now + IDEMPOTENCY_TTL_SECONDS,
+            },
+            # TTL deletion is lazy, so expired rows are treated as absent.
+            ConditionExpression=(
+                "attribute_not_exists(idempotencyKey) OR expiresAt < :now"
+                " OR (#status = :in_progress AND lockedUntil < :now)"
+            ),
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={":now": now, ":in_progress": "in_progress"},
+        )
+        return None
+    except ClientError as error:
+        if error.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+    existing = idempotency_table.get_item(
+        Key={"idempotencyKey": key}, ConsistentRead=True
+    ).get("Item") or {}
+    if existing.get("fingerprint") != fingerprint:
+        return _response(
+            422,
+            {"message": "Idempotency-Key was already used for a different request."},
+        )
+    if existing.get("status") == "complete":
+        return _replayed_response(existing)
+    return _response(
+        409, {"message": "A request with this Idempotency-Key is still in progress."}
+    )
+
+
+def _release_idempotency_key(key, fingerprint):
+    try:
+        idempotency_table.delete_item(
+            Key={"idempotencyKey": key},
+            ConditionExpression="#status = :in_progress AND fingerprint = :fingerprint",
+            ExpressionAttributeNames={"#status": "status"},
+            ExpressionAttributeValues={
+                ":in_progress": "in_progress",
+                ":fingerprint": fingerprint,
+            },
+        )
+    except ClientError as error:
+        logger.warning("Could not release Idempotency-Key %s: %s", key, error)
+
+
+def _rollup_ids(object_key, guessed_at, client_session_id):
+    overall_shard = (
+        _guess_token_hash(object_key, guessed_at, client_session_id) % OVERALL_ROLLUP_SHARDS
+    )
+    ids = [f"{OVERALL_ROLLUP_ID}{SHARD_SEPARATOR}{overall_shard}"]
+    session_id = str(client_session_id or "").strip()
+    if session_id:
+        ids.append(f"{SESSION_ROLLUP_PREFIX}{session_id}")
+    return ids
+
+
+def _rollup_update(rollup_id, sums, buckets, guessed_at):
+    """Transaction item adding one guess's error sums and sketch buckets to a
+    rollup row."""
+    values = {":one": 1, ":guessed_at": guessed_at}
+    additions = ["guessCount :one"]
+    for field in MACRO_FIELDS:
+        for stat in ERROR_SUM_STATS:
+            placeholder = f":{stat}_{field}"
+            additions.append(f"{stat}_{field} {placeholder}")
+            values[placeholder] = sums[field][stat]
+    for field, bucket in buckets.items():
+        additions.append(f"{SKETCH_ATTRIBUTE_PREFIX}{field}_{bucket} :one")
+
+    return {
+        "Update": {
+            "TableName": SESSION_ROLLUP_TABLE_NAME,
+            "Key": {"rollupId": rollup_id},
+            "UpdateExpression": (
+                "SET lastGuessAt = :guessed_at,"
+                " firstGuessAt = if_not_exists(firstGuessAt, :guessed_at)"
+                f" ADD {', '.join(additions)}"
+            ),
+            "ExpressionAttributeValues": _to_dynamodb(values),
+        }
+    }
+
+
+def _store_guess(stored_item, response_payload, idempotency_key, fingerprint):
+    transact_items = [
+        {
+            "Put": {
+                "TableName": GUESTIMATE_TABLE_NAME,
+                "Item": _to_dynamodb(stored_item),
+            }
+        }
+    ]
+
+    # The guess and the replayable response are committed together, so a
+    # retry either finds the finished response or writes the guess itself.
+    if idempotency_key:
+        transact_items.append(
+            {
+                "Update": {
+                    "TableName": IDEMPOTENCY_TABLE_NAME,
+                    "Key": {"idempotencyKey": idempotency_key},
+                    "UpdateExpression": (
+                        "SET #status = :complete, statusCode = :status_code,"
+                        " responseBody = :body, sampleId = :sample_id,"
+                        " guessedAt = :guessed_at REMOVE lockedUntil"
+                    ),
+                    "ConditionExpression": "#status = :in_progress AND fingerprint = :fingerprint",
+                    "ExpressionAttributeNames": {"#status": "status"},
+                    "ExpressionAttributeValues": {
+                        ":complete": "complete",
+                        ":in_progress": "in_progress",
+                        ":fingerprint": fingerprint,
+                        ":status_code": 201,
+                        ":body": json.dumps(response_payload),
+                        ":sample_id": stored_item.get("objectKey", stored_item["sampleId"]),
+                        ":guessed_at": stored_item["guessedAt"],
+                    },
+                }
+            }
+        )
+
+    # Rollups move in the same transaction so they never drift from the
+    # guesses they summarize.
+    if session_rollup_table is not None:
+        sums = _new_error_sums()
+        _accumulate_error_sums(sums, stored_item)
+        buckets = _error_buckets(stored_item)
+        transact_items.extend(
+            _rollup_update(rollup_id, sums, buckets, stored_item["guessedAt"])
+            for rollup_id in _rollup_ids(
+                stored_item.get("objectKey") or stored_item["sampleId"],
+                stored_item["guessedAt"],
+                stored_item.get("clientSessionId"),
+            )
+        )
+
+    if len(transact_items) == 1:
+        guestimate_table.put_item(Item=transact_items[0]["Put"]["Item"])
+        return
+    for attempt in range(1, GUESS_TRANSACTION_ATTEMPTS + 1):
+        try:
+            dynamodb.meta.client.transact_write_items(TransactItems=transact_items)
+            return
+        except ClientError as error:
+            if attempt == GUESS_TRANSACTION_ATTEMPTS or not _is_transaction_conflict(error):
+                raise
+        # botocore does not retry a cancelled transaction; nothing was written.
+        time.sleep(random.uniform(0, GUESS_TRANSACTION_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+def _is_transaction_conflict(error):
+    if error.response["Error"]["Code"] != "TransactionCanceledException":
+        return False
+    reasons = error.response.get("CancellationReasons") or []
+    if reasons:
+        return any(reason.get("Code") == "TransactionConflict" for reason in reasons)
+    return "TransactionConflict" in error.response["Error"].get("Message", "")
+
+
 def _handle_post_guess(event):
     try:
         payload = _parse_event_body(event)
@@ -407,9 +1485,29 @@ def _handle_post_guess(event):
         if not object_key:
             raise ValueError("objectKey is required.")
         guess = _normalize_guess(payload)
+        idempotency_key = _idempotency_key(event) if idempotency_table is not None else None
     except ValueError as error:
         return _response(400, {"message": str(error)})
 
+    fingerprint = None
+    if idempotency_key:
+        fingerprint = _request_fingerprint(object_key, guess, payload.get("clientSessionId"))
+        try:
+            replay = _claim_idempotency_key(idempotency_key, fingerprint)
+        except ClientError as error:
+            logger.exception("Failed to claim Idempotency-Key %s: %s", idempotency_key, error)
+            return _response(500, {"message": "Could not save guess."})
+        if replay is not None:
+            return replay
+
+    response = _score_and_store_guess(object_key, guess, payload, idempotency_key, fingerprint)
+    if idempotency_key and response["statusCode"] != 201:
+        # Let a retry start over instead of waiting out the lock.
+        _release_idempotency_key(idempotency_key, fingerprint)
+    return response
+
+
+def _score_and_store_guess(object_key, guess, payload, idempotency_key, fingerprint):
     try:
         record = _get_metadata_item(object_key)
     except ClientError as error:
@@ -426,9 +1524,10 @@ def _handle_post_guess(event):
 
     errors = _score_guess(guess, ground_truth)
     now = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+    shard = _guess_shard(object_key, now, payload.get("clientSessionId"))
 
     stored_item = {
-        "sampleId": object_key,
+        "sampleId": _guess_partition_key(object_key, shard),
         "guessedAt": now,
         "guess": guess,
         "groundTruth": ground_truth,
@@ -442,68 +1541,76 @@ def _handle_post_guess(event):
             "difficulty": record.get("difficulty"),
         },
         "clientSessionId": payload.get("clientSessionId"),
+        "manifestVersion": str(payload.get("manifestVersion") or "").strip() or None,
         "createdAt": now,
     }
+    if shard is not None:
+        stored_item["objectKey"] = object_key
+        stored_item["shard"] = shard
+    response_payload = {
+        "sampleId": object_key,
+        "guessedAt": now,
+        "guess": guess,
+        "groundTruth": ground_truth,
+        "errors": errors,
+        "sourceItems": source_items,
+    }
 
     try:
-        guestimate_table.put_item(Item=_to_dynamodb(stored_item))
+        _store_guess(stored_item, response_payload, idempotency_key, fingerprint)
     except ClientError as error:
         logger.exception("Failed to write guestimate for %s: %s", object_key, error)
         return _response(500, {"message": "Could not save guess."})
 
-    return _response(
-        201,
-        {
-            "sampleId": object_key,
-            "guessedAt": now,
-            "guess": guess,
-            "groundTruth": ground_truth,
-            "errors": errors,
-            "sourceItems": source_items,
-        },
-    )
+    _record_sample_guess(object_key, payload.get("clientSessionId"))
 
+    return _response(201, response_payload)
+
+
+def _new_error_sums():
+    return {field: {stat: 0 for stat in ERROR_SUM_STATS} for field in MACRO_FIELDS}
 
-def _compute_metrics(records):
-    metrics = {}
-    by_nutrient = {}
+
+def _accumulate_error_sums(sums, record):
+    ground_truth = record.get("groundTruth") or {}
+    guess = record.get("guess") or {}
 
     for field in MACRO_FIELDS:
-        abs_errors = []
-        sq_errors = []
-        perc_errors = []
-        signed_errors = []
-        low_ground_truth_exclusions = 0
-
-        for record in records:
-            ground_truth = record.get("groundTruth") or {}
-            guess = record.get("guess") or {}
-            if field not in ground_truth or field not in guess:
-                continue
+        if field not in ground_truth or field not in guess:
+            continue
 
-            ground_truth_value = float(ground_truth[field])
-            predicted_value = float(guess[field])
-            error = predicted_value - ground_truth_value
-            abs_error = abs(error)
+        ground_truth_value = float(ground_truth[field])
+        error = float(guess[field]) - ground_truth_value
+        abs_error = abs(error)
 
-            signed_errors.append(error)
-            abs_errors.append(abs_error)
-            sq_errors.append(error * error)
+        field_sums = sums[field]
+        field_sums["count"] += 1
+        field_sums["absSum"] += abs_error
+        field_sums["sqSum"] += error * error
+        field_sums["signedSum"] += error
 
-            min_ground_truth = PERCENT_MIN_GROUND_TRUTH[field]
-            if ground_truth_value < min_ground_truth:
-                low_ground_truth_exclusions += 1
-                continue
+        if ground_truth_value < PERCENT_MIN_GROUND_TRUTH[field]:
+            field_sums["lowGroundTruthCount"] += 1
+            continue
 
-            percent_error = abs_error / ground_truth_value
-            perc_errors.append(percent_error)
+        field_sums["percentCount"] += 1
+        field_sums["percentSum"] += abs_error / ground_truth_value
 
-        mae = sum(abs_errors) / len(abs_errors) if abs_errors else 0.0
-        rmse = math.sqrt(sum(sq_errors) / len(sq_errors)) if sq_errors else 0.0
-        pmae = sum(perc_errors) / len(perc_errors) if perc_errors else None
-        mean_error = (
-            sum(signed_errors) / len(signed_errors) if signed_errors else 0.0
-        )
+
+def _metrics_from_sums(sums, sketches=None):
+    metrics = {}
+    by_nutrient = {}
+
+    for field in MACRO_FIELDS:
+        field_sums = sums[field]
+        count = int(field_sums["count"])
+        percent_count = int(field_sums["percentCount"])
+        low_ground_truth_exclusions = int(field_sums["lowGroundTruthCount"])
+
+        mae = float(field_sums["absSum"]) / count if count else 0.0
+        rmse = math.sqrt(float(field_sums["sqSum"]) / count) if count else 0.0
+        pmae = float(field_sums["percentSum"]) / percent_count if percent_count else None
+        mean_error = float(field_sums["signedSum"]) / count if count else 0.0
 
         metrics[f"macro_mae_{field}"] = mae
         metrics[f"macro_rmse_{field}"] = rmse
@@ -513,49 +1620,1429 @@ def _compute_metrics(records):
             "rmse": rmse,
             "pmae": pmae,
             "meanError": mean_error,
-            "count": len(abs_errors),
-            "percentCount": len(perc_errors),
-            "percentTotalCount": len(abs_errors),
+            "count": count,
+            "percentCount": percent_count,
+            "percentTotalCount": count,
             "percentExcludedCount": low_ground_truth_exclusions,
             "lowGroundTruthExcludedCount": low_ground_truth_exclusions,
         }
+        if sketches is not None:
+            quantiles = _error_quantiles(sketches[field])
+            for name, value in quantiles.items():
+                metrics[f"macro_{name}_ae_{field}"] = value
+            by_nutrient[field]["absErrorQuantiles"] = quantiles
 
     return metrics, by_nutrient
 
 
-def _handle_get_analysis():
+def _new_error_sketches():
+    # Bucket index (as a string, so sketches survive JSON) -> guess count.
+    return {field: {} for field in MACRO_FIELDS}
+
+
+def _sketch_bucket(value):
+    if value < QUANTILE_MIN_VALUE:
+        return 0
+    return math.ceil(math.log(value / QUANTILE_MIN_VALUE) / _SKETCH_LOG_GAMMA) + 1
+
+
+def _sketch_value(bucket):
+    """Midpoint (in relative terms) of a bucket's range."""
+    if bucket == 0:
+        return 0.0
+    return QUANTILE_MIN_VALUE * 2 * _SKETCH_GAMMA ** (bucket - 1) / (_SKETCH_GAMMA + 1)
+
+
+def _error_buckets(record):
+    ground_truth = record.get("groundTruth") or {}
+    guess = record.get("guess") or {}
+    return {
+        field: str(_sketch_bucket(abs(float(guess[field]) - float(ground_truth[field]))))
+        for field in MACRO_FIELDS
+        if field in ground_truth and field in guess
+    }
+
+
+def _accumulate_error_sketches(sketches, record):
+    for field, bucket in _error_buckets(record).items():
+        sketches[field][bucket] = sketches[field].get(bucket, 0) + 1
+
+
+def _merge_error_sketches(target, sketches):
+    for field, buckets in sketches.items():
+        merged = target[field]
+        for bucket, count in buckets.items():
+            merged[bucket] = merged.get(bucket, 0) + count
+
+
+def _sketch_quantile(buckets, fraction):
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = fraction * (total - 1)
+    seen = 0
+    for bucket in sorted(buckets, key=int):
+        seen += buckets[bucket]
+        if seen > rank:
+            return _sketch_value(int(bucket))
+    return None
+
+
+def _error_quantiles(buckets):
+    return {name: _sketch_quantile(buckets, fraction) for name, fraction in ERROR_QUANTILES.items()}
+
+
+def _percentile(sorted_values, fraction):
+    position = (len(sorted_values) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    weight = position - lower
+    return sorted_values[lower] * (1 - weight) + sorted_values[upper] * weight
+
+
+def _per_sample_sums(records, cold_group):
+    """Error sums per sampleId: archived sums plus the given hot records.
+    Cold entries are shared and only copied when a hot guess adds to them."""
+    per_sample = {sample_id: entry["sums"] for sample_id, entry in cold_group["samples"].items()}
+    owned = set()
+    for record in records:
+        sample_id = str(record.get("sampleId") or "")
+        if sample_id not in owned:
+            cold_sums = per_sample.get(sample_id)
+            per_sample[sample_id] = (
+                _copy_error_sums(cold_sums) if cold_sums is not None else _new_error_sums()
+            )
+            owned.add(sample_id)
+        _accumulate_error_sums(per_sample[sample_id], record)
+    return per_sample
+
+
+def _bootstrap_intervals(per_sample, resamples, seed, confidence):
+    """Percentile intervals for MAE/RMSE/pMAE from a sample-level bootstrap.
+
+    Guesses on the same plate are correlated, so whole samples are redrawn.
+    Each sample is reduced to its error sums once (`_per_sample_sums`); a
+    resample is then one index array gathered from every sum column with
+    `itemgetter`, so the per-resample work runs in C instead of a Python
+    loop over guesses.
+    """
+    if len(per_sample) < 2:
+        return None
+
+    # Sorted so a seed draws the same samples wherever their guesses are stored.
+    sample_sums = [per_sample[sample_id] for sample_id in sorted(per_sample)]
+    columns = {
+        field: {
+            stat: [float(sums[field][stat]) for sums in sample_sums]
+            for stat in ("count", "absSum", "sqSum", "percentCount", "percentSum")
+        }
+        for field in MACRO_FIELDS
+    }
+    draws = {field: {metric: [] for metric in BOOTSTRAP_METRICS} for field in MACRO_FIELDS}
+    rng = random.Random(seed)
+    positions = range(len(sample_sums))
+
+    for _ in range(resamples):
+        gather = itemgetter(*rng.choices(positions, k=len(sample_sums)))
+        for field, column in columns.items():
+            count = sum(gather(column["count"]))
+            if count:
+                draws[field]["mae"].append(sum(gather(column["absSum"])) / count)
+                draws[field]["rmse"].append(math.sqrt(sum(gather(column["sqSum"])) / count))
+            percent_count = sum(gather(column["percentCount"]))
+            if percent_count:
+                draws[field]["pmae"].append(sum(gather(column["percentSum"])) / percent_count)
+
+    tail = (1 - confidence) / 2
+    intervals = {}
+    for field, metrics in draws.items():
+        intervals[field] = {}
+        for metric, values in metrics.items():
+            if not values:
+                intervals[field][metric] = None
+                continue
+            values.sort()
+            intervals[field][metric] = [
+                _percentile(values, tail),
+                _percentile(values, 1 - tail),
+            ]
+    return intervals
+
+
+def _parse_bootstrap_params(params):
+    if not params.get("bootstrap"):
+        return None
+
+    try:
+        resamples = int(params["bootstrap"])
+    except ValueError as exc:
+        raise ValueError("bootstrap must be an integer number of resamples.") from exc
+    if not 1 <= resamples <= MAX_BOOTSTRAP_RESAMPLES:
+        raise ValueError(f"bootstrap must be between 1 and {MAX_BOOTSTRAP_RESAMPLES}.")
+
     try:
-        raw_records = _scan_all(guestimate_table)
+        confidence = float(params.get("confidence") or 0.95)
+    except ValueError as exc:
+        raise ValueError("confidence must be a number.") from exc
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1.")
+
+    return resamples, str(params.get("seed") or "0"), confidence
+
+
+def _cached_bootstrap_intervals(version, per_sample, resamples, seed, confidence):
+    cache_key = (version, resamples, seed, confidence)
+    if cache_key in bootstrap_cache:
+        bootstrap_cache.move_to_end(cache_key)
+        return bootstrap_cache[cache_key]
+
+    intervals = _bootstrap_intervals(per_sample, resamples, seed, confidence)
+    bootstrap_cache[cache_key] = intervals
+    if len(bootstrap_cache) > MAX_CACHED_BOOTSTRAPS:
+        bootstrap_cache.popitem(last=False)
+    return intervals
+
+
+def _rollup_sums(row):
+    return {
+        field: {stat: row.get(f"{stat}_{field}", 0) for stat in ERROR_SUM_STATS}
+        for field in MACRO_FIELDS
+    }
+
+
+def _rollup_sketches(row):
+    sketches = _new_error_sketches()
+    for name, count in row.items():
+        if not name.startswith(SKETCH_ATTRIBUTE_PREFIX):
+            continue
+        field, _separator, bucket = name[len(SKETCH_ATTRIBUTE_PREFIX):].rpartition("_")
+        if field in sketches:
+            sketches[field][bucket] = int(count)
+    return sketches
+
+
+def _sketch_attributes(sketches):
+    return {
+        f"{SKETCH_ATTRIBUTE_PREFIX}{field}_{bucket}": count
+        for field, buckets in sketches.items()
+        for bucket, count in buckets.items()
+    }
+
+
+def _is_overall_rollup(rollup_id):
+    rollup_id = str(rollup_id)
+    return rollup_id == OVERALL_ROLLUP_ID or rollup_id.startswith(
+        f"{OVERALL_ROLLUP_ID}{SHARD_SEPARATOR}"
+    )
+
+
+def _merge_rollup_rows(rows):
+    """Fold the overall row and its shards into one row (sums simply add)."""
+    merged = {"rollupId": OVERALL_ROLLUP_ID, "guessCount": 0}
+    for row in rows:
+        merged["guessCount"] += row.get("guessCount", 0)
+        for field in MACRO_FIELDS:
+            for stat in ERROR_SUM_STATS:
+                name = f"{stat}_{field}"
+                merged[name] = merged.get(name, 0) + row.get(name, 0)
+        for name, count in row.items():
+            if name.startswith(SKETCH_ATTRIBUTE_PREFIX):
+                merged[name] = merged.get(name, 0) + count
+        for name, pick in (("firstGuessAt", min), ("lastGuessAt", max)):
+            if row.get(name):
+                merged[name] = pick(merged[name], row[name]) if merged.get(name) else row[name]
+    return merged
+
+
+def _rollup_entry(row):
+    _metrics, by_nutrient = _metrics_from_sums(_rollup_sums(row), _rollup_sketches(row))
+    rollup_id = str(row["rollupId"])
+    entry = {
+        "guessCount": int(row.get("guessCount", 0)),
+        "firstGuessAt": row.get("firstGuessAt"),
+        "lastGuessAt": row.get("lastGuessAt"),
+        "byNutrient": by_nutrient,
+    }
+    if rollup_id.startswith(SESSION_ROLLUP_PREFIX):
+        entry = {"sessionId": rollup_id[len(SESSION_ROLLUP_PREFIX):], **entry}
+    return entry
+
+
+def _rebuild_session_rollups():
+    """Recompute every rollup row from the guestimate table in one scan."""
+    if session_rollup_table is None:
+        return {"message": "SESSION_ROLLUP_TABLE is not configured."}
+
+    index = (
+        _read_archive_object(_archive_key("index.json")) if GUESS_ARCHIVE_BUCKET else None
+    ) or {}
+    archived_batches = {batch["batch"] for batch in index.get("batches", [])}
+    hot_records = [
+        record
+        for record in _scan_projected(
+            guestimate_table,
+            (
+                "sampleId",
+                "objectKey",
+                "guess",
+                "groundTruth",
+                "guessedAt",
+                "clientSessionId",
+                "archivedIn",
+            ),
+        )
+        if record.get("archivedIn") not in archived_batches
+    ]
+
+    aggregates = {}
+    # Archived guesses are read back from their columnar files. Each guess
+    # lands in the same overall#<n> row it was added to when stored.
+    for record in chain(hot_records, _iter_archived_guesses(index)):
+        guessed_at = str(record.get("guessedAt") or "")
+        for rollup_id in _rollup_ids(
+            record.get("objectKey") or record["sampleId"],
+            record.get("guessedAt"),
+            record.get("clientSessionId"),
+        ):
+            row = aggregates.setdefault(
+                rollup_id,
+                {
+                    "sums": _new_error_sums(),
+                    "sketches": _new_error_sketches(),
+                    "guessCount": 0,
+                    "firstGuessAt": guessed_at,
+                    "lastGuessAt": guessed_at,
+                },
+            )
+            _accumulate_error_sums(row["sums"], record)
+            _accumulate_error_sketches(row["sketches"], record)
+            row["guessCount"] += 1
+            row["firstGuessAt"] = min(row["firstGuessAt"], guessed_at)
+            row["lastGuessAt"] = max(row["lastGuessAt"], guessed_at)
+
+    existing_ids = {
+        row["rollupId"] for row in _scan_projected(session_rollup_table, ("rollupId",))
+    }
+    with session_rollup_table.batch_writer() as batch:
+        for rollup_id, row in aggregates.items():
+            item = {
+                "rollupId": rollup_id,
+                "guessCount": row["guessCount"],
+                "firstGuessAt": row["firstGuessAt"],
+                "lastGuessAt": row["lastGuessAt"],
+            }
+            for field, field_sums in row["sums"].items():
+                for stat, amount in field_sums.items():
+                    item[f"{stat}_{field}"] = amount
+            item.update(_sketch_attributes(row["sketches"]))
+            batch.put_item(Item=_to_dynamodb(item))
+        for stale_id in existing_ids - set(aggregates):
+            batch.delete_item(Key={"rollupId": stale_id})
+
+    leaderboard_cache["expiresAt"] = 0.0
+    return {
+        "scannedCount": len(hot_records),
+        "archivedCount": sum(batch["guessCount"] for batch in index.get("batches", [])),
+        "rollupCount": len(aggregates),
+    }
+
+
+def _reshard_guesses():
+    """Move guesses whose partition key does not match GUESS_SHARDS, then
+    rebuild the rollups from the moved guesses."""
+    scanned = 0
+    moved = 0
+    for item in _scan_all(guestimate_table):
+        scanned += 1
+        object_key = item.get("objectKey") or item["sampleId"]
+        shard = _guess_shard(object_key, item["guessedAt"], item.get("clientSessionId"))
+        partition_key = _guess_partition_key(object_key, shard)
+        if partition_key == item["sampleId"]:
+            continue
+
+        moved_item = {key: value for key, value in item.items() if key not in ("objectKey", "shard")}
+        moved_item["sampleId"] = partition_key
+        if shard is not None:
+            moved_item["objectKey"] = object_key
+            moved_item["shard"] = shard
+        dynamodb.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    "Put": {
+                        "TableName": GUESTIMATE_TABLE_NAME,
+                        "Item": _to_dynamodb(moved_item),
+                        "ConditionExpression": "attribute_not_exists(sampleId)",
+                    }
+                },
+                {
+                    "Delete": {
+                        "TableName": GUESTIMATE_TABLE_NAME,
+                        "Key": {"sampleId": item["sampleId"], "guessedAt": item["guessedAt"]},
+                    }
+                },
+            ]
+        )
+        moved += 1
+
+    summary = {"scannedCount": scanned, "movedCount": moved, "shards": GUESS_SHARDS}
+    if session_rollup_table is not None:
+        summary["rollups"] = _rebuild_session_rollups()
+    return summary
+
+
+def _archive_key(name):
+    normalized_prefix = GUESS_ARCHIVE_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _read_archive_object(key):
+    try:
+        body = s3_client.get_object(Bucket=GUESS_ARCHIVE_BUCKET, Key=key)["Body"].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+    if key.endswith(".gz"):
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def _read_archive_index():
+    """The archive index and its ETag (None when there is no index yet), for
+    a conditional put of the next version."""
+    try:
+        result = s3_client.get_object(Bucket=GUESS_ARCHIVE_BUCKET, Key=_archive_key("index.json"))
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return {"batches": []}, None
+        raise
+    return json.loads(result["Body"].read()), result["ETag"]
+
+
+def _put_archive_object(key, payload):
+    s3_client.put_object(
+        Bucket=GUESS_ARCHIVE_BUCKET,
+        Key=key,
+        Body=gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), mtime=0),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+        CacheControl="public, max-age=31536000, immutable",
+    )
+
+
+def _copy_error_sums(sums):
+    return {field: dict(stats) for field, stats in sums.items()}
+
+
+def _add_error_sums(target, sums):
+    for field in MACRO_FIELDS:
+        for stat in ERROR_SUM_STATS:
+            target[field][stat] += sums[field][stat]
+
+
+def _latest_guesses(records):
+    return sorted(records, key=lambda record: str(record.get("guessedAt") or ""), reverse=True)[
+        :MAX_LATEST_GUESSES
+    ]
+
+
+def _empty_cold_group():
+    return {
+        "guessCount": 0,
+        "samples": {},
+        "sketches": _new_error_sketches(),
+        "latestGuesses": [],
+    }
+
+
+def _empty_cold_tier():
+    return {"batches": [], "all": _empty_cold_group(), "byVersion": {}, "sessionSamples": {}}
+
+
+def _merge_cold_group(target, group):
+    target["guessCount"] += group["guessCount"]
+    for sample_id, entry in group["samples"].items():
+        merged = target["samples"].setdefault(
+            sample_id, {"guessCount": 0, "sums": _new_error_sums()}
+        )
+        merged["guessCount"] += entry["guessCount"]
+        _add_error_sums(merged["sums"], entry["sums"])
+    _merge_error_sketches(
+        target.setdefault("sketches", _new_error_sketches()), group.get("sketches") or {}
+    )
+    target["latestGuesses"] = _latest_guesses(target["latestGuesses"] + group["latestGuesses"])
+
+
+def _partition_aggregate(records):
+    """Per manifest version and sample error sums for one archived partition."""
+    aggregate = {"guessCount": len(records), "groups": {}, "sessionSamples": {}}
+    for record in records:
+        group = aggregate["groups"].setdefault(
+            record.get("manifestVersion") or "", _empty_cold_group()
+        )
+        entry = group["samples"].setdefault(
+            record["sampleId"], {"guessCount": 0, "sums": _new_error_sums()}
+        )
+        entry["guessCount"] += 1
+        _accumulate_error_sums(entry["sums"], record)
+        _accumulate_error_sketches(group["sketches"], record)
+        group["guessCount"] += 1
+        group["latestGuesses"].append(record)
+        if record.get("clientSessionId"):
+            aggregate["sessionSamples"].setdefault(str(record["clientSessionId"]), set()).add(
+                record["sampleId"]
+            )
+
+    for group in aggregate["groups"].values():
+        group["latestGuesses"] = _latest_guesses(group["latestGuesses"])
+    aggregate["sessionSamples"] = {
+        session_id: sorted(sample_ids)
+        for session_id, sample_ids in aggregate["sessionSamples"].items()
+    }
+    return aggregate
+
+
+def _merge_partition_aggregate(cold, aggregate):
+    for manifest_version, group in aggregate["groups"].items():
+        _merge_cold_group(cold["byVersion"].setdefault(manifest_version, _empty_cold_group()), group)
+        _merge_cold_group(cold["all"], group)
+    for session_id, sample_ids in aggregate["sessionSamples"].items():
+        merged = cold["sessionSamples"].setdefault(session_id, [])
+        merged[:] = sorted(set(merged).union(sample_ids))
+
+
+def _guess_columns(records):
+    columns = {name: [record.get(name) for record in records] for name in ARCHIVE_SCALAR_COLUMNS}
+    for source in ARCHIVE_MACRO_SOURCES:
+        for field in MACRO_FIELDS:
+            columns[f"{source}.{field}"] = [
+                (record.get(source) or {}).get(field) for record in records
+            ]
+    for name in ARCHIVE_OBJECT_COLUMNS:
+        columns[name] = [record.get(name) for record in records]
+    return {"count": len(records), "columns": columns}
+
+
+def _guesses_from_columns(blob):
+    columns = blob["columns"]
+    for row in range(blob["count"]):
+        record = {
+            name: columns[name][row] for name in ARCHIVE_SCALAR_COLUMNS + ARCHIVE_OBJECT_COLUMNS
+        }
+        for source in ARCHIVE_MACRO_SOURCES:
+            record[source] = {
+                field: columns[f"{source}.{field}"][row]
+                for field in MACRO_FIELDS
+                if columns[f"{source}.{field}"][row] is not None
+            }
+        if len(record["guess"]) == len(record["groundTruth"]) == len(MACRO_FIELDS):
+            record["errors"] = _score_guess(record["guess"], record["groundTruth"])
+        yield record
+
+
+def _load_guess_archive(force=False):
+    """Return the merged cold tier, re-reading the archive index every
+    GUESS_ARCHIVE_REFRESH_SECONDS. Each compaction publishes the merge of
+    all its predecessors, so this is one small read however old the data."""
+    if not GUESS_ARCHIVE_BUCKET:
+        return _empty_cold_tier()
+
+    with guess_archive_lock:
+        checked_at = guess_archive["checkedAt"]
+        now = time.monotonic()
+        if (
+            not force
+            and checked_at is not None
+            and now - checked_at < GUESS_ARCHIVE_REFRESH_SECONDS
+        ):
+            return guess_archive["cold"]
+
+        index = _read_archive_object(_archive_key("index.json")) or {}
+        cumulative_key = index.get("cumulativeKey")
+        cold = guess_archive["cold"]
+        if cold is None or cold.get("key") != cumulative_key:
+            cold = (
+                _read_archive_object(cumulative_key) if cumulative_key else None
+            ) or _empty_cold_tier()
+            cold["key"] = cumulative_key
+            cold["batches"] = frozenset(cold["batches"])
+            cold["sessionSamples"] = {
+                session_id: set(sample_ids)
+                for session_id, sample_ids in cold["sessionSamples"].items()
+            }
+            guess_archive["cold"] = cold
+        guess_archive["checkedAt"] = now
+        return cold
+
+
+def _iter_guesses_before(cutoff):
+    scan_kwargs = {"FilterExpression": Attr("guessedAt").lt(cutoff)}
+    while True:
+        result = guestimate_table.scan(**scan_kwargs)
+        yield from result.get("Items", [])
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+
+def _seconds_left(context):
+    if context is None:
+        return math.inf
+    return context.get_remaining_time_in_millis() / 1000
+
+
+def _compact_guesses(context=None):
+    """Move guesses older than GUESS_HOT_DAYS into date-partitioned columnar
+    files plus per-partition aggregates in S3, then let TTL expire the hot
+    copies.
+
+    One scan feeds batches of at most GUESS_COMPACTION_MAX_ITEMS guesses.
+    The run stops before a batch once less than
+    GUESS_COMPACTION_RESERVE_SECONDS of the invocation is left, and the
+    next run picks up whatever is still unarchived or unexpired."""
+    if not GUESS_ARCHIVE_BUCKET:
+        return {"message": "GUESS_ARCHIVE_BUCKET is not configured."}
+
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=GUESS_HOT_DAYS)).date().isoformat()
+    guesses = _iter_guesses_before(cutoff)
+    summary = {
+        "cutoff": cutoff,
+        "batches": [],
+        "archivedCount": 0,
+        "expiredCount": 0,
+        "partitionCount": 0,
+        "complete": False,
+    }
+    while _seconds_left(context) > GUESS_COMPACTION_RESERVE_SECONDS:
+        result = _compact_guess_batch(cutoff, guesses, context)
+        if result.get("batch"):
+            summary["batches"].append(result["batch"])
+        for name in ("archivedCount", "expiredCount", "partitionCount"):
+            summary[name] += result.get(name, 0)
+        if result.get("conflict"):
+            summary["conflict"] = True
+            break
+        if result["scanComplete"]:
+            summary["complete"] = True
+            break
+    return summary
+
+
+def _compact_guess_batch(cutoff, guesses, context):
+    """Archive the next batch of `guesses` and expire hot copies whose batch
+    is already indexed.
+
+    Everything in S3 is written before the index that lists it, and the
+    index is replaced only if no other run changed it since it was read.
+    Hot copies are marked with the batch before the index is written and
+    readers skip them only once the index lists it, so nothing is counted
+    twice. They get `expiresAt` only after that, here or on a later run
+    if this one stops in between, so TTL never deletes a guess whose
+    archived copy is not indexed. A run that stops before the index is
+    written leaves unlisted files, and its guesses are archived again."""
+    index, index_etag = _read_archive_index()
+    archived_batches = {batch["batch"] for batch in index["batches"]}
+    candidates = []
+    unexpired = []
+    scan_complete = True
+    for item in guesses:
+        if item.get("archivedIn") not in archived_batches:
+            candidates.append(item)
+        elif "expiresAt" not in item:
+            unexpired.append(item)
+        if (
+            len(candidates) >= GUESS_COMPACTION_MAX_ITEMS
+            or len(unexpired) >= GUESS_COMPACTION_MAX_ITEMS
+            or _seconds_left(context) < GUESS_COMPACTION_RESERVE_SECONDS
+        ):
+            scan_complete = False
+            break
+    expired_count = _expire_archived_guesses(unexpired, context)
+    if not candidates:
+        return {"archivedCount": 0, "expiredCount": expired_count, "scanComplete": scan_complete}
+    if _seconds_left(context) < GUESS_COMPACTION_RESERVE_SECONDS:
+        # Not enough time to publish this batch; the next run collects it again.
+        return {"archivedCount": 0, "expiredCount": expired_count, "scanComplete": False}
+    candidates.sort(key=lambda item: (item["guessedAt"], item["sampleId"]))
+
+    batch_id = hashlib.sha256(
+        "\n".join(f"{item['sampleId']}|{item['guessedAt']}" for item in candidates).encode("utf-8")
+    ).hexdigest()[:16]
+    records_by_date = {}
+    for item in candidates:
+        record = _unshard_guess(_to_serializable(item))
+        record.pop("archivedIn", None)
+        record.pop("expiresAt", None)
+        records_by_date.setdefault(record["guessedAt"][:10], []).append(record)
+
+    cumulative = (
+        _read_archive_object(index["cumulativeKey"]) if index.get("cumulativeKey") else None
+    ) or _empty_cold_tier()
+    partitions = []
+    for date, records in sorted(records_by_date.items()):
+        data_key = _archive_key(f"date={date}/guesses-{batch_id}.json.gz")
+        aggregate_key = _archive_key(f"date={date}/aggregate-{batch_id}.json.gz")
+        aggregate = _partition_aggregate(records)
+        _put_archive_object(data_key, _guess_columns(records))
+        _put_archive_object(aggregate_key, aggregate)
+        _merge_partition_aggregate(cumulative, aggregate)
+        partitions.append(
+            {
+                "date": date,
+                "dataKey": data_key,
+                "aggregateKey": aggregate_key,
+                "guessCount": len(records),
+            }
+        )
+    cumulative["batches"] = sorted(set(cumulative["batches"]) | {batch_id})
+    cumulative_key = _archive_key(f"cumulative/aggregate-{batch_id}.json.gz")
+    _put_archive_object(cumulative_key, cumulative)
+
+    # Marked copies are skipped by readers once the index lists the batch.
+    marked = [{**item, "archivedIn": batch_id} for item in candidates]
+    for item in marked:
+        item.pop("expiresAt", None)
+    with guestimate_table.batch_writer() as batch:
+        for item in marked:
+            batch.put_item(Item=item)
+
+    index["batches"].append(
+        {
+            "batch": batch_id,
+            "cutoff": cutoff,
+            "guessCount": len(candidates),
+            "partitions": partitions,
+            "compactedAt": datetime.now(timezone.utc).isoformat(),
+        }
+    )
+    index["cumulativeKey"] = cumulative_key
+    condition = {"IfMatch": index_etag} if index_etag else {"IfNoneMatch": "*"}
+    try:
+        s3_client.put_object(
+            Bucket=GUESS_ARCHIVE_BUCKET,
+            Key=_archive_key("index.json"),
+            Body=json.dumps(index).encode("utf-8"),
+            ContentType="application/json",
+            CacheControl="no-cache",
+            **condition,
+        )
+    except ClientError as error:
+        if error.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+        # Another run published first; this batch stays unlisted and its
+        # guesses (still without expiresAt) are archived again next time.
+        logger.warning("Archive index changed during compaction; batch %s not published.", batch_id)
+        return {
+            "archivedCount": 0,
+            "expiredCount": expired_count,
+            "conflict": True,
+            "scanComplete": False,
+        }
+
+    _load_guess_archive(force=True)
+    expired_count += _expire_archived_guesses(marked, context)
+    return {
+        "batch": batch_id,
+        "archivedCount": len(candidates),
+        "expiredCount": expired_count,
+        "partitionCount": len(partitions),
+        "scanComplete": scan_complete,
+    }
+
+
+def _expire_archived_guesses(items, context=None):
+    """Set TTL on hot copies whose batch the archive index already lists,
+    stopping near the invocation's timeout; returns how many were set."""
+    expires_at = int(time.time()) + GUESS_ARCHIVE_EXPIRY_SECONDS
+    expired = 0
+    with guestimate_table.batch_writer() as batch:
+        for item in items:
+            if _seconds_left(context) < COMPACTION_FINAL_MARGIN_SECONDS:
+                break
+            batch.put_item(Item={**item, "expiresAt": expires_at})
+            expired += 1
+    return expired
+
+
+def _iter_archived_guesses(index):
+    for batch in index.get("batches", []):
+        for partition in batch["partitions"]:
+            blob = _read_archive_object(partition["dataKey"])
+            if blob is None:
+                raise LookupError(f"Archived partition {partition['dataKey']} is missing.")
+            yield from _guesses_from_columns(blob)
+
+
+def _handle_get_sample_guesses(event):
+    params = (event or {}).get("queryStringParameters") or {}
+    object_key = str(params.get("sampleId") or params.get("objectKey") or "").strip()
+    if not object_key:
+        return _response(400, {"message": "sampleId is required."})
+
+    try:
+        cold = _load_guess_archive()
+        records = [
+            _to_serializable(record)
+            for record in _query_sample_guesses(object_key)
+            if record.get("archivedIn") not in cold["batches"]
+        ]
+    except ClientError as error:
+        logger.exception("Failed to query guesses for %s: %s", object_key, error)
+        return _response(500, {"message": "Could not read guesses."})
+
+    # Archived guesses count toward the metrics; only hot ones are listed.
+    archived = cold["all"]["samples"].get(object_key) or {"guessCount": 0}
+    cold_group = {"samples": {object_key: archived}} if archived["guessCount"] else _empty_cold_group()
+    metrics, by_nutrient = _metrics_from_sums(
+        _per_sample_sums(records, cold_group).get(object_key) or _new_error_sums()
+    )
+    return _response(
+        200,
+        {
+            "sampleId": object_key,
+            "guessCount": len(records) + archived["guessCount"],
+            "archivedGuessCount": archived["guessCount"],
+            "metrics": metrics,
+            "byNutrient": by_nutrient,
+            "guesses": [
+                {
+                    "guessedAt": record.get("guessedAt"),
+                    "clientSessionId": record.get("clientSessionId"),
+                    "guess": record.get("guess"),
+                    "groundTruth": record.get("groundTruth"),
+                    "errors": record.get("errors"),
+                }
+                for record in records
+            ],
+        },
+    )
+
+
+def _load_leaderboard_entries():
+    """Rollup rows are one per session, so this read never touches guesses."""
+    now = time.monotonic()
+    if leaderboard_cache["entries"] is not None and now < leaderboard_cache["expiresAt"]:
+        return leaderboard_cache["entries"]
+
+    entries = {"overall": None, "sessions": []}
+    overall_rows = []
+    for row in _scan_all(session_rollup_table):
+        row = _to_serializable(row)
+        if _is_overall_rollup(row["rollupId"]):
+            overall_rows.append(row)
+            continue
+        entry = _rollup_entry(row)
+        if "sessionId" in entry:
+            entries["sessions"].append(entry)
+    if overall_rows:
+        entries["overall"] = _rollup_entry(_merge_rollup_rows(overall_rows))
+
+    leaderboard_cache["entries"] = entries
+    leaderboard_cache["expiresAt"] = now + LEADERBOARD_CACHE_SECONDS
+    return entries
+
+
+def _parse_leaderboard_params(params):
+    metric = str(params.get("metric") or "pmae").strip().lower()
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(LEADERBOARD_METRICS)}.")
+
+    field = str(params.get("field") or "kcal").strip()
+    if field not in MACRO_FIELDS:
+        raise ValueError(f"field must be one of: {', '.join(MACRO_FIELDS)}.")
+
+    try:
+        min_count = int(params.get("minCount") or LEADERBOARD_MIN_COUNT)
+        limit = int(params.get("limit") or 20)
+    except ValueError as exc:
+        raise ValueError("minCount and limit must be integers.") from exc
+    if min_count < 1:
+        raise ValueError("minCount must be at least 1.")
+    if not 1 <= limit <= MAX_LEADERBOARD_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_LEADERBOARD_SIZE}.")
+
+    return metric, field, min_count, limit
+
+
+def _handle_get_leaderboard(event):
+    if session_rollup_table is None:
+        return _response(404, {"message": "Leaderboard is not enabled."})
+
+    params = (event or {}).get("queryStringParameters") or {}
+    try:
+        metric, field, min_count, limit = _parse_leaderboard_params(params)
+    except ValueError as error:
+        return _response(400, {"message": str(error)})
+
+    session_id = str(params.get("sessionId") or "").strip()
+    try:
+        if session_id:
+            row = session_rollup_table.get_item(
+                Key={"rollupId": f"{SESSION_ROLLUP_PREFIX}{session_id}"}
+            ).get("Item")
+            if not row:
+                return _response(404, {"message": "No guesses for this session."})
+            return _response(200, _rollup_entry(_to_serializable(row)))
+
+        entries = _load_leaderboard_entries()
+    except ClientError as error:
+        logger.exception("Failed to read session rollups: %s", error)
+        return _response(500, {"message": "Could not read leaderboard."})
+
+    # pMAE only averages guesses whose ground truth passes the percent
+    # filter, so its threshold applies to that count.
+    count_key = "percentCount" if metric == "pmae" else "count"
+    eligible = []
+    for entry in entries["sessions"]:
+        stats = entry["byNutrient"][field]
+        if stats[count_key] >= min_count and stats[metric] is not None:
+            eligible.append(entry)
+    eligible.sort(
+        key=lambda entry: (
+            entry["byNutrient"][field][metric],
+            -entry["byNutrient"][field][count_key],
+            entry["sessionId"],
+        )
+    )
+
+    ranked = [
+        {
+            "rank": rank,
+            "sessionId": entry["sessionId"],
+            "value": entry["byNutrient"][field][metric],
+            "count": entry["byNutrient"][field][count_key],
+            "guessCount": entry["guessCount"],
+            "lastGuessAt": entry["lastGuessAt"],
+            "byNutrient": entry["byNutrient"],
+        }
+        for rank, entry in enumerate(eligible[:limit], start=1)
+    ]
+
+    return _encoded_response(
+        event,
+        200,
+        {
+            "metric": metric,
+            "field": field,
+            "minCount": min_count,
+            "entries": ranked,
+            "eligibleCount": len(eligible),
+            "sessionCount": len(entries["sessions"]),
+            "overall": entries["overall"],
+        },
+    )
+
+
+def _column_error_sums(guess_columns, truth_columns):
+    """Error sums for parallel guess/ground-truth columns, one field at a time.
+
+    Produces the same sums as `_accumulate_error_sums` over equivalent
+    records, so run metrics line up with the human analysis.
+    """
+    sums = _new_error_sums()
+    for field in MACRO_FIELDS:
+        guesses = guess_columns[field]
+        truths = truth_columns[field]
+        errors = list(map(sub, guesses, truths))
+        abs_errors = list(map(abs, errors))
+        keep = [truth >= PERCENT_MIN_GROUND_TRUTH[field] for truth in truths]
+        percent_errors = list(map(truediv, compress(abs_errors, keep), compress(truths, keep)))
+
+        sums[field].update(
+            count=len(errors),
+            absSum=sum(abs_errors),
+            sqSum=sum(map(mul, errors, errors)),
+            signedSum=sum(errors),
+            percentCount=len(percent_errors),
+            percentSum=sum(percent_errors),
+            lowGroundTruthCount=len(errors) - len(percent_errors),
+        )
+    return sums
+
+
+def _batch_get_metadata(object_keys):
+    records = {}
+    for start in range(0, len(object_keys), 100):
+        request_items = {
+            METADATA_TABLE_NAME: {
+                "Keys": [{"objectKey": key} for key in object_keys[start:start + 100]],
+                "ProjectionExpression": "objectKey, #items",
+                "ExpressionAttributeNames": {"#items": "items"},
+            }
+        }
+        while request_items:
+            result = dynamodb.batch_get_item(RequestItems=request_items)
+            for record in result.get("Responses", {}).get(METADATA_TABLE_NAME, []):
+                records[record["objectKey"]] = _to_serializable(record)
+            request_items = result.get("UnprocessedKeys") or None
+    return records
+
+
+def _handle_post_run(event):
+    try:
+        payload = _parse_event_body(event)
+    except ValueError as error:
+        return _response(400, {"message": str(error)})
+
+    name = str(payload.get("name") or "").strip()
+    if not name or len(name) > 128:
+        return _response(400, {"message": "name is required (at most 128 characters)."})
+
+    now = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+    run = {
+        "runId": uuid.uuid4().hex,
+        "name": name,
+        "model": str(payload.get("model") or "").strip() or None,
+        "notes": str(payload.get("notes") or "").strip() or None,
+        "manifestVersion": str(payload.get("manifestVersion") or "").strip() or None,
+        "createdAt": now,
+        "updatedAt": now,
+        "predictionCount": 0,
+        "batchCount": 0,
+    }
+    try:
+        prediction_run_table.put_item(Item=_to_dynamodb({**run, "sortKey": RUN_HEADER_KEY}))
+    except ClientError as error:
+        logger.exception("Failed to register prediction run %s: %s", name, error)
+        return _response(500, {"message": "Could not register run."})
+
+    return _response(201, run)
+
+
+def _parse_predictions(payload):
+    predictions = payload.get("predictions")
+    if not isinstance(predictions, list) or not predictions:
+        raise ValueError("predictions must be a non-empty list.")
+    if len(predictions) > MAX_PREDICTION_BATCH:
+        raise ValueError(f"At most {MAX_PREDICTION_BATCH} predictions per request.")
+
+    accepted = {}
+    rejected = []
+    for index, prediction in enumerate(predictions):
+        object_key = ""
+        try:
+            if not isinstance(prediction, dict):
+                raise ValueError("Each prediction must be an object.")
+            object_key = str(prediction.get("objectKey") or prediction.get("sampleId") or "").strip()
+            if not object_key:
+                raise ValueError("objectKey is required.")
+            if object_key in accepted:
+                raise ValueError("Duplicate objectKey in this batch.")
+            accepted[object_key] = _normalize_guess(prediction)
+        except ValueError as error:
+            rejected.append({"index": index, "objectKey": object_key or None, "message": str(error)})
+    return accepted, rejected
+
+
+def _handle_post_predictions(event, run_id):
+    try:
+        payload = _parse_event_body(event)
+        accepted, rejected = _parse_predictions(payload)
+    except ValueError as error:
+        return _response(400, {"message": str(error)})
+
+    batch_id = str(payload.get("batchId") or uuid.uuid4().hex).strip()
+    if len(batch_id) > 128 or not batch_id.isprintable():
+        return _response(400, {"message": "batchId must be at most 128 printable characters."})
+
+    try:
+        run = prediction_run_table.get_item(
+            Key={"runId": run_id, "sortKey": RUN_HEADER_KEY}
+        ).get("Item")
+        records = _batch_get_metadata(list(accepted)) if run else {}
+    except ClientError as error:
+        logger.exception("Failed to read run %s or its samples: %s", run_id, error)
+        return _response(500, {"message": "Could not read samples."})
+    if not run:
+        return _response(404, {"message": "Run not found."})
+
+    object_keys = []
+    guess_columns = {field: [] for field in MACRO_FIELDS}
+    truth_columns = {field: [] for field in MACRO_FIELDS}
+    for object_key, guess in accepted.items():
+        record = records.get(object_key)
+        if not record:
+            rejected.append({"objectKey": object_key, "message": "Sample not found."})
+            continue
+        try:
+            ground_truth, _source_items = _ground_truth_nutrition(record)
+        except ValueError as error:
+            rejected.append({"objectKey": object_key, "message": str(error)})
+            continue
+        except RuntimeError as error:
+            # Upstream trouble is transient; store nothing so the batch can be resent.
+            return _response(502, {"message": str(error)})
+
+        object_keys.append(object_key)
+        for field in MACRO_FIELDS:
+            guess_columns[field].append(guess[field])
+            truth_columns[field].append(float(ground_truth[field]))
+
+    if not object_keys:
+        return _response(400, {"message": "No predictions could be scored.", "rejected": rejected})
+
+    now = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+    batch_item = {
+        "runId": run_id,
+        "sortKey": f"{BATCH_KEY_PREFIX}{batch_id}",
+        "submittedAt": now,
+        "objectKeys": object_keys,
+        **{f"guess_{field}": column for field, column in guess_columns.items()},
+        **{f"truth_{field}": column for field, column in truth_columns.items()},
+    }
+    try:
+        dynamodb.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    "Put": {
+                        "TableName": PREDICTION_RUN_TABLE_NAME,
+                        "Item": _to_dynamodb(batch_item),
+                        "ConditionExpression": "attribute_not_exists(sortKey)",
+                    }
+                },
+                {
+                    "Update": {
+                        "TableName": PREDICTION_RUN_TABLE_NAME,
+                        "Key": {"runId": run_id, "sortKey": RUN_HEADER_KEY},
+                        "UpdateExpression": (
+                            "SET updatedAt = :now ADD predictionCount :count, batchCount :one"
+                        ),
+                        "ConditionExpression": "attribute_exists(runId)",
+                        "ExpressionAttributeValues": _to_dynamodb(
+                            {":now": now, ":count": len(object_keys), ":one": 1}
+                        ),
+                    }
+                },
+            ]
+        )
+    except ClientError as error:
+        reasons = error.response.get("CancellationReasons") or [{}]
+        if reasons[0].get("Code") == "ConditionalCheckFailed":
+            return _response(409, {"message": f"Batch {batch_id} was already submitted."})
+        logger.exception("Failed to store predictions for run %s: %s", run_id, error)
+        return _response(500, {"message": "Could not save predictions."})
+
+    _metrics, by_nutrient = _metrics_from_sums(_column_error_sums(guess_columns, truth_columns))
+    return _response(
+        201,
+        {
+            "runId": run_id,
+            "batchId": batch_id,
+            "acceptedCount": len(object_keys),
+            "rejected": rejected,
+            "byNutrient": by_nutrient,
+        },
+    )
+
+
+def _load_run_columns(run_id):
+    """Concatenate a run's batches into columns; a later batch's prediction
+    for the same sample replaces the earlier one."""
+    batches = []
+    query_kwargs = {
+        "KeyConditionExpression": Key("runId").eq(run_id) & Key("sortKey").begins_with(BATCH_KEY_PREFIX),
+    }
+    while True:
+        result = prediction_run_table.query(**query_kwargs)
+        batches.extend(result.get("Items", []))
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    batches.sort(key=lambda batch: batch["submittedAt"])
+
+    object_keys = []
+    columns = {f"{kind}_{field}": [] for kind in ("guess", "truth") for field in MACRO_FIELDS}
+    for batch in batches:
+        object_keys.extend(batch["objectKeys"])
+        for name, column in columns.items():
+            column.extend(map(float, batch[name]))
+
+    latest = {object_key: position for position, object_key in enumerate(object_keys)}
+    if len(latest) < len(object_keys):
+        positions = sorted(latest.values())
+        columns = {name: [column[position] for position in positions] for name, column in columns.items()}
+
+    return len(latest), len(batches), columns
+
+
+def _load_overall_rollup():
+    """The overall row plus any shard rows, merged; None when there are none."""
+    # Also covers rows split by GUESS_SHARDS before a rebuild_rollups.
+    rollup_ids = [OVERALL_ROLLUP_ID] + [
+        f"{OVERALL_ROLLUP_ID}{SHARD_SEPARATOR}{shard}"
+        for shard in range(max(GUESS_SHARDS, OVERALL_ROLLUP_SHARDS))
+    ]
+
+    rows = []
+    # BatchGetItem takes at most 100 keys per call.
+    for start in range(0, len(rollup_ids), 100):
+        request_items = {
+            SESSION_ROLLUP_TABLE_NAME: {
+                "Keys": [{"rollupId": rollup_id} for rollup_id in rollup_ids[start:start + 100]]
+            }
+        }
+        while request_items:
+            result = dynamodb.batch_get_item(RequestItems=request_items)
+            rows.extend(result.get("Responses", {}).get(SESSION_ROLLUP_TABLE_NAME, []))
+            request_items = result.get("UnprocessedKeys") or None
+    if not rows:
+        return None
+    return _merge_rollup_rows([_to_serializable(row) for row in rows])
+
+
+def _human_baseline():
+    if session_rollup_table is not None:
+        row = _load_overall_rollup()
+        if row:
+            entry = _rollup_entry(row)
+            return {"guessCount": entry["guessCount"], "byNutrient": entry["byNutrient"]}
+
+    cold = _load_guess_archive()
+    records = [
+        _to_serializable(record)
+        for record in _scan_guesses()
+        if record.get("archivedIn") not in cold["batches"]
+    ]
+    sums = _new_error_sums()
+    for sample_sums in _per_sample_sums(records, cold["all"]).values():
+        _add_error_sums(sums, sample_sums)
+    sketches = _new_error_sketches()
+    _merge_error_sketches(sketches, cold["all"].get("sketches") or {})
+    for record in records:
+        _accumulate_error_sketches(sketches, record)
+    _metrics, by_nutrient = _metrics_from_sums(sums, sketches)
+    return {"guessCount": len(records) + cold["all"]["guessCount"], "byNutrient": by_nutrient}
+
+
+def _handle_compare_runs(event):
+    params = (event or {}).get("queryStringParameters") or {}
+    run_ids = [run_id.strip() for run_id in str(params.get("runIds") or "").split(",") if run_id.strip()]
+    if not run_ids:
+        return _response(400, {"message": "runIds is required."})
+    if len(run_ids) > MAX_COMPARED_RUNS:
+        return _response(400, {"message": f"At most {MAX_COMPARED_RUNS} runs can be compared."})
+
+    runs = []
+    try:
+        for run_id in dict.fromkeys(run_ids):
+            header = prediction_run_table.get_item(
+                Key={"runId": run_id, "sortKey": RUN_HEADER_KEY}
+            ).get("Item")
+            if not header:
+                return _response(404, {"message": f"Run {run_id} not found."})
+
+            sample_count, batch_count, columns = _load_run_columns(run_id)
+            _metrics, by_nutrient = _metrics_from_sums(
+                _column_error_sums(
+                    {field: columns[f"guess_{field}"] for field in MACRO_FIELDS},
+                    {field: columns[f"truth_{field}"] for field in MACRO_FIELDS},
+                )
+            )
+            header = _to_serializable(header)
+            runs.append(
+                {
+                    "runId": run_id,
+                    "name": header.get("name"),
+                    "model": header.get("model"),
+                    "manifestVersion": header.get("manifestVersion"),
+                    "createdAt": header.get("createdAt"),
+                    "updatedAt": header.get("updatedAt"),
+                    "batchCount": batch_count,
+                    "sampleCount": sample_count,
+                    "byNutrient": by_nutrient,
+                }
+            )
+        baseline = _human_baseline()
+    except ClientError as error:
+        logger.exception("Failed to read prediction runs: %s", error)
+        return _response(500, {"message": "Could not read prediction runs."})
+
+    return _encoded_response(event, 200, {"runs": runs, "humanBaseline": baseline})
+
+
+def _run_id_from_path(event):
+    path_params = (event or {}).get("pathParameters") or {}
+    if path_params.get("runId"):
+        return str(path_params["runId"])
+    parts = _path(event).rstrip("/").split("/")
+    return parts[-2] if len(parts) >= 2 else ""
+
+
+def _analysis_version(manifest_version, cold, bootstrap):
+    """Validator for the analysis from cheap state, or None without rollups.
+
+    Every guess bumps the overall rollup in its own transaction and every
+    compaction publishes a new cumulative aggregate, so their count, last
+    guess time and key change whenever the analysis can. It is read before
+    the guesses, so a response is never tagged newer than its contents."""
+    if session_rollup_table is None:
+        return None
+    overall = _load_overall_rollup() or {}
+    version = _version_etag(
+        "analysis",
+        manifest_version,
+        cold.get("key") or "",
+        str(overall.get("guessCount", 0)),
+        str(overall.get("lastGuessAt") or ""),
+    )
+    if bootstrap:
+        # Intervals depend on the resampling parameters as well as the data.
+        version = _version_etag(version, *bootstrap)
+    return version
+
+
+def _handle_get_analysis(event):
+    params = (event or {}).get("queryStringParameters") or {}
+    try:
+        bootstrap = _parse_bootstrap_params(params)
+    except ValueError as error:
+        return _response(400, {"message": str(error)})
+
+    manifest_version = str(params.get("manifestVersion") or "").strip()
+    try:
+        cold = _load_guess_archive()
+        version = _analysis_version(manifest_version, cold, bootstrap)
+        if version is not None and _etag_matches(event, version):
+            return _not_modified(version)
+        raw_records = _scan_guesses()
     except ClientError as error:
         logger.exception("Failed to scan guestimate table: %s", error)
         return _response(500, {"message": "Could not read guestimate results."})
+    # Archived guesses come from the cold tier's aggregates; their hot
+    # copies only linger until TTL removes them.
+    raw_records = [
+        record for record in raw_records if record.get("archivedIn") not in cold["batches"]
+    ]
+    cold_group = cold["all"]
+    if manifest_version:
+        # Only guesses made against that published dataset version.
+        raw_records = [
+            record for record in raw_records if record.get("manifestVersion") == manifest_version
+        ]
+        cold_group = cold["byVersion"].get(manifest_version) or _empty_cold_group()
+
+    if version is None:
+        # Without rollups, guesses are versioned by their own keys: they are
+        # append-only and archived batches immutable.
+        version = _version_etag(
+            "analysis",
+            manifest_version,
+            *sorted(cold["batches"]),
+            *sorted(f"{record.get('sampleId')}|{record.get('guessedAt')}" for record in raw_records),
+        )
+        if bootstrap:
+            version = _version_etag(version, *bootstrap)
+        if _etag_matches(event, version):
+            return _not_modified(version)
 
     records = [_to_serializable(record) for record in raw_records]
-    metrics, by_nutrient = _compute_metrics(records)
-    unique_samples = {record.get("sampleId") for record in records if record.get("sampleId")}
-
-    latest = sorted(
-        records,
-        key=lambda record: str(record.get("guessedAt") or ""),
-        reverse=True,
-    )[:10]
+    per_sample = _per_sample_sums(records, cold_group)
+    sums = _new_error_sums()
+    for sample_sums in per_sample.values():
+        _add_error_sums(sums, sample_sums)
+    sketches = _new_error_sketches()
+    _merge_error_sketches(sketches, cold_group.get("sketches") or {})
+    for record in records:
+        _accumulate_error_sketches(sketches, record)
+    metrics, by_nutrient = _metrics_from_sums(sums, sketches)
+    bootstrap_summary = None
+    if bootstrap:
+        resamples, seed, confidence = bootstrap
+        intervals = _cached_bootstrap_intervals(version, per_sample, resamples, seed, confidence)
+        for field, stats in by_nutrient.items():
+            stats["confidenceIntervals"] = (intervals or {}).get(field)
+        bootstrap_summary = {
+            "resamples": resamples,
+            "seed": seed,
+            "confidence": confidence,
+            "resampleUnit": "sampleId",
+        }
+    sample_count = sum(1 for sample_id in per_sample if sample_id)
+    latest = _latest_guesses(records + cold_group["latestGuesses"])
 
-    return _response(
+    return _encoded_response(
+        event,
         200,
         {
-            "guessCount": len(records),
-            "sampleCount": len(unique_samples),
+            "guessCount": len(records) + cold_group["guessCount"],
+            "archivedGuessCount": cold_group["guessCount"],
+            "sampleCount": sample_count,
             "metrics": metrics,
             "byNutrient": by_nutrient,
             "percentErrorFilter": {
                 "minGroundTruth": PERCENT_MIN_GROUND_TRUTH,
             },
+            "quantileRelativeAccuracy": QUANTILE_RELATIVE_ACCURACY,
             "latestGuesses": latest,
+            "bootstrap": bootstrap_summary,
+            "manifestVersion": manifest_version or None,
         },
+        version,
     )
 
 
-def lambda_handler(event, _context):
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        # Ground truth comes from the catalog mirror and orderings from the
+        # sample index, so the first guess pays for neither.
+        _load_catalog_mirror()
+        primed["catalogItems"] = len(catalog_mirror["items"])
+        if metadata_table is not None and guestimate_table is not None:
+            sample_index = _load_sample_index()
+            primed["samples"] = len(sample_index["records"])
+            primed["manifestVersion"] = sample_index["manifestVersion"]
+        if session_rollup_table is not None:
+            primed["leaderboardSessions"] = len(_load_leaderboard_entries()["sessions"])
+        if GUESS_ARCHIVE_BUCKET:
+            primed["archivedGuesses"] = _load_guess_archive()["all"]["guessCount"]
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if (event or {}).get("action") == "rebuild_rollups":
+        # Direct invocation (console/CLI) used to backfill or reconcile rollups.
+        summary = _rebuild_session_rollups()
+        logger.info("Rebuilt session rollups: %s", summary)
+        return summary
+    if (event or {}).get("action") == "reshard_guesses":
+        # Direct invocation after changing GUESS_SHARDS.
+        summary = _reshard_guesses()
+        logger.info("Resharded guesses: %s", summary)
+        return summary
+    if (event or {}).get("action") == "compact_guesses":
+        # Scheduled (EventBridge) move of old guesses to the S3 cold tier.
+        summary = _compact_guesses(context)
+        logger.info("Compacted guesses: %s", summary)
+        return summary
+
     if _http_method(event) == "OPTIONS":
         return {
             "statusCode": 204,
@@ -581,6 +3068,19 @@ def lambda_handler(event, _context):
     if method == "POST" and path.endswith("/guestimate/guess"):
         return _handle_post_guess(event)
     if method == "GET" and path.endswith("/guestimate/analysis"):
-        return _handle_get_analysis()
+        return _handle_get_analysis(event)
+    if method == "GET" and path.endswith("/guestimate/leaderboard"):
+        return _handle_get_leaderboard(event)
+    if method == "GET" and path.endswith("/guestimate/guesses"):
+        return _handle_get_sample_guesses(event)
+    if "/guestimate/runs" in path:
+        if prediction_run_table is None:
+            return _response(404, {"message": "Prediction runs are not enabled."})
+        if method == "POST" and path.endswith("/guestimate/runs"):
+            return _handle_post_run(event)
+        if method == "POST" and path.endswith("/predictions"):
+            return _handle_post_predictions(event, _run_id_from_path(event))
+        if method == "GET" and path.endswith("/guestimate/runs/compare"):
+            return _handle_compare_runs(event)
 
     return _response(404, {"message": "Guestimate endpoint not found."})
@@ -3,10 +3,13 @@ import base64
 import json
 import logging
 import os
+import time
 
 import boto3
 from botocore.exceptions import ClientError
 
+import traffic_capture
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -18,6 +21,14 @@ AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
 
 s3_client = boto3.client("s3")
 
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "presign_download"
+
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
@@ -73,7 +84,37 @@ def _extract_auth_token(event):
     return token
 
 
-def lambda_handler(event, _context):
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        s3_client.head_bucket(Bucket=S3_BUCKET)
+        primed["bucket"] = S3_BUCKET
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
     if (event or {}).get("httpMethod") == "OPTIONS":
         # Allow CORS preflight to succeed quickly.
         return {
@@ -3,12 +3,15 @@ import base64
 import json
 import logging
 import os
+import time
 from pathlib import Path
 from uuid import uuid4
 
 import boto3
 from botocore.exceptions import ClientError
 
+import traffic_capture
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
@@ -17,8 +20,21 @@ UPLOAD_PREFIX = os.environ.get("UPLOAD_PREFIX", "v1/")
 URL_EXPIRATION_SECONDS = int(os.environ.get("URL_EXPIRATION_SECONDS", "900"))
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
 
+# S3 multipart limits: parts are numbered 1..10000 and every part except the
+# last must be at least 5 MiB.
+MAX_MULTIPART_PARTS = 10000
+MIN_MULTIPART_PART_SIZE = 5 * 1024 * 1024
+
 s3_client = boto3.client("s3")
 
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "presign_upload"
+
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
     "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
@@ -57,6 +73,20 @@ def _parse_event_body(event):
         raise ValueError("Request body must be a valid JSON object.") from exc
 
 
+def _http_method(event):
+    return (
+        (event or {}).get("httpMethod")
+        or ((event or {}).get("requestContext") or {})
+        .get("http", {})
+        .get("method")
+        or ""
+    ).upper()
+
+
+def _path(event):
+    return (event or {}).get("rawPath") or (event or {}).get("path") or ""
+
+
 def _extract_auth_token(event):
     """Pull the shared secret from headers or query string."""
     raw_headers = (event or {}).get("headers") or {}
@@ -87,8 +117,236 @@ def _build_object_key(filename, prefix):
     return f"{normalized_prefix}{final_name}"
 
 
-def lambda_handler(event, _context):
-    if (event or {}).get("httpMethod") == "OPTIONS":
+def _parse_part_numbers(raw_numbers, field_name="partNumbers"):
+    if not isinstance(raw_numbers, list) or not raw_numbers:
+        raise ValueError(f"Field '{field_name}' must be a non-empty list.")
+
+    part_numbers = []
+    for raw_number in raw_numbers:
+        try:
+            part_number = int(raw_number)
+        except (TypeError, ValueError) as exc:
+            raise ValueError("Part numbers must be integers.") from exc
+        if not 1 <= part_number <= MAX_MULTIPART_PARTS:
+            raise ValueError(
+                f"Part numbers must be between 1 and {MAX_MULTIPART_PARTS}."
+            )
+        part_numbers.append(part_number)
+
+    return sorted(set(part_numbers))
+
+
+def _presign_parts(object_key, upload_id, part_numbers):
+    return [
+        {
+            "partNumber": part_number,
+            "uploadUrl": s3_client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": S3_BUCKET,
+                    "Key": object_key,
+                    "UploadId": upload_id,
+                    "PartNumber": part_number,
+                },
+                ExpiresIn=URL_EXPIRATION_SECONDS,
+            ),
+        }
+        for part_number in part_numbers
+    ]
+
+
+def _require_upload(payload):
+    object_key = payload.get("objectKey")
+    upload_id = payload.get("uploadId")
+    if not object_key or not upload_id:
+        raise ValueError("Fields 'objectKey' and 'uploadId' are required.")
+    return object_key, upload_id
+
+
+def _list_uploaded_parts(object_key, upload_id):
+    parts = []
+    list_kwargs = {"Bucket": S3_BUCKET, "Key": object_key, "UploadId": upload_id}
+    while True:
+        result = s3_client.list_parts(**list_kwargs)
+        parts.extend(
+            {"partNumber": part["PartNumber"], "etag": part["ETag"], "size": part["Size"]}
+            for part in result.get("Parts", [])
+        )
+        if not result.get("IsTruncated"):
+            break
+        list_kwargs["PartNumberMarker"] = result["NextPartNumberMarker"]
+    return parts
+
+
+def _start_multipart_upload(payload, object_key, content_type):
+    try:
+        part_count = int(payload.get("partCount") or 1)
+    except (TypeError, ValueError):
+        return _response(400, {"message": "Field 'partCount' must be an integer."})
+    if not 1 <= part_count <= MAX_MULTIPART_PARTS:
+        return _response(
+            400,
+            {"message": f"Field 'partCount' must be between 1 and {MAX_MULTIPART_PARTS}."},
+        )
+
+    create_kwargs = {"Bucket": S3_BUCKET, "Key": object_key}
+    if content_type:
+        create_kwargs["ContentType"] = content_type
+
+    try:
+        upload_id = s3_client.create_multipart_upload(**create_kwargs)["UploadId"]
+        parts = _presign_parts(object_key, upload_id, range(1, part_count + 1))
+    except ClientError as error:
+        logger.exception("Unable to start multipart upload: %s", error)
+        return _response(
+            500, {"message": "Could not start multipart upload. Please retry later."}
+        )
+
+    return _response(
+        200,
+        {
+            "uploadId": upload_id,
+            "method": "PUT",
+            "objectKey": object_key,
+            "bucket": S3_BUCKET,
+            "expiresIn": URL_EXPIRATION_SECONDS,
+            "minPartSize": MIN_MULTIPART_PART_SIZE,
+            "parts": parts,
+        },
+    )
+
+
+def _handle_multipart_parts(payload):
+    """Resume support: list stored parts and re-presign the requested ones."""
+    try:
+        object_key, upload_id = _require_upload(payload)
+        part_numbers = (
+            _parse_part_numbers(payload["partNumbers"])
+            if payload.get("partNumbers") is not None
+            else []
+        )
+    except ValueError as exc:
+        return _response(400, {"message": str(exc)})
+
+    try:
+        uploaded_parts = _list_uploaded_parts(object_key, upload_id)
+        parts = _presign_parts(object_key, upload_id, part_numbers)
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchUpload":
+            return _response(404, {"message": "Multipart upload not found."})
+        logger.exception("Unable to list multipart upload parts: %s", error)
+        return _response(500, {"message": "Could not read upload parts. Please retry later."})
+
+    return _response(
+        200,
+        {
+            "uploadId": upload_id,
+            "objectKey": object_key,
+            "bucket": S3_BUCKET,
+            "expiresIn": URL_EXPIRATION_SECONDS,
+            "uploadedParts": uploaded_parts,
+            "parts": parts,
+        },
+    )
+
+
+def _handle_multipart_complete(payload):
+    try:
+        object_key, upload_id = _require_upload(payload)
+        raw_parts = payload.get("parts")
+        if not isinstance(raw_parts, list) or not raw_parts:
+            raise ValueError("Field 'parts' must be a non-empty list.")
+        etags = {}
+        for raw_part in raw_parts:
+            if not isinstance(raw_part, dict) or not raw_part.get("etag"):
+                raise ValueError("Each part needs 'partNumber' and 'etag'.")
+            part_number = _parse_part_numbers([raw_part.get("partNumber")])[0]
+            etags[part_number] = str(raw_part["etag"])
+    except ValueError as exc:
+        return _response(400, {"message": str(exc)})
+
+    try:
+        result = s3_client.complete_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=object_key,
+            UploadId=upload_id,
+            MultipartUpload={
+                "Parts": [
+                    {"PartNumber": part_number, "ETag": etags[part_number]}
+                    for part_number in sorted(etags)
+                ]
+            },
+        )
+    except ClientError as error:
+        code = error.response["Error"]["Code"]
+        if code == "NoSuchUpload":
+            return _response(404, {"message": "Multipart upload not found."})
+        if code in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall"):
+            return _response(400, {"message": error.response["Error"].get("Message", code)})
+        logger.exception("Unable to complete multipart upload: %s", error)
+        return _response(500, {"message": "Could not complete upload. Please retry later."})
+
+    return _response(
+        200,
+        {
+            "objectKey": object_key,
+            "bucket": S3_BUCKET,
+            "etag": result.get("ETag"),
+        },
+    )
+
+
+def _handle_multipart_abort(payload):
+    try:
+        object_key, upload_id = _require_upload(payload)
+    except ValueError as exc:
+        return _response(400, {"message": str(exc)})
+
+    try:
+        s3_client.abort_multipart_upload(
+            Bucket=S3_BUCKET, Key=object_key, UploadId=upload_id
+        )
+    except ClientError as error:
+        if error.response["Error"]["Code"] == "NoSuchUpload":
+            return _response(404, {"message": "Multipart upload not found."})
+        logger.exception("Unable to abort multipart upload: %s", error)
+        return _response(500, {"message": "Could not abort upload. Please retry later."})
+
+    return _response(200, {"objectKey": object_key, "uploadId": upload_id, "aborted": True})
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        s3_client.head_bucket(Bucket=S3_BUCKET)
+        primed["bucket"] = S3_BUCKET
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if _http_method(event) == "OPTIONS":
         # Allow CORS preflight to succeed quickly.
         return {
             "statusCode": 204,
@@ -111,6 +369,14 @@ def lambda_handler(event, _context):
     except ValueError as exc:
         return _response(400, {"message": str(exc)})
 
+    path = _path(event).rstrip("/")
+    if path.endswith("/uploads/multipart/parts"):
+        return _handle_multipart_parts(payload)
+    if path.endswith("/uploads/multipart/complete"):
+        return _handle_multipart_complete(payload)
+    if path.endswith("/uploads/multipart/abort"):
+        return _handle_multipart_abort(payload)
+
     original_filename = payload.get("filename")
     content_type = payload.get("contentType")
 
@@ -121,6 +387,9 @@ def lambda_handler(event, _context):
         original_filename, UPLOAD_PREFIX
     )
 
+    if payload.get("multipart"):
+        return _start_multipart_upload(payload, object_key, content_type)
+
     params = {"Bucket": S3_BUCKET, "Key": object_key}
     if content_type:
         params["ContentType"] = content_type
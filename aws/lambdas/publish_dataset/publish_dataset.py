@@ -0,0 +1,144 @@
+"""Publish the labeled dataset as immutable, content-addressed S3 manifests."""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+DATASET_BUCKET = os.environ.get("DATASET_BUCKET") or os.environ.get(
+    "UPLOAD_BUCKET", ""
+)
+DATASET_PREFIX = os.environ.get("DATASET_PREFIX", "dataset/")
+
+dynamodb = boto3.resource("dynamodb")
+s3_client = boto3.client("s3")
+metadata_table = dynamodb.Table(TABLE_NAME) if TABLE_NAME else None
+
+
+def _prefixed(name):
+    normalized_prefix = DATASET_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _to_serializable(value):
+    if isinstance(value, dict):
+        return {key: _to_serializable(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [_to_serializable(item) for item in value]
+    if isinstance(value, Decimal):
+        if value % 1 == 0:
+            return int(value)
+        return float(value)
+    return value
+
+
+def _scan_records():
+    records = []
+    scan_kwargs = {}
+    while True:
+        result = metadata_table.scan(**scan_kwargs)
+        records.extend(
+            _to_serializable(item) for item in result.get("Items", []) if item.get("objectKey")
+        )
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    # Same order guestimate presents samples in, so positions are stable
+    # within a version.
+    records.sort(
+        key=lambda record: (str(record.get("createdAt") or ""), str(record["objectKey"]))
+    )
+    return records
+
+
+def _read_pointer(key):
+    try:
+        body = s3_client.get_object(Bucket=DATASET_BUCKET, Key=key)["Body"].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+    return json.loads(body.decode("utf-8"))
+
+
+def _put_immutable(key, payload):
+    s3_client.put_object(
+        Bucket=DATASET_BUCKET,
+        Key=key,
+        Body=gzip.compress(
+            json.dumps(payload, separators=(",", ":")).encode("utf-8"), mtime=0
+        ),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+        CacheControl="public, max-age=31536000, immutable",
+    )
+
+
+def publish_dataset():
+    records = _scan_records()
+    canonical = json.dumps(records, sort_keys=True, separators=(",", ":"))
+    version = hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+    pointer_key = _prefixed("latest.json")
+    previous_pointer = _read_pointer(pointer_key) or {}
+    if previous_pointer.get("version") == version:
+        logger.info("Dataset unchanged at version %s.", version)
+        return {"version": version, "changed": False, "count": len(records)}
+
+    manifest_key = _prefixed(f"manifests/dataset-{version}.json.gz")
+    _put_immutable(manifest_key, {"version": version, "items": records, "count": len(records)})
+    sample_order_key = _prefixed(f"orders/sample-order-{version}.json.gz")
+    _put_immutable(
+        sample_order_key,
+        {"version": version, "objectKeys": [record["objectKey"] for record in records]},
+    )
+
+    pointer = {
+        "version": version,
+        "manifestKey": manifest_key,
+        "sampleOrderKey": sample_order_key,
+        "count": len(records),
+        "publishedAt": datetime.now(timezone.utc).isoformat(),
+        "previousVersion": previous_pointer.get("version"),
+    }
+    # Written last so readers never see a pointer to a missing manifest.
+    s3_client.put_object(
+        Bucket=DATASET_BUCKET,
+        Key=pointer_key,
+        Body=json.dumps(pointer).encode("utf-8"),
+        ContentType="application/json",
+        CacheControl="no-cache",
+    )
+    logger.info("Published dataset version %s (%s records).", version, len(records))
+    return {"version": version, "changed": True, "count": len(records)}
+
+
+def lambda_handler(event, _context):
+    # DynamoDB stream batches, the scheduled safety net and manual invocations
+    # all republish from a full scan; unchanged content is a no-op.
+    if not DATASET_BUCKET or metadata_table is None:
+        logger.error("Missing required env vars DATASET_BUCKET/UPLOAD_BUCKET or METADATA_TABLE.")
+        return {"ok": False, "message": "Server is not configured for dataset publishing."}
+
+    records = (event or {}).get("Records") or []
+    if records and not any(
+        record.get("eventName") in ("INSERT", "MODIFY", "REMOVE") for record in records
+    ):
+        return {"ok": True, "changed": False}
+
+    summary = publish_dataset()
+    return {"ok": True, **summary}
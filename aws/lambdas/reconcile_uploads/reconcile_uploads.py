@@ -0,0 +1,153 @@
+"""Garbage-collect uploaded images that never received labeling metadata."""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+S3_BUCKET = os.environ.get("UPLOAD_BUCKET", "menumatch-labeler-uploads")
+UPLOAD_PREFIX = os.environ.get("UPLOAD_PREFIX", "v1/")
+# Objects younger than this are still expected to get metadata.
+ORPHAN_GRACE_SECONDS = int(os.environ.get("ORPHAN_GRACE_SECONDS", "900"))
+# Report orphans without deleting them.
+DRY_RUN = os.environ.get("RECONCILE_DRY_RUN", "").lower() in ("1", "true", "yes")
+
+# BatchGetItem accepts at most 100 keys per request.
+BATCH_GET_LIMIT = 100
+# DeleteObjects accepts at most 1000 keys per request.
+DELETE_BATCH_LIMIT = 1000
+
+dynamodb = boto3.resource("dynamodb")
+s3_client = boto3.client("s3")
+
+
+def _normalized_prefix():
+    normalized_prefix = UPLOAD_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return normalized_prefix
+
+
+def _keys_with_metadata(object_keys):
+    found = set()
+    for start in range(0, len(object_keys), BATCH_GET_LIMIT):
+        request_items = {
+            TABLE_NAME: {
+                "Keys": [
+                    {"objectKey": key}
+                    for key in object_keys[start:start + BATCH_GET_LIMIT]
+                ],
+                "ProjectionExpression": "objectKey",
+            }
+        }
+        while request_items:
+            result = dynamodb.batch_get_item(RequestItems=request_items)
+            found.update(
+                item["objectKey"] for item in result.get("Responses", {}).get(TABLE_NAME, [])
+            )
+            request_items = result.get("UnprocessedKeys") or None
+    return found
+
+
+def _delete_objects(object_keys):
+    deleted = 0
+    for start in range(0, len(object_keys), DELETE_BATCH_LIMIT):
+        batch = object_keys[start:start + DELETE_BATCH_LIMIT]
+        result = s3_client.delete_objects(
+            Bucket=S3_BUCKET,
+            Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+        )
+        for error in result.get("Errors", []):
+            logger.error("Could not delete orphan %s: %s", error.get("Key"), error.get("Message"))
+        deleted += len(batch) - len(result.get("Errors", []))
+    return deleted
+
+
+def _collect(candidates, now):
+    """Delete candidates (key -> last modified) that are old and unlabeled."""
+    expired = [
+        key
+        for key, last_modified in candidates.items()
+        if (now - last_modified).total_seconds() >= ORPHAN_GRACE_SECONDS
+    ]
+    if not expired:
+        return {"checked": len(candidates), "orphans": [], "deleted": 0}
+
+    labeled = _keys_with_metadata(expired)
+    orphans = sorted(key for key in expired if key not in labeled)
+    deleted = 0
+    if orphans and not DRY_RUN:
+        deleted = _delete_objects(orphans)
+    if orphans:
+        logger.info("Found %s orphan uploads (deleted %s).", len(orphans), deleted)
+    return {"checked": len(candidates), "orphans": orphans, "deleted": deleted}
+
+
+def _s3_records(event):
+    """Yield S3 event records, unwrapping the SQS delay queue if present."""
+    for record in (event or {}).get("Records") or []:
+        if record.get("eventSource") == "aws:sqs":
+            try:
+                body = json.loads(record.get("body") or "{}")
+            except json.JSONDecodeError:
+                logger.warning("Skipping malformed SQS message %s", record.get("messageId"))
+                continue
+            yield from body.get("Records") or []
+        elif record.get("eventSource") == "aws:s3":
+            yield record
+
+
+def _handle_object_events(event):
+    prefix = _normalized_prefix()
+    candidates = {}
+    for record in _s3_records(event):
+        object_key = unquote_plus(((record.get("s3") or {}).get("object") or {}).get("key", ""))
+        if not object_key or not object_key.startswith(prefix):
+            continue
+        try:
+            head = s3_client.head_object(Bucket=S3_BUCKET, Key=object_key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                continue
+            raise
+        candidates[object_key] = head["LastModified"]
+
+    # Objects still inside the grace window are left for the scheduled sweep.
+    return _collect(candidates, datetime.now(timezone.utc))
+
+
+def _sweep():
+    paginator = s3_client.get_paginator("list_objects_v2")
+    now = datetime.now(timezone.utc)
+    summary = {"checked": 0, "orphans": [], "deleted": 0}
+
+    for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=_normalized_prefix()):
+        candidates = {
+            entry["Key"]: entry["LastModified"] for entry in page.get("Contents", [])
+        }
+        result = _collect(candidates, now)
+        summary["checked"] += result["checked"]
+        summary["orphans"].extend(result["orphans"])
+        summary["deleted"] += result["deleted"]
+
+    return summary
+
+
+def lambda_handler(event, _context):
+    if (event or {}).get("Records"):
+        summary = _handle_object_events(event)
+    else:
+        # EventBridge schedule or manual invocation: sweep the whole prefix.
+        summary = _sweep()
+
+    summary["orphanCount"] = len(summary.pop("orphans"))
+    summary["dryRun"] = DRY_RUN
+    logger.info("Reconcile summary: %s", summary)
+    return summary
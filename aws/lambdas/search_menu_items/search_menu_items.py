@@ -0,0 +1,476 @@
+"""Search Husky Eats menu items by name from an in-memory index of the catalog mirror."""
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+import boto3
+from botocore.exceptions import ClientError
+
+import traffic_capture
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CATALOG_BUCKET = os.environ.get("CATALOG_BUCKET") or os.environ.get(
+    "UPLOAD_BUCKET", ""
+)
+CATALOG_PREFIX = os.environ.get("CATALOG_PREFIX", "catalog/")
+CATALOG_REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", "900"))
+HUSKYEATS_BASE_URL = os.environ.get(
+    "HUSKYEATS_BASE_URL", "https://husky-eats.onrender.com/api"
+).rstrip("/")
+HUSKYEATS_TIMEOUT_SECONDS = float(os.environ.get("HUSKYEATS_TIMEOUT_SECONDS", "5"))
+# Menus for one hall, meal and date are fetched once and indexed on their own.
+MENU_CACHE_SECONDS = float(os.environ.get("MENU_CACHE_SECONDS", "900"))
+MENU_CACHE_MAX_ENTRIES = int(os.environ.get("MENU_CACHE_MAX_ENTRIES", "256"))
+# Meals searched when a hall and date are given without one.
+MENU_MEALS = tuple(
+    meal.strip()
+    for meal in os.environ.get("MENU_MEALS", "breakfast,lunch,dinner").split(",")
+    if meal.strip()
+)
+DEFAULT_SEARCH_LIMIT = int(os.environ.get("DEFAULT_SEARCH_LIMIT", "20"))
+MAX_SEARCH_LIMIT = 100
+# Share of the query's trigrams a name must contain to match without a
+# word prefix match; 0.4 still matches with a typo in every word.
+MIN_TRIGRAM_MATCH = float(os.environ.get("MIN_TRIGRAM_MATCH", "0.4"))
+AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+s3_client = boto3.client("s3")
+
+# Index over the loaded catalog mirror; rebuilt when its version changes.
+catalog_index = {"version": None, "index": None, "checkedAt": None, "buildMs": None}
+catalog_index_lock = threading.Lock()
+# (hallId, meal, date) -> {"expiresAt", "index"}
+menu_cache = {}
+menu_cache_lock = threading.Lock()
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "search_menu_items"
+
+_DEFAULT_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,X-Api-Key,Authorization",
+    "Access-Control-Allow-Methods": "OPTIONS,GET",
+}
+
+
+def _response(status_code, payload):
+    return {
+        "statusCode": status_code,
+        "headers": _DEFAULT_HEADERS,
+        "body": json.dumps(payload),
+    }
+
+
+def _http_method(event):
+    return (
+        (event or {}).get("httpMethod")
+        or ((event or {}).get("requestContext") or {})
+        .get("http", {})
+        .get("method")
+        or ""
+    ).upper()
+
+
+def _extract_auth_token(event):
+    raw_headers = (event or {}).get("headers") or {}
+    headers = {str(key).lower(): value for key, value in raw_headers.items()}
+    token = headers.get("x-api-key")
+
+    if not token:
+        auth_header = headers.get("authorization", "")
+        if auth_header.lower().startswith("bearer "):
+            token = auth_header.split(" ", 1)[1].strip()
+
+    if not token and (event or {}).get("queryStringParameters"):
+        token = (event["queryStringParameters"] or {}).get("token")
+
+    return token
+
+
+def _normalize(text):
+    """Lowercase ASCII words, with accents folded and punctuation dropped."""
+    folded = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore")
+    return " ".join(_WORD_PATTERN.findall(folded.decode("ascii").lower()))
+
+
+def _trigrams(normalized):
+    # Words are padded as in pg_trgm, so word starts and ends carry weight.
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return grams
+
+
+def _name_ranks(names, ids):
+    """Position -> rank in case-insensitive name order, for tie-breaks."""
+    ranks = array("I", bytes(4 * len(names)))
+    order = sorted(range(len(names)), key=lambda position: (names[position].lower(), ids[position]))
+    for rank, position in enumerate(order):
+        ranks[position] = rank
+    return ranks
+
+
+def _build_index(entries):
+    """Index (id, name, servingSize, station) entries, kept in the given order.
+
+    Posting lists are `array("I")` positions into the parallel tuples, in
+    ascending order.
+    """
+    ids = []
+    names = []
+    serving_sizes = []
+    stations = []
+    gram_counts = array("I")
+    gram_postings = {}
+    token_postings = {}
+    for position, (item_id, name, serving_size, station) in enumerate(entries):
+        ids.append(item_id)
+        names.append(name)
+        serving_sizes.append(serving_size)
+        stations.append(station)
+        normalized = _normalize(name)
+        grams = _trigrams(normalized)
+        gram_counts.append(len(grams))
+        for gram in grams:
+            postings = gram_postings.get(gram)
+            if postings is None:
+                postings = gram_postings[gram] = array("I")
+            postings.append(position)
+        for token in dict.fromkeys(normalized.split()):
+            postings = token_postings.get(token)
+            if postings is None:
+                postings = token_postings[token] = array("I")
+            postings.append(position)
+
+    return {
+        "ids": tuple(ids),
+        "names": tuple(names),
+        "servingSizes": tuple(serving_sizes),
+        "stations": tuple(stations),
+        "gramCounts": gram_counts,
+        "grams": gram_postings,
+        "tokens": token_postings,
+        "sortedTokens": tuple(sorted(token_postings)),
+        "sortedIds": tuple(sorted((item_id, position) for position, item_id in enumerate(ids))),
+        "nameRanks": _name_ranks(names, ids),
+    }
+
+
+def _prefix_positions(index, prefix):
+    """Positions of names with a word starting with `prefix`."""
+    sorted_tokens = index["sortedTokens"]
+    matched = set()
+    start = bisect_left(sorted_tokens, prefix)
+    while start < len(sorted_tokens) and sorted_tokens[start].startswith(prefix):
+        matched.update(index["tokens"][sorted_tokens[start]])
+        start += 1
+    return matched
+
+
+def _search(index, query, limit):
+    """Rank entries against `query`; returns [(position, score)], best first.
+
+    A name scores the share of the query's trigrams it contains (typo
+    tolerant), plus the share of query words that prefix one of its words
+    (as-you-type), plus a small Dice term so tighter names rank first. Item
+    IDs match on prefix as well, as the upload form lets labelers type them.
+    """
+    normalized = _normalize(query)
+    if not normalized:
+        return []
+
+    scores = {}
+    query_grams = _trigrams(normalized)
+    # Counter.update counts a posting list in C.
+    shared = Counter()
+    for gram in query_grams:
+        shared.update(index["grams"].get(gram, ()))
+    gram_counts = index["gramCounts"]
+    min_shared = MIN_TRIGRAM_MATCH * len(query_grams)
+    for position, count in shared.items():
+        if count >= min_shared:
+            dice = 2 * count / (len(query_grams) + gram_counts[position])
+            scores[position] = count / len(query_grams) + 0.25 * dice
+
+    query_tokens = normalized.split()
+    prefixed = Counter()
+    for token in query_tokens:
+        prefixed.update(_prefix_positions(index, token))
+    for position, hits in prefixed.items():
+        scores[position] = scores.get(position, 0.0) + hits / len(query_tokens)
+
+    compact_query = query.strip()
+    if compact_query.isdigit():
+        sorted_ids = index["sortedIds"]
+        start = bisect_left(sorted_ids, (compact_query,))
+        while start < len(sorted_ids) and sorted_ids[start][0].startswith(compact_query):
+            item_id, position = sorted_ids[start]
+            # An exact ID outranks any name match.
+            bonus = 5.0 if item_id == compact_query else 2.0
+            scores[position] = scores.get(position, 0.0) + bonus
+            start += 1
+
+    if not scores:
+        return []
+    # Only ties at the cut-off need the name order.
+    cutoff = heapq.nlargest(limit, scores.values())[-1]
+    name_ranks = index["nameRanks"]
+    return sorted(
+        ((position, score) for position, score in scores.items() if score >= cutoff),
+        key=lambda entry: (-entry[1], name_ranks[entry[0]]),
+    )[:limit]
+
+
+def _result_item(index, position, score=None):
+    item = {
+        "id": index["ids"][position],
+        "name": index["names"][position],
+        "servingSize": index["servingSizes"][position],
+        "station": index["stations"][position],
+    }
+    if score is not None:
+        item["score"] = round(score, 4)
+    return item
+
+
+def _catalog_key(name):
+    normalized_prefix = CATALOG_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _load_catalog_index(force=False):
+    """Index the latest catalog mirror, re-checking the pointer periodically."""
+    if not CATALOG_BUCKET:
+        return None
+
+    with catalog_index_lock:
+        now = time.monotonic()
+        checked_at = catalog_index["checkedAt"]
+        if not force and checked_at is not None and now - checked_at < CATALOG_REFRESH_SECONDS:
+            return catalog_index["index"]
+        catalog_index["checkedAt"] = now
+
+        try:
+            pointer = json.loads(
+                s3_client.get_object(Bucket=CATALOG_BUCKET, Key=_catalog_key("latest.json"))[
+                    "Body"
+                ].read()
+            )
+            if pointer.get("version") == catalog_index["version"]:
+                return catalog_index["index"]
+
+            body = s3_client.get_object(Bucket=CATALOG_BUCKET, Key=pointer["objectKey"])[
+                "Body"
+            ].read()
+            blob = json.loads(gzip.decompress(body))
+        except (ClientError, KeyError, OSError, ValueError) as error:
+            logger.warning("Catalog mirror unavailable; keeping the current index: %s", error)
+            return catalog_index["index"]
+
+        started = time.perf_counter()
+        name_column = blob["fields"].index("name")
+        serving_column = blob["fields"].index("servingSize")
+        index = _build_index(
+            (str(item_id), str(row[name_column]), str(row[serving_column] or ""), "")
+            for item_id, row in blob["items"].items()
+        )
+        catalog_index["index"] = index
+        catalog_index["version"] = blob.get("version") or pointer.get("version")
+        catalog_index["buildMs"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(
+            "Indexed catalog version %s (%s items, %s trigrams) in %s ms.",
+            catalog_index["version"],
+            len(index["ids"]),
+            len(index["grams"]),
+            catalog_index["buildMs"],
+        )
+        return index
+
+
+def _huskyeats_get(path):
+    request = Request(
+        f"{HUSKYEATS_BASE_URL}{path}",
+        headers={
+            "Accept": "application/json",
+            "User-Agent": "MenuMatch-Labeler-MenuSearch/1.0",
+        },
+    )
+    with urlopen(request, timeout=HUSKYEATS_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def _menu_entries(hall_id, meal, date, catalog):
+    payload = _huskyeats_get(
+        "/menu?" + urlencode({"hallid": hall_id, "meal": meal, "date": date})
+    )
+    if not isinstance(payload, list):
+        raise ValueError("Unexpected /menu response format.")
+
+    entries = []
+    for item in payload:
+        if not isinstance(item, dict) or item.get("id") is None or not item.get("name"):
+            continue
+        item_id = str(item["id"])
+        serving_size = str(item.get("servingsize") or item.get("servingSize") or "").strip()
+        if not serving_size and catalog is not None:
+            # The mirror has serving sizes the menu listing leaves out, so
+            # browsers no longer fetch each item's details.
+            found = bisect_left(catalog["sortedIds"], (item_id,))
+            if found < len(catalog["sortedIds"]) and catalog["sortedIds"][found][0] == item_id:
+                serving_size = catalog["servingSizes"][catalog["sortedIds"][found][1]]
+        entries.append((item_id, str(item["name"]), serving_size, str(item.get("station") or "")))
+    return entries
+
+
+def _load_menu_index(hall_id, meal, date):
+    """Index of one hall's menu on a date, for one meal or (meal "") all of them."""
+    cache_key = (hall_id, meal, date)
+    now = time.monotonic()
+    with menu_cache_lock:
+        cached = menu_cache.get(cache_key)
+    if cached is not None and now < cached["expiresAt"]:
+        return cached["index"]
+
+    catalog = _load_catalog_index()
+    unique = {}
+    for menu_meal in (meal,) if meal else MENU_MEALS:
+        for entry in _menu_entries(hall_id, menu_meal, date, catalog):
+            unique.setdefault(entry[0], entry)
+    index = _build_index(
+        sorted(unique.values(), key=lambda entry: (entry[1].lower(), entry[0]))
+    )
+
+    with menu_cache_lock:
+        menu_cache[cache_key] = {"expiresAt": now + MENU_CACHE_SECONDS, "index": index}
+        while len(menu_cache) > MENU_CACHE_MAX_ENTRIES:
+            # Dicts keep insertion order, so the first entry is the oldest.
+            menu_cache.pop(next(iter(menu_cache)))
+    return index
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    index = _load_catalog_index()
+    if index is not None:
+        primed["catalogItems"] = len(index["ids"])
+        primed["indexBuildMs"] = catalog_index["buildMs"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if _http_method(event) == "OPTIONS":
+        return {
+            "statusCode": 204,
+            "headers": _DEFAULT_HEADERS,
+            "body": "",
+        }
+
+    http_method = _http_method(event)
+    if http_method and http_method != "GET":
+        return _response(405, {"message": f"Method {http_method} not allowed."})
+
+    if AUTH_TOKEN:
+        provided_token = _extract_auth_token(event)
+        if provided_token != AUTH_TOKEN:
+            logger.warning("Unauthorized menu search request.")
+            return _response(401, {"message": "Unauthorized"})
+
+    started = time.perf_counter()
+    query = (event or {}).get("queryStringParameters") or {}
+    text = str(query.get("q") or "").strip()
+    hall_id = str(query.get("hallId") or "").strip()
+    meal = str(query.get("meal") or "").strip().lower()
+    date = str(query.get("date") or "").strip()
+
+    limit = DEFAULT_SEARCH_LIMIT
+    if query.get("limit"):
+        try:
+            limit = int(query["limit"])
+        except ValueError:
+            return _response(400, {"message": "limit must be an integer."})
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return _response(400, {"message": f"limit must be between 1 and {MAX_SEARCH_LIMIT}."})
+
+    if bool(hall_id) != bool(date):
+        return _response(400, {"message": "hallId and date must be given together."})
+    if meal and not hall_id:
+        return _response(400, {"message": "meal requires hallId and date."})
+    if not text and not hall_id:
+        return _response(400, {"message": "q is required without a hallId and date."})
+
+    if hall_id:
+        try:
+            index = _load_menu_index(hall_id, meal, date)
+        except (HTTPError, URLError, TimeoutError, ValueError) as error:
+            logger.warning("Could not load Husky Eats menu %s/%s/%s: %s", hall_id, meal, date, error)
+            return _response(502, {"message": "Could not load the Husky Eats menu."})
+    else:
+        index = _load_catalog_index()
+        if index is None:
+            return _response(
+                503, {"message": "The menu item catalog is not available yet. Try again later."}
+            )
+
+    if text:
+        items = [
+            _result_item(index, position, score)
+            for position, score in _search(index, text, limit)
+        ]
+    else:
+        # A whole menu, already in name order.
+        items = [_result_item(index, position) for position in range(len(index["ids"]))]
+
+    return _response(
+        200,
+        {
+            "items": items,
+            "count": len(items),
+            "query": text,
+            "menu": {"hallId": hall_id, "meal": meal or None, "date": date} if hall_id else None,
+            "catalogVersion": catalog_index["version"],
+            "tookMs": round((time.perf_counter() - started) * 1000, 2),
+        },
+    )
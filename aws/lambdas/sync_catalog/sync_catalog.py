@@ -0,0 +1,224 @@
+"""Mirror the Husky Eats menu item catalog into a versioned S3 blob."""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CATALOG_BUCKET = os.environ.get("CATALOG_BUCKET") or os.environ.get(
+    "UPLOAD_BUCKET", ""
+)
+CATALOG_PREFIX = os.environ.get("CATALOG_PREFIX", "catalog/")
+HUSKYEATS_BASE_URL = os.environ.get(
+    "HUSKYEATS_BASE_URL", "https://husky-eats.onrender.com/api"
+).rstrip("/")
+HUSKYEATS_TIMEOUT_SECONDS = float(os.environ.get("HUSKYEATS_TIMEOUT_SECONDS", "60"))
+DETAIL_FETCH_CONCURRENCY = int(os.environ.get("DETAIL_FETCH_CONCURRENCY", "8"))
+
+# Column order of each item row in the mirror blob.
+CATALOG_FIELDS = ("name", "servingSize", "kcal", "protein_g", "carb_g", "fat_g")
+# Mirror column -> Husky Eats field.
+NUTRITION_SOURCE_FIELDS = {
+    "kcal": "calories",
+    "protein_g": "protein_g",
+    "carb_g": "totalcarbohydrate_g",
+    "fat_g": "totalfat_g",
+}
+
+s3_client = boto3.client("s3")
+
+
+def _prefixed(name):
+    normalized_prefix = CATALOG_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _huskyeats_get(path):
+    request = Request(
+        f"{HUSKYEATS_BASE_URL}{path}",
+        headers={
+            "Accept": "application/json",
+            "User-Agent": "MenuMatch-Labeler-CatalogSync/1.0",
+        },
+    )
+    with urlopen(request, timeout=HUSKYEATS_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def _to_number(value):
+    if value is None or value == "":
+        return None
+    try:
+        numeric = Decimal(str(value).strip())
+    except (InvalidOperation, AttributeError):
+        return None
+    if not numeric.is_finite() or numeric < 0:
+        return None
+    return int(numeric) if numeric % 1 == 0 else float(numeric)
+
+
+def _catalog_row(payload):
+    """Return the compact row for one Husky Eats item, or None if incomplete."""
+    row = [
+        str(payload.get("name") or ""),
+        str(payload.get("servingsize") or ""),
+    ]
+    for field in CATALOG_FIELDS[2:]:
+        value = _to_number(payload.get(NUTRITION_SOURCE_FIELDS[field]))
+        if value is None:
+            return None
+        row.append(value)
+    return row
+
+
+def _fetch_detail_row(item_id):
+    try:
+        return item_id, _catalog_row(_huskyeats_get(f"/menuitem/{quote(item_id)}"))
+    except (HTTPError, URLError, TimeoutError, json.JSONDecodeError) as error:
+        logger.warning("Could not fetch Husky Eats item %s: %s", item_id, error)
+        return item_id, None
+
+
+def _pull_catalog():
+    """Bulk-pull `/menuitem`, filling in any rows the listing leaves incomplete."""
+    listing = _huskyeats_get("/menuitem")
+    if not isinstance(listing, list):
+        raise ValueError("Unexpected /menuitem response format.")
+
+    items = {}
+    incomplete = []
+    for payload in listing:
+        if not isinstance(payload, dict) or payload.get("id") is None:
+            continue
+        item_id = str(payload["id"])
+        row = _catalog_row(payload)
+        if row is None:
+            incomplete.append(item_id)
+        else:
+            items[item_id] = row
+
+    if incomplete:
+        logger.info("Fetching details for %s items missing nutrition.", len(incomplete))
+        with ThreadPoolExecutor(max_workers=DETAIL_FETCH_CONCURRENCY) as pool:
+            for item_id, row in pool.map(_fetch_detail_row, incomplete):
+                if row is not None:
+                    items[item_id] = row
+
+    return dict(sorted(items.items()))
+
+
+def _catalog_version(items):
+    canonical = json.dumps(items, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_json(key, compressed=False):
+    try:
+        body = s3_client.get_object(Bucket=CATALOG_BUCKET, Key=key)["Body"].read()
+    except ClientError as error:
+        if error.response["Error"]["Code"] in ("NoSuchKey", "404", "AccessDenied"):
+            return None
+        raise
+    if compressed:
+        body = gzip.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def _diff_catalogs(previous_items, items):
+    previous_ids = set(previous_items)
+    current_ids = set(items)
+    return {
+        "added": sorted(current_ids - previous_ids),
+        "removed": sorted(previous_ids - current_ids),
+        "changed": sorted(
+            item_id
+            for item_id in previous_ids & current_ids
+            if previous_items[item_id] != items[item_id]
+        ),
+    }
+
+
+def sync_catalog():
+    items = _pull_catalog()
+    if not items:
+        raise ValueError("Husky Eats returned an empty catalog; keeping the mirror.")
+
+    version = _catalog_version(items)
+    pointer_key = _prefixed("latest.json")
+    previous_pointer = _read_json(pointer_key) or {}
+    if previous_pointer.get("version") == version:
+        logger.info("Catalog unchanged at version %s.", version)
+        return {"version": version, "changed": False, "itemCount": len(items)}
+
+    object_key = _prefixed(f"menuitems-{version}.json.gz")
+    blob = {"version": version, "fields": list(CATALOG_FIELDS), "items": items}
+    s3_client.put_object(
+        Bucket=CATALOG_BUCKET,
+        Key=object_key,
+        Body=gzip.compress(json.dumps(blob, separators=(",", ":")).encode("utf-8")),
+        ContentType="application/json",
+        ContentEncoding="gzip",
+        CacheControl="public, max-age=31536000, immutable",
+    )
+
+    diff_summary = None
+    previous_key = previous_pointer.get("objectKey")
+    previous_blob = _read_json(previous_key, compressed=True) if previous_key else None
+    if previous_blob:
+        diff = _diff_catalogs(previous_blob.get("items") or {}, items)
+        diff_key = _prefixed(f"diffs/{previous_pointer['version']}..{version}.json")
+        s3_client.put_object(
+            Bucket=CATALOG_BUCKET,
+            Key=diff_key,
+            Body=json.dumps(diff).encode("utf-8"),
+            ContentType="application/json",
+        )
+        diff_summary = {name: len(ids) for name, ids in diff.items()}
+        diff_summary["objectKey"] = diff_key
+
+    pointer = {
+        "version": version,
+        "objectKey": object_key,
+        "itemCount": len(items),
+        "syncedAt": datetime.now(timezone.utc).isoformat(),
+        "previousVersion": previous_pointer.get("version"),
+        "diff": diff_summary,
+    }
+    # Written last so readers never see a pointer to a missing blob.
+    s3_client.put_object(
+        Bucket=CATALOG_BUCKET,
+        Key=pointer_key,
+        Body=json.dumps(pointer).encode("utf-8"),
+        ContentType="application/json",
+        CacheControl="no-cache",
+    )
+    logger.info("Published catalog version %s (%s items).", version, len(items))
+    return {"version": version, "changed": True, "itemCount": len(items), "diff": diff_summary}
+
+
+def lambda_handler(_event, _context):
+    if not CATALOG_BUCKET:
+        logger.error("Missing required env var CATALOG_BUCKET/UPLOAD_BUCKET.")
+        return {"ok": False, "message": "Server is not configured for catalog sync."}
+
+    try:
+        summary = sync_catalog()
+    except (HTTPError, URLError, TimeoutError, ValueError) as error:
+        logger.exception("Catalog sync failed: %s", error)
+        return {"ok": False, "message": str(error)}
+
+    return {"ok": True, **summary}
@@ -1,23 +1,92 @@
 """Persist labeling metadata for an uploaded plate image in DynamoDB."""
 import base64
+import gzip
+import hashlib
 import json
 import logging
 import os
+import re
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from decimal import Decimal, InvalidOperation
 
 import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
 from botocore.exceptions import ClientError
 
+import traffic_capture
+from plate_coverage import coverage_increments
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = os.environ.get("METADATA_TABLE", "mml-metadata")
+COVERAGE_TABLE_NAME = os.environ.get("COVERAGE_TABLE", "")
+ITEM_INDEX_TABLE_NAME = os.environ.get("ITEM_INDEX_TABLE", "")
+CONTENT_HASH_TABLE_NAME = os.environ.get("CONTENT_HASH_TABLE", "")
+PHASH_INDEX_TABLE_NAME = os.environ.get("PHASH_INDEX_TABLE", "")
+# Hamming distance at or below which two perceptual hashes count as likely
+# duplicates. Lookups find every match up to PHASH_BANDS - 1 differing bits
+# (some band must then match exactly), so keep this below PHASH_BANDS.
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "8"))
+S3_BUCKET = os.environ.get("UPLOAD_BUCKET", "")
+# Skip hashing object bodies larger than this (multipart uploads only; a
+# single-part ETag already is the MD5 of the content).
+CONTENT_HASH_MAX_BYTES = int(os.environ.get("CONTENT_HASH_MAX_BYTES", str(50 * 1024 * 1024)))
 AUTH_TOKEN = os.environ.get("AUTH_TOKEN")
+# Catalog mirror published by sync_catalog; menuItemIds are checked against
+# it. Validation is skipped while no mirror has been published.
+CATALOG_BUCKET = os.environ.get("CATALOG_BUCKET", S3_BUCKET)
+CATALOG_PREFIX = os.environ.get("CATALOG_PREFIX", "catalog/")
+CATALOG_REFRESH_SECONDS = float(os.environ.get("CATALOG_REFRESH_SECONDS", "900"))
+# An unknown ID triggers an early pointer re-check, at most this often, so
+# items added to Husky Eats since the last load are not rejected for long.
+CATALOG_MISS_RECHECK_SECONDS = float(os.environ.get("CATALOG_MISS_RECHECK_SECONDS", "60"))
+
+# 64-bit dHash as 16 hex characters, computed by the upload page.
+PHASH_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+# Multi-index hashing: the hash is split into this many bands (7-8 bits of
+# a 64-bit hash) and each band value is indexed separately. Two hashes at
+# most r bits apart share a band exactly when there are r + 1 bands.
+PHASH_BANDS = 9
+# DynamoDB transactions accept at most 100 actions: the metadata put, the
+# content-hash claim, the perceptual-hash bands, and one index row per
+# distinct menu item.
+MAX_TRANSACT_ITEMS = 100
+MAX_INDEXED_ITEMS = MAX_TRANSACT_ITEMS - 2 - PHASH_BANDS
 
 dynamodb = boto3.resource("dynamodb")
 metadata_table = dynamodb.Table(TABLE_NAME) if TABLE_NAME else None
+coverage_table = (
+    dynamodb.Table(COVERAGE_TABLE_NAME) if COVERAGE_TABLE_NAME else None
+)
+item_index_table = (
+    dynamodb.Table(ITEM_INDEX_TABLE_NAME) if ITEM_INDEX_TABLE_NAME else None
+)
+content_hash_table = (
+    dynamodb.Table(CONTENT_HASH_TABLE_NAME) if CONTENT_HASH_TABLE_NAME else None
+)
+phash_index_table = (
+    dynamodb.Table(PHASH_INDEX_TABLE_NAME) if PHASH_INDEX_TABLE_NAME else None
+)
+s3_client = boto3.client("s3")
+
+# Sorted menuItemIds of the loaded catalog mirror, searched with bisect.
+catalog_ids = {"version": None, "ids": None, "checkedAt": None}
+
+# Invocations served by this container; a warm-up that is the first one
+# found it cold.
+container_state = {"invocations": 0}
+
+# Created on the first near-duplicate lookup.
+_band_executor = None
+
+# Name this function's requests are captured under when TRAFFIC_CAPTURE is
+# set (see traffic_capture.py).
+CAPTURE_FUNCTION_NAME = "upload_metadata"
 
 _DEFAULT_HEADERS = {
     "Access-Control-Allow-Origin": "*",
@@ -91,6 +160,74 @@ def _normalize_servings(value):
     return numeric
 
 
+def _catalog_key(name):
+    normalized_prefix = CATALOG_PREFIX.strip("/")
+    if normalized_prefix:
+        normalized_prefix = f"{normalized_prefix}/"
+    return f"{normalized_prefix}{name}"
+
+
+def _load_catalog_ids(force=False):
+    """Load the IDs of the latest catalog mirror, re-checking the pointer periodically."""
+    if not CATALOG_BUCKET:
+        return
+
+    now = time.monotonic()
+    checked_at = catalog_ids["checkedAt"]
+    if not force and checked_at is not None and now - checked_at < CATALOG_REFRESH_SECONDS:
+        return
+    catalog_ids["checkedAt"] = now
+
+    try:
+        pointer = json.loads(
+            s3_client.get_object(Bucket=CATALOG_BUCKET, Key=_catalog_key("latest.json"))[
+                "Body"
+            ].read()
+        )
+        if pointer.get("version") == catalog_ids["version"]:
+            return
+
+        body = s3_client.get_object(Bucket=CATALOG_BUCKET, Key=pointer["objectKey"])[
+            "Body"
+        ].read()
+        blob = json.loads(gzip.decompress(body))
+    except (ClientError, KeyError, OSError, ValueError) as error:
+        logger.warning("Catalog mirror unavailable; menuItemIds are not validated: %s", error)
+        return
+
+    catalog_ids["ids"] = tuple(sorted(str(item_id) for item_id in blob["items"]))
+    catalog_ids["version"] = blob.get("version") or pointer.get("version")
+    logger.info(
+        "Loaded catalog IDs version %s (%s items).",
+        catalog_ids["version"],
+        len(catalog_ids["ids"]),
+    )
+
+
+def _unknown_menu_item_ids(menu_item_ids):
+    """Return the IDs missing from the catalog mirror (none while it is unavailable)."""
+
+    def missing(ids):
+        if ids is None:
+            return []
+        unknown = []
+        for menu_item_id in menu_item_ids:
+            position = bisect_left(ids, menu_item_id)
+            if position == len(ids) or ids[position] != menu_item_id:
+                unknown.append(menu_item_id)
+        return unknown
+
+    _load_catalog_ids()
+    unknown = missing(catalog_ids["ids"])
+    checked_at = catalog_ids["checkedAt"]
+    if unknown and (
+        checked_at is None or time.monotonic() - checked_at >= CATALOG_MISS_RECHECK_SECONDS
+    ):
+        _load_catalog_ids(force=True)
+        unknown = missing(catalog_ids["ids"])
+    return unknown
+
+
 def _validate_payload(payload):
     required_fields = [
         "objectKey",
@@ -131,10 +268,350 @@ def _validate_payload(payload):
             }
         )
 
-    return normalized_items, uploaded_by
+    unknown_ids = _unknown_menu_item_ids(
+        list(dict.fromkeys(item["menuItemId"] for item in normalized_items))
+    )
+    if unknown_ids:
+        raise ValueError(f"Unknown menuItemId(s): {', '.join(unknown_ids)}.")
+
+    perceptual_hash = payload.get("perceptualHash")
+    if perceptual_hash is not None:
+        perceptual_hash = str(perceptual_hash).strip().lower()
+        if not PHASH_PATTERN.match(perceptual_hash):
+            raise ValueError("perceptualHash must be 16 hexadecimal characters.")
+
+    return normalized_items, uploaded_by, perceptual_hash
+
+
+def _update_coverage(item):
+    """Fold a newly stored plate into the per-menu-item coverage rows."""
+    for menu_item_id, counters in coverage_increments(item).items():
+        names = {}
+        values = {}
+        clauses = []
+        for index, (attr, amount) in enumerate(sorted(counters.items())):
+            names[f"#c{index}"] = attr
+            values[f":c{index}"] = Decimal(amount)
+            clauses.append(f"#c{index} :c{index}")
+
+        coverage_table.update_item(
+            Key={"menuItemId": menu_item_id},
+            UpdateExpression="ADD " + ", ".join(clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+
+
+def _index_rows(item):
+    """Build one item-index row per distinct menuItemId on the plate."""
+    rows = {}
+    for menu_item in item["items"]:
+        menu_item_id = menu_item["menuItemId"]
+        if menu_item_id in rows:
+            rows[menu_item_id]["servings"] += menu_item["servings"]
+            continue
+
+        rows[menu_item_id] = {
+            "menuItemId": menu_item_id,
+            "sortKey": f"{item.get('createdAt') or ''}#{item['objectKey']}",
+            "objectKey": item["objectKey"],
+            "createdAt": item.get("createdAt"),
+            "mealDate": item.get("mealDate"),
+            "mealtime": item.get("mealtime"),
+            "diningHallId": item.get("diningHallId"),
+            "difficulty": item.get("difficulty"),
+            "servings": menu_item["servings"],
+        }
+    return [
+        {key: value for key, value in row.items() if value is not None}
+        for row in rows.values()
+    ]
+
 
+def _phash_bands(perceptual_hash):
+    """Split a hex perceptual hash into PHASH_BANDS contiguous bit ranges,
+    keyed by position and value, e.g. "2:5f"."""
+    value = int(perceptual_hash, 16)
+    bits = len(perceptual_hash) * 4
+    bands = []
+    end = bits
+    for index in range(PHASH_BANDS):
+        width = bits // PHASH_BANDS + (1 if index < bits % PHASH_BANDS else 0)
+        end -= width
+        bands.append(f"{index}:{(value >> end) & ((1 << width) - 1):x}")
+    return bands
+
+
+def _phash_rows(item):
+    perceptual_hash = item.get("perceptualHash")
+    if not perceptual_hash:
+        return []
+    return [
+        {
+            "band": band,
+            "objectKey": item["objectKey"],
+            "perceptualHash": perceptual_hash,
+        }
+        for band in _phash_bands(perceptual_hash)
+    ]
+
+
+def _hamming_distance(left, right):
+    return bin(int(left, 16) ^ int(right, 16)).count("1")
+
+
+def _query_band(band):
+    rows = []
+    query_kwargs = {
+        "KeyConditionExpression": Key("band").eq(band),
+        "ProjectionExpression": "objectKey, perceptualHash",
+    }
+    while True:
+        result = phash_index_table.query(**query_kwargs)
+        rows.extend(result.get("Items", []))
+
+        last_evaluated_key = result.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return rows
+
+
+def _find_near_duplicates(perceptual_hash, object_key):
+    """Return stored uploads within NEAR_DUPLICATE_DISTANCE of the hash."""
+    global _band_executor
+
+    if _band_executor is None:
+        _band_executor = ThreadPoolExecutor(max_workers=PHASH_BANDS)
+    matches = {}
+    # One query per band, all in parallel.
+    for rows in _band_executor.map(_query_band, _phash_bands(perceptual_hash)):
+        for row in rows:
+            candidate_key = row.get("objectKey")
+            if not candidate_key or candidate_key == object_key or candidate_key in matches:
+                continue
+            distance = _hamming_distance(perceptual_hash, row["perceptualHash"])
+            if distance <= NEAR_DUPLICATE_DISTANCE:
+                matches[candidate_key] = distance
+
+    return [
+        {"objectKey": key, "distance": distance}
+        for key, distance in sorted(matches.items(), key=lambda entry: (entry[1], entry[0]))
+    ]
+
+
+def _content_md5(bucket, object_key, etag, size):
+    """Return the hex MD5 of the object's content, or None if too costly."""
+    if etag and "-" not in etag:
+        return etag
+
+    if size > CONTENT_HASH_MAX_BYTES:
+        return None
+
+    digest = hashlib.md5(usedforsecurity=False)
+    body = s3_client.get_object(Bucket=bucket, Key=object_key)["Body"]
+    for chunk in iter(lambda: body.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _verify_upload(bucket, object_key):
+    """Confirm the image exists and describe it for the metadata record."""
+    head = s3_client.head_object(Bucket=bucket, Key=object_key)
+    etag = str(head.get("ETag") or "").strip('"')
+    size = int(head.get("ContentLength") or 0)
+    details = {
+        "objectSize": size,
+        "objectEtag": etag,
+        "objectContentType": head.get("ContentType"),
+        "contentHash": None,
+    }
+
+    content_md5 = _content_md5(bucket, object_key, etag, size)
+    if content_md5:
+        details["contentHash"] = f"md5:{content_md5}"
+    return details
+
+
+def _write_metadata(item):
+    """Store the metadata record, its content-hash claim, perceptual-hash
+    bands and item-index rows atomically."""
+    claims_hash = content_hash_table is not None and bool(item.get("contentHash"))
+    phash_rows = _phash_rows(item) if phash_index_table is not None else []
+    if item_index_table is None and not claims_hash and not phash_rows:
+        metadata_table.put_item(
+            Item=item,
+            ConditionExpression=Attr("objectKey").not_exists(),
+        )
+        return
+
+    transact_items = [
+        {
+            "Put": {
+                "TableName": TABLE_NAME,
+                "Item": item,
+                "ConditionExpression": "attribute_not_exists(objectKey)",
+            }
+        }
+    ]
+    if claims_hash:
+        transact_items.append(
+            {
+                "Put": {
+                    "TableName": CONTENT_HASH_TABLE_NAME,
+                    "Item": {
+                        "contentHash": item["contentHash"],
+                        "objectKey": item["objectKey"],
+                        "createdAt": item["createdAt"],
+                    },
+                    "ConditionExpression": "attribute_not_exists(contentHash)",
+                }
+            }
+        )
+    transact_items.extend(
+        {"Put": {"TableName": PHASH_INDEX_TABLE_NAME, "Item": row}}
+        for row in phash_rows
+    )
+    if item_index_table is not None:
+        transact_items.extend(
+            {"Put": {"TableName": ITEM_INDEX_TABLE_NAME, "Item": row}}
+            for row in _index_rows(item)
+        )
+    # The resource's client serializes native Python values like Table does.
+    dynamodb.meta.client.transact_write_items(TransactItems=transact_items)
+
+
+def _duplicate_write_reason(error):
+    """Return "objectKey" or "content" for a failed uniqueness condition."""
+    code = error.response["Error"]["Code"]
+    if code == "ConditionalCheckFailedException":
+        return "objectKey"
+    if code == "TransactionCanceledException":
+        reasons = [
+            reason.get("Code")
+            for reason in error.response.get("CancellationReasons") or []
+        ]
+        if reasons and reasons[0] == "ConditionalCheckFailed":
+            return "objectKey"
+        if len(reasons) > 1 and reasons[1] == "ConditionalCheckFailed":
+            return "content"
+    return None
+
+
+def _original_upload_for(content_hash):
+    try:
+        result = content_hash_table.get_item(Key={"contentHash": content_hash})
+    except ClientError:
+        return None
+    return (result.get("Item") or {}).get("objectKey")
+
+
+def _backfill_item_index():
+    """Write index rows for every stored metadata record (idempotent), and
+    drop perceptual-hash rows left from an older band layout."""
+    if item_index_table is None and phash_index_table is None:
+        return {"skipped": "item index not configured"}
+
+    scan_kwargs = {}
+    written = 0
+    phash_written = 0
+    phash_removed = _remove_stale_phash_rows() if phash_index_table is not None else 0
+
+    phash_writer = (
+        phash_index_table.batch_writer() if phash_index_table is not None else nullcontext()
+    )
+    index_writer = (
+        item_index_table.batch_writer() if item_index_table is not None else nullcontext()
+    )
+    with index_writer as batch, phash_writer as phash_batch:
+        while True:
+            result = metadata_table.scan(**scan_kwargs)
+            for record in result.get("Items", []):
+                if not record.get("objectKey") or not record.get("items"):
+                    continue
+                if batch is not None:
+                    for row in _index_rows(record):
+                        batch.put_item(Item=row)
+                        written += 1
+                if phash_batch is not None:
+                    for row in _phash_rows(record):
+                        phash_batch.put_item(Item=row)
+                        phash_written += 1
+
+            last_evaluated_key = result.get("LastEvaluatedKey")
+            if not last_evaluated_key:
+                break
+            scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+
+    summary = {
+        "indexRowsWritten": written,
+        "phashRowsWritten": phash_written,
+        "phashRowsRemoved": phash_removed,
+    }
+    if item_index_table is None:
+        summary["skipped"] = "item index not configured"
+    return summary
+
+
+def _remove_stale_phash_rows():
+    scan_kwargs = {"ProjectionExpression": "band, objectKey, perceptualHash"}
+    removed = 0
+    with phash_index_table.batch_writer() as batch:
+        while True:
+            result = phash_index_table.scan(**scan_kwargs)
+            for row in result.get("Items", []):
+                if row["band"] not in _phash_bands(row["perceptualHash"]):
+                    batch.delete_item(Key={"band": row["band"], "objectKey": row["objectKey"]})
+                    removed += 1
+
+            last_evaluated_key = result.get("LastEvaluatedKey")
+            if not last_evaluated_key:
+                break
+            scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
+    return removed
+
+
+def _warm_up():
+    """Prime clients and caches for a scheduled warm-up; no auth, no writes."""
+    started = time.perf_counter()
+    primed = {}
+    try:
+        _load_catalog_ids()
+        primed["catalogIds"] = len(catalog_ids["ids"] or ())
+        if metadata_table is not None:
+            metadata_table.load()
+            primed["table"] = TABLE_NAME
+    except ClientError as error:
+        logger.warning("Warm-up could not prime everything: %s", error)
+        primed["error"] = error.response["Error"]["Code"]
+
+    summary = {
+        "warmUp": True,
+        "coldStart": container_state["invocations"] == 1,
+        "primingMs": round((time.perf_counter() - started) * 1000, 1),
+        "primed": primed,
+    }
+    logger.info("Warm-up: %s", summary)
+    return summary
+
+
+def lambda_handler(event, context):
+    return traffic_capture.invoke(CAPTURE_FUNCTION_NAME, _handle_event, event, context)
+
+
+def _handle_event(event, _context):
+    container_state["invocations"] += 1
+    if (event or {}).get("action") == "warmup":
+        # Scheduled EventBridge warm-up; answered before auth.
+        return _warm_up()
+
+    if (event or {}).get("action") == "backfill_index":
+        # Direct invocation (console/CLI) used to index records written
+        # before the item index existed.
+        summary = _backfill_item_index()
+        logger.info("Backfilled item index: %s", summary)
+        return summary
 
-def lambda_handler(event, _context):
     if (event or {}).get("httpMethod") == "OPTIONS":
         return {
             "statusCode": 204,
@@ -158,10 +635,31 @@ def lambda_handler(event, _context):
         return _response(400, {"message": str(exc)})
 
     try:
-        normalized_items, uploaded_by = _validate_payload(payload)
+        normalized_items, uploaded_by, perceptual_hash = _validate_payload(payload)
     except ValueError as exc:
         return _response(400, {"message": str(exc)})
 
+    distinct_item_count = len({item["menuItemId"] for item in normalized_items})
+    if item_index_table is not None and distinct_item_count > MAX_INDEXED_ITEMS:
+        return _response(
+            400,
+            {"message": f"A plate can list at most {MAX_INDEXED_ITEMS} menu items."},
+        )
+
+    upload_details = {}
+    bucket = payload.get("bucket") or S3_BUCKET
+    if bucket:
+        try:
+            upload_details = _verify_upload(bucket, payload["objectKey"])
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return _response(
+                    400,
+                    {"message": "Uploaded image not found. Upload the image before saving metadata."},
+                )
+            logger.exception("Failed to verify upload %s: %s", payload["objectKey"], error)
+            return _response(500, {"message": "Could not verify upload. Try again later."})
+
     now = datetime.now(timezone.utc)
 
     item = {
@@ -174,30 +672,67 @@ def lambda_handler(event, _context):
         "items": normalized_items,
         "createdAt": now.isoformat(),
         "uploadedBy": uploaded_by,
+        "perceptualHash": perceptual_hash,
+        **upload_details,
     }
 
-    # Strip empty optional nested fields to keep the record tidy.
-    if not item["bucket"]:
-        item.pop("bucket")
+    # Strip empty optional fields to keep the record tidy.
+    for optional_field in ("bucket", "objectContentType", "contentHash", "perceptualHash"):
+        if not item.get(optional_field):
+            item.pop(optional_field, None)
 
     try:
-        metadata_table.put_item(
-            Item=item,
-            ConditionExpression=Attr("objectKey").not_exists(),
-        )
+        _write_metadata(item)
     except ClientError as error:
-        if error.response["Error"]["Code"] == "ConditionalCheckFailedException":
+        reason = _duplicate_write_reason(error)
+        if reason == "objectKey":
             logger.warning("Metadata already exists for objectKey=%s", payload["objectKey"])
             return _response(
                 409, {"message": "Metadata already recorded for this upload."}
             )
+        if reason == "content":
+            duplicate_of = _original_upload_for(item["contentHash"])
+            logger.warning(
+                "Duplicate image objectKey=%s matches %s", payload["objectKey"], duplicate_of
+            )
+            return _response(
+                409,
+                {
+                    "message": "This image was already uploaded and labeled.",
+                    "duplicateOf": duplicate_of,
+                },
+            )
         logger.exception("Failed to write metadata: %s", error)
         return _response(500, {"message": "Could not save metadata. Try again later."})
 
-    return _response(
-        201,
-        {
-            "objectKey": payload["objectKey"],
-            "createdAt": item["createdAt"],
-        },
-    )
+    if coverage_table is not None:
+        try:
+            _update_coverage(item)
+        except ClientError as error:
+            # The metadata row is the source of truth; a coverage rebuild
+            # (get_coverage invoked with {"action": "rebuild"}) reconciles it.
+            logger.exception(
+                "Failed to update coverage for objectKey=%s: %s",
+                payload["objectKey"],
+                error,
+            )
+
+    result = {
+        "objectKey": payload["objectKey"],
+        "createdAt": item["createdAt"],
+    }
+
+    if phash_index_table is not None and perceptual_hash:
+        try:
+            result["nearDuplicates"] = _find_near_duplicates(
+                perceptual_hash, payload["objectKey"]
+            )
+        except ClientError as error:
+            # Advisory only; GET /dataset/duplicates lists them later.
+            logger.exception(
+                "Failed to look up near duplicates for objectKey=%s: %s",
+                payload["objectKey"],
+                error,
+            )
+
+    return _response(201, result)
@@ -0,0 +1,511 @@
+"""Long-running asyncio HTTP server for the MenuMatch Lambda handlers.
+
+Serves the same routes as the API Gateway HTTP API (see `infra/main.tf`)
+from one or more worker processes, translating each HTTP request into a
+payload v2 event for the unchanged `lambda_handler` functions:
+
+    python server.py --port 8080 --workers 4 --threads 32
+    python server.py --local --rows 1000 --guesses 1000
+
+`--local` starts moto in server mode and the Husky Eats stub from
+`aws/bench`, seeds them like the benchmark harness does, and points every
+worker at them.
+"""
+import argparse
+import asyncio
+import base64
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote
+
+SERVER_DIR = Path(__file__).resolve().parent
+LAMBDAS_DIR = SERVER_DIR.parent / "lambdas"
+# Modules packaged next to every handler in its Lambda zip.
+SHARED_DIR = LAMBDAS_DIR / "_shared"
+BENCH_DIR = SERVER_DIR.parent / "bench"
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024  # API Gateway's payload limit.
+KEEP_ALIVE_SECONDS = 15
+LOG_FORMAT = "%(asctime)s [%(process)d] %(levelname)s %(message)s"
+
+# Same route keys as the aws_apigatewayv2_route resources. Exact routes win
+# over greedy ones, as in API Gateway.
+ROUTES = (
+    ("GET", "/dataset", "get_dataset"),
+    ("GET", "/dataset/manifest", "get_dataset"),
+    ("GET", "/dataset/coverage", "get_coverage"),
+    ("GET", "/dataset/duplicates", "get_duplicates"),
+    ("GET", "/dataset/{objectKey+}", "get_dataset_item"),
+    ("POST", "/uploads/presign", "presign_upload"),
+    ("POST", "/uploads/multipart/parts", "presign_upload"),
+    ("POST", "/uploads/multipart/complete", "presign_upload"),
+    ("POST", "/uploads/multipart/abort", "presign_upload"),
+    ("POST", "/uploads/metadata", "upload_metadata"),
+    ("POST", "/downloads/presign", "presign_download"),
+    ("GET", "/guestimate/sample", "guestimate"),
+    ("POST", "/guestimate/guess", "guestimate"),
+    ("GET", "/guestimate/analysis", "guestimate"),
+    ("GET", "/guestimate/leaderboard", "guestimate"),
+    ("GET", "/guestimate/guesses", "guestimate"),
+    ("POST", "/guestimate/runs", "guestimate"),
+    ("POST", "/guestimate/runs/{runId}/predictions", "guestimate"),
+    ("GET", "/guestimate/runs/compare", "guestimate"),
+    ("GET", "/menu/search", "search_menu_items"),
+)
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "GET,POST,OPTIONS",
+}
+
+logger = logging.getLogger("menumatch.server")
+
+
+class _LambdaContext:
+    """The subset of the Lambda context object handlers may look at."""
+
+    def __init__(self, function_name, timeout_seconds):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def _match_route(method, path):
+    """Return (module name, path parameters), or None."""
+    segments = path.strip("/").split("/")
+    greedy_match = None
+    for route_method, pattern, module_name in ROUTES:
+        if route_method != method:
+            continue
+        pattern_segments = pattern.strip("/").split("/")
+        params = {}
+        for index, expected in enumerate(pattern_segments):
+            if expected.endswith("+}"):
+                rest = segments[index:]
+                if rest and all(rest):
+                    params[expected[1:-2]] = unquote("/".join(rest))
+                    if greedy_match is None:
+                        greedy_match = (module_name, params)
+                params = None
+                break
+            if index >= len(segments):
+                params = None
+                break
+            if expected.startswith("{"):
+                if not segments[index]:
+                    params = None
+                    break
+                params[expected[1:-1]] = unquote(segments[index])
+            elif expected != segments[index]:
+                params = None
+                break
+        if params is not None and len(pattern_segments) == len(segments):
+            return module_name, params
+    return greedy_match
+
+
+def _build_event(method, target, headers, body):
+    """Build an API Gateway HTTP API (payload v2) event."""
+    raw_path, _, raw_query = target.partition("?")
+    raw_path = raw_path or "/"
+
+    query = {}
+    for key, value in parse_qsl(raw_query, keep_blank_values=True):
+        # API Gateway joins repeated query parameters with commas.
+        query[key] = f"{query[key]},{value}" if key in query else value
+
+    event = {
+        "version": "2.0",
+        "routeKey": f"{method} {raw_path}",
+        "rawPath": raw_path,
+        "rawQueryString": raw_query,
+        "headers": headers,
+        "queryStringParameters": query or None,
+        "pathParameters": None,
+        "requestContext": {
+            "http": {"method": method, "path": raw_path, "protocol": "HTTP/1.1"},
+            "requestId": str(uuid.uuid4()),
+            "timeEpoch": int(time.time() * 1000),
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+    if body:
+        try:
+            event["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            event["body"] = base64.b64encode(body).decode("ascii")
+            event["isBase64Encoded"] = True
+    return event
+
+
+def _encode_response(result, keep_alive):
+    """Serialize a handler result the way API Gateway would."""
+    if not isinstance(result, dict) or "statusCode" not in result:
+        result = {
+            "statusCode": 200,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(result),
+        }
+
+    body = result.get("body") or b""
+    if isinstance(body, str):
+        body = base64.b64decode(body) if result.get("isBase64Encoded") else body.encode("utf-8")
+
+    status = int(result.get("statusCode", 200))
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+
+    headers = {**CORS_HEADERS, **(result.get("headers") or {})}
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    lines.extend(
+        f"{name}: {value}"
+        for name, value in headers.items()
+        if name.lower() not in ("content-length", "connection", "transfer-encoding")
+    )
+    for cookie in result.get("cookies") or []:
+        lines.append(f"Set-Cookie: {cookie}")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+def _error_response(status, message, keep_alive=False):
+    return _encode_response(
+        {
+            "statusCode": status,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps({"message": message}),
+        },
+        keep_alive,
+    )
+
+
+class _HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def _read_request(reader):
+    """Read one HTTP/1.1 request; None when the client closed the connection."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as error:
+        if error.partial.strip():
+            raise _HttpError(400, "Incomplete request.") from error
+        return None
+    except asyncio.LimitOverrunError as error:
+        raise _HttpError(431, "Request headers too large.") from error
+
+    request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+    try:
+        method, target, version = request_line.split(" ", 2)
+    except ValueError as error:
+        raise _HttpError(400, "Malformed request line.") from error
+
+    headers = {}
+    for line in header_lines:
+        name, separator, value = line.partition(":")
+        if not separator:
+            raise _HttpError(400, "Malformed header.")
+        name = name.strip().lower()
+        value = value.strip()
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise _HttpError(411, "Chunked request bodies are not supported.")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError as error:
+        raise _HttpError(400, "Invalid Content-Length.") from error
+    if length > MAX_BODY_BYTES:
+        raise _HttpError(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method.upper(), target, headers, body, keep_alive
+
+
+class ApiServer:
+    """Dispatch HTTP requests to the Lambda handlers on a bounded thread pool.
+
+    The handlers block on boto3 and Husky Eats calls, so they run off the
+    event loop. The loop itself only parses requests and writes responses,
+    which lets one process hold many idle keep-alive connections while
+    `threads` handlers run at once. Requests wait for a free thread on the
+    loop, so one whose deadline passes while queued is answered with 503
+    without ever occupying a thread.
+    """
+
+    def __init__(self, threads, timeout_seconds):
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="handler")
+        self.handlers = {}
+        self._slots = None
+        self._threads = threads
+
+    def load_handlers(self):
+        if str(SHARED_DIR) not in sys.path:
+            sys.path.insert(0, str(SHARED_DIR))
+        for module_name in sorted({module_name for _method, _pattern, module_name in ROUTES}):
+            path = LAMBDAS_DIR / module_name / f"{module_name}.py"
+            spec = importlib.util.spec_from_file_location(module_name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            self.handlers[module_name] = module.lambda_handler
+
+    def warm_up(self):
+        # Same event the EventBridge warm-up rule sends, so the first request
+        # to each worker does not pay for cache loads.
+        for module_name, handler in sorted(self.handlers.items()):
+            try:
+                summary = handler({"action": "warmup"}, None)
+            except Exception:
+                logger.exception("Warm-up failed for %s", module_name)
+                continue
+            logger.info("Warmed %s in %s ms", module_name, summary.get("primingMs"))
+
+    async def dispatch(self, method, target, headers, body):
+        if method == "OPTIONS":
+            return {"statusCode": 204, "headers": {}, "body": ""}
+
+        event = _build_event(method, target, headers, body)
+        matched = _match_route(method, event["rawPath"])
+        if matched is None:
+            return {
+                "statusCode": 404,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"message": "Not Found"}),
+            }
+        module_name, path_params = matched
+        event["pathParameters"] = path_params or None
+
+        context = _LambdaContext(module_name, self.timeout_seconds)
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout_seconds)
+            future = loop.run_in_executor(
+                self.executor, self.handlers[module_name], event, context
+            )
+            # The slot is held until the handler really finishes, even if
+            # the client has already been answered with a timeout.
+            future.add_done_callback(lambda _future: self._slots.release())
+            return await asyncio.wait_for(
+                asyncio.shield(future), context.get_remaining_time_in_millis() / 1000
+            )
+        except asyncio.TimeoutError:
+            logger.error("%s %s timed out after %ss", method, event["rawPath"], self.timeout_seconds)
+            return {
+                "statusCode": 503,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"message": "Service Unavailable"}),
+            }
+        except Exception:
+            logger.exception("Unhandled error in %s", module_name)
+            return {
+                "statusCode": 500,
+                "headers": {"Content-Type": "application/json"},
+                "body": json.dumps({"message": "Internal Server Error"}),
+            }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                except _HttpError as error:
+                    writer.write(_error_response(error.status, str(error)))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body, keep_alive = request
+                started = time.perf_counter()
+                result = await self.dispatch(method, target, headers, body)
+                writer.write(_encode_response(result, keep_alive))
+                await writer.drain()
+                logger.debug(
+                    "%s %s %s %.1fms",
+                    method,
+                    target,
+                    result.get("statusCode") if isinstance(result, dict) else 200,
+                    (time.perf_counter() - started) * 1000,
+                )
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, sock):
+        self._slots = asyncio.Semaphore(self._threads)
+        server = await asyncio.start_server(
+            self.handle_connection, sock=sock, limit=MAX_HEADER_BYTES, backlog=1024
+        )
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        async with server:
+            await stop.wait()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _configure_aws_pool(threads):
+    """Size botocore's connection pool so every handler thread gets one."""
+    import boto3
+    import botocore.session
+    from botocore.config import Config
+
+    session = botocore.session.get_session()
+    session.set_default_client_config(Config(max_pool_connections=threads))
+    boto3.setup_default_session(botocore_session=session)
+
+
+def _run_worker(sock, threads, timeout_seconds, log_level):
+    logging.basicConfig(level=log_level, format=LOG_FORMAT)
+    # Handlers create their boto3 clients at import time, so the pool size and
+    # the Husky Eats pool must be set before they load.
+    os.environ.setdefault("HUSKYEATS_POOL_SIZE", str(threads))
+    _configure_aws_pool(threads)
+    server = ApiServer(threads, timeout_seconds)
+    server.load_handlers()
+    server.warm_up()
+    logger.info("Worker ready with %s handler threads", threads)
+    asyncio.run(server.serve(sock))
+
+
+def _start_local_services(args):
+    """Start moto and the Husky Eats stub and seed them like `bench.py run`."""
+    sys.path.insert(0, str(BENCH_DIR))
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as exc:
+        raise SystemExit('moto[server] is required for --local.') from exc
+    import bench
+    from huskyeats_stub import HuskyEatsStub, build_catalog
+
+    stub = HuskyEatsStub(
+        build_catalog(args.catalog_size, seed=args.seed), latency_ms=args.husky_latency_ms
+    )
+    stub.__enter__()
+    moto_server = ThreadedMotoServer(ip_address="127.0.0.1", port=args.moto_port)
+    moto_server.start()
+
+    args.endpoint_url = f"http://127.0.0.1:{args.moto_port}"
+    bench._configure_environment(args, stub.base_url)
+
+    import boto3
+
+    dynamodb, _s3 = bench._create_resources(boto3)
+    bench.seed_dataset(dynamodb, args.rows, args.guesses, args.catalog_size, seed=args.seed)
+    for module_name, setup_events in bench.SETUP_EVENTS.items():
+        handler = bench._load_handler(module_name).lambda_handler
+        for setup_event in setup_events:
+            handler(setup_event, None)
+    logger.info(
+        "Local stand-ins ready: AWS at %s, Husky Eats at %s, API token %r",
+        args.endpoint_url,
+        stub.base_url,
+        bench.AUTH_TOKEN,
+    )
+    return stub, moto_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes."
+    )
+    parser.add_argument(
+        "--threads", type=int, default=32, help="Concurrent handler calls per worker."
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Per-request handler timeout in seconds."
+    )
+    parser.add_argument("--endpoint-url", help="DynamoDB/S3 endpoint for local services.")
+    parser.add_argument("--log-level", default="INFO")
+
+    local_group = parser.add_argument_group("local stand-ins")
+    local_group.add_argument(
+        "--local", action="store_true", help="Run against seeded moto + Husky Eats stub."
+    )
+    local_group.add_argument("--moto-port", type=int, default=5055)
+    local_group.add_argument("--rows", type=int, default=1000)
+    local_group.add_argument("--guesses", type=int, default=1000)
+    local_group.add_argument("--catalog-size", type=int, default=500)
+    local_group.add_argument("--husky-latency-ms", type=float, default=25.0)
+    local_group.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level, format=LOG_FORMAT)
+    logging.getLogger("botocore").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    if args.endpoint_url:
+        os.environ["AWS_ENDPOINT_URL"] = args.endpoint_url
+    local_services = _start_local_services(args) if args.local else None
+
+    # Bound once here and shared by every worker, which all accept on it.
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+    logger.info("Listening on http://%s:%s with %s workers", args.host, args.port, args.workers)
+
+    worker_args = (sock, args.threads, args.timeout, args.log_level)
+    try:
+        if args.workers <= 1:
+            _run_worker(*worker_args)
+            return
+
+        context = multiprocessing.get_context("fork")
+        workers = [
+            context.Process(target=_run_worker, args=worker_args, daemon=True)
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def _stop_workers(_signum, _frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        signal.signal(signal.SIGINT, _stop_workers)
+        signal.signal(signal.SIGTERM, _stop_workers)
+        for worker in workers:
+            worker.join()
+    finally:
+        sock.close()
+        if local_services:
+            stub, moto_server = local_services
+            moto_server.stop()
+            stub.__exit__(None, None, None)
+
+
+if __name__ == "__main__":
+    main()
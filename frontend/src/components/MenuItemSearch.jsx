@@ -1,17 +1,21 @@
 import { useEffect, useMemo, useRef, useState } from 'react'
 
+const SEARCH_DEBOUNCE_MS = 150
+
 function MenuItemSearch({
   items,
   status,
   error,
   selectedId,
   helperMessage,
+  searchItems,
   onSelect,
   onRetry,
 }) {
   const [query, setQuery] = useState('')
   const [open, setOpen] = useState(false)
   const [activeIndex, setActiveIndex] = useState(0)
+  const [rankedMatches, setRankedMatches] = useState(null)
   const containerRef = useRef(null)
   const inputRef = useRef(null)
 
@@ -76,6 +80,33 @@ function MenuItemSearch({
   const normalizedQuery = query.trim().toLowerCase()
   const canSearch = isInteractive
 
+  useEffect(() => {
+    if (!searchItems || !canSearch || !normalizedQuery) {
+      setRankedMatches(null)
+      return
+    }
+
+    // Ranked, typo-tolerant matches from the API; substring matches on the
+    // loaded menu show until they arrive or if the request fails.
+    const controller = new AbortController()
+    const timer = setTimeout(() => {
+      searchItems(normalizedQuery, controller.signal)
+        .then((matches) =>
+          setRankedMatches({ query: normalizedQuery, items: matches }),
+        )
+        .catch((searchError) => {
+          if (searchError.name !== 'AbortError') {
+            setRankedMatches(null)
+          }
+        })
+    }, SEARCH_DEBOUNCE_MS)
+
+    return () => {
+      clearTimeout(timer)
+      controller.abort()
+    }
+  }, [searchItems, canSearch, normalizedQuery])
+
   const filteredItems = useMemo(() => {
     if (!canSearch || !items.length) {
       return []
@@ -85,6 +116,10 @@ function MenuItemSearch({
       return items
     }
 
+    if (rankedMatches?.query === normalizedQuery) {
+      return rankedMatches.items
+    }
+
     const matches = items.filter((item) => {
       const nameMatch = item.name.toLowerCase().includes(normalizedQuery)
       const idMatch = item.id.includes(normalizedQuery)
@@ -92,7 +127,7 @@ function MenuItemSearch({
     })
 
     return matches
-  }, [canSearch, items, normalizedQuery])
+  }, [canSearch, items, normalizedQuery, rankedMatches])
 
   useEffect(() => {
     if (activeIndex >= filteredItems.length) {
@@ -0,0 +1,40 @@
+const HASH_WIDTH = 9
+const HASH_HEIGHT = 8
+
+// 64-bit difference hash (dHash): shrink to 9×8 grayscale and record whether
+// each pixel is brighter than its right-hand neighbour. Small crops, angle
+// changes and recompression flip only a few bits, so near-duplicate plates
+// end up a short Hamming distance apart.
+export function computeDifferenceHash(image) {
+  const canvas = document.createElement('canvas')
+  canvas.width = HASH_WIDTH
+  canvas.height = HASH_HEIGHT
+  const context = canvas.getContext('2d', { willReadFrequently: true })
+  if (!context) {
+    return null
+  }
+
+  context.imageSmoothingEnabled = true
+  context.imageSmoothingQuality = 'high'
+  context.drawImage(image, 0, 0, HASH_WIDTH, HASH_HEIGHT)
+  const { data } = context.getImageData(0, 0, HASH_WIDTH, HASH_HEIGHT)
+
+  const luma = new Array(HASH_WIDTH * HASH_HEIGHT)
+  for (let index = 0; index < luma.length; index += 1) {
+    const offset = index * 4
+    luma[index] =
+      0.299 * data[offset] + 0.587 * data[offset + 1] + 0.114 * data[offset + 2]
+  }
+
+  let hex = ''
+  for (let row = 0; row < HASH_HEIGHT; row += 1) {
+    let byte = 0
+    for (let column = 0; column < HASH_WIDTH - 1; column += 1) {
+      const left = luma[row * HASH_WIDTH + column]
+      const right = luma[row * HASH_WIDTH + column + 1]
+      byte = (byte << 1) | (left > right ? 1 : 0)
+    }
+    hex += byte.toString(16).padStart(2, '0')
+  }
+  return hex
+}
@@ -24,11 +24,10 @@ function CoveragePage() {
   const { authToken, openTokenModal } = useApiToken()
   const [datasetStatus, setDatasetStatus] = useState('idle')
   const [datasetError, setDatasetError] = useState('')
-  const [records, setRecords] = useState([])
+  const [coverageEntries, setCoverageEntries] = useState([])
 
-  const [menuStatus, setMenuStatus] = useState('idle')
-  const [menuError, setMenuError] = useState('')
-  const [menuItems, setMenuItems] = useState([])
+  const [catalogCount, setCatalogCount] = useState(0)
+  const [coveredCount, setCoveredCount] = useState(0)
 
   const [pendingSearch, setPendingSearch] = useState('')
   const [appliedSearch, setAppliedSearch] = useState('')
@@ -46,16 +45,18 @@ function CoveragePage() {
     if (!authToken) {
       setDatasetStatus('idle')
       setDatasetError('')
-      setRecords([])
+      setCoverageEntries([])
+      setCatalogCount(0)
+      setCoveredCount(0)
       return
     }
 
     const controller = new AbortController()
-    const fetchDataset = async () => {
+    const fetchCoverage = async () => {
       setDatasetStatus('loading')
       setDatasetError('')
       try {
-        const response = await fetch(`${API_BASE_URL}/dataset`, {
+        const response = await fetch(`${API_BASE_URL}/dataset/coverage`, {
           method: 'GET',
           headers: {
             Accept: 'application/json',
@@ -65,7 +66,7 @@ function CoveragePage() {
         })
 
         if (!response.ok) {
-          let message = `Dataset request failed with status ${response.status}.`
+          let message = `Coverage request failed with status ${response.status}.`
           try {
             const payload = await response.json()
             if (payload?.message) {
@@ -79,7 +80,9 @@ function CoveragePage() {
 
         const payload = await response.json()
         const items = Array.isArray(payload?.items) ? payload.items : []
-        setRecords(items)
+        setCoverageEntries(items)
+        setCatalogCount(Number(payload?.catalogCount ?? items.length) || 0)
+        setCoveredCount(Number(payload?.coveredCount) || 0)
         setDatasetStatus('success')
       } catch (error) {
         if (error && typeof error === 'object' && error.name === 'AbortError') {
@@ -88,62 +91,19 @@ function CoveragePage() {
         const message =
           error instanceof Error && error.message
             ? error.message
-            : 'Failed to load dataset.'
+            : 'Failed to load coverage.'
         setDatasetStatus('error')
         setDatasetError(message)
       }
     }
 
-    fetchDataset()
+    fetchCoverage()
     return () => controller.abort()
   }, [authToken])
 
-  useEffect(() => {
-    const controller = new AbortController()
-    const fetchMenu = async () => {
-      setMenuStatus('loading')
-      setMenuError('')
-      try {
-        const response = await fetch('https://husky-eats.onrender.com/api/menuitem', {
-          method: 'GET',
-          signal: controller.signal,
-        })
-
-        if (!response.ok) {
-          throw new Error(`Menu request failed with status ${response.status}`)
-        }
-
-        const payload = await response.json()
-        if (!Array.isArray(payload)) {
-          throw new Error('Unexpected menu response format.')
-        }
-
-        setMenuItems(
-          payload.map((item) => ({
-            id: String(item?.id ?? ''),
-            name: item?.name ? String(item.name) : '',
-          })),
-        )
-        setMenuStatus('success')
-      } catch (error) {
-        if (error && typeof error === 'object' && error.name === 'AbortError') {
-          return
-        }
-        setMenuStatus('error')
-        setMenuError(
-          error instanceof Error && error.message
-            ? error.message
-            : 'Failed to load menu items.',
-        )
-      }
-    }
-
-    fetchMenu()
-    return () => controller.abort()
-  }, [])
-
   useEffect(() => {
     const hasContext =
+      Boolean(authToken) &&
       menuFilterEnabled &&
       Boolean(menuDate) &&
       Boolean(mealtime) &&
@@ -163,80 +123,84 @@ function CoveragePage() {
       setMenuContextStatus('loading')
       setMenuContextError('')
 
-      const hallIds =
-        diningHallId === 'all'
-          ? DINING_HALLS.map((hall) => hall.id)
-          : [diningHallId]
-      const mealIds =
-        mealtime === 'all'
-          ? ['breakfast', 'lunch', 'dinner']
-          : [mealtime]
+      const params = new URLSearchParams({ date: menuDate })
+      if (diningHallId !== 'all') {
+        params.set('hallId', diningHallId)
+      }
+      if (mealtime !== 'all') {
+        params.set('meal', mealtime)
+      }
 
       try {
-        const allIds = new Set()
-        const labels = new Map()
-        for (const hall of hallIds) {
-          for (const meal of mealIds) {
-            const params = new URLSearchParams({
-              hallid: hall,
-              meal,
-              date: menuDate,
-            })
-            const response = await fetch(
-              `https://husky-eats.onrender.com/api/menu?${params.toString()}`,
-              { signal: controller.signal },
-            )
-
-            if (!response.ok) {
-              throw new Error(
-                `Menu request failed with status ${response.status}`,
-              )
-            }
+        const response = await fetch(
+          `${API_BASE_URL}/dataset/coverage?${params.toString()}`,
+          {
+            method: 'GET',
+            headers: {
+              Accept: 'application/json',
+              'X-Api-Key': authToken,
+            },
+            signal: controller.signal,
+          },
+        )
 
+        if (!response.ok) {
+          let message = `Menu request failed with status ${response.status}.`
+          try {
             const payload = await response.json()
-            if (!Array.isArray(payload)) {
-              throw new Error('Unexpected menu response format.')
+            if (payload?.message) {
+              message = payload.message
             }
+          } catch (_error) {
+            // ignore parse error
+          }
+          throw new Error(message)
+        }
 
-            for (const item of payload) {
-              if (item?.id != null) {
-                const key = String(item.id)
-                allIds.add(key)
-                const hallName =
-                  hall === 'all'
-                    ? 'All halls'
-                    : DINING_HALLS.find((h) => String(h.id) === String(hall))
-                        ?.name || `Hall ${hall}`
-
-                const formatMeal = (value) =>
-                  value.charAt(0).toUpperCase() + value.slice(1)
-
-                const parts = []
-                if (diningHallId === 'all') {
-                  parts.push(hallName)
-                }
-                if (mealtime === 'all') {
-                  parts.push(formatMeal(meal))
-                }
-                let label = parts.join(' — ')
-                if (!label) {
-                  label = mealtime !== 'all' ? formatMeal(meal) : hallName
-                }
-                const ctxKey = `${hallName}|${meal}`
-                if (!labels.has(key)) {
-                  labels.set(key, new Map())
-                }
-                const ctxMap = labels.get(key)
-                if (!ctxMap.has(ctxKey)) {
-                  ctxMap.set(ctxKey, {
-                    label,
-                    hall: hallName,
-                    meal: formatMeal(meal),
-                  })
-                }
-              }
+        const payload = await response.json()
+        if (!Array.isArray(payload?.items)) {
+          throw new Error('Unexpected menu response format.')
+        }
+
+        const formatMeal = (value) =>
+          value.charAt(0).toUpperCase() + value.slice(1)
+
+        const allIds = new Set()
+        const labels = new Map()
+        for (const item of payload.items) {
+          if (item?.menuItemId == null) continue
+          const key = String(item.menuItemId)
+          allIds.add(key)
+
+          const ctxMap = new Map()
+          for (const context of item.menuContexts || []) {
+            const hall = String(context?.hallId ?? '')
+            const meal = String(context?.meal ?? '')
+            const hallName =
+              DINING_HALLS.find((h) => String(h.id) === hall)?.name ||
+              `Hall ${hall}`
+
+            const parts = []
+            if (diningHallId === 'all') {
+              parts.push(hallName)
+            }
+            if (mealtime === 'all') {
+              parts.push(formatMeal(meal))
+            }
+            let label = parts.join(' — ')
+            if (!label) {
+              label = mealtime !== 'all' ? formatMeal(meal) : hallName
+            }
+            const ctxKey = `${hallName}|${meal}`
+            if (!ctxMap.has(ctxKey)) {
+              ctxMap.set(ctxKey, {
+                label,
+                hall: hallName,
+                meal: formatMeal(meal),
+              })
             }
           }
+          labels.set(key, ctxMap)
         }
 
         if (cancelled) return
@@ -271,86 +235,46 @@ function CoveragePage() {
       cancelled = true
       controller.abort()
     }
-  }, [diningHallId, mealtime, menuDate, menuFilterEnabled, filterVersion])
+  }, [
+    authToken,
+    diningHallId,
+    mealtime,
+    menuDate,
+    menuFilterEnabled,
+    filterVersion,
+  ])
 
   const coverageById = useMemo(() => {
     const map = new Map()
 
-    for (const record of records) {
-      const items = Array.isArray(record?.items) ? record.items : []
-      const plateHasMultiple = items.length > 1
-
-      for (const item of items) {
-        const id = String(item?.menuItemId || '').trim()
-        if (!id) continue
-
-        if (!map.has(id)) {
-          map.set(id, {
-            total: 0,
-            multiCount: 0,
-            solo0to1: 0,
-            solo1to2: 0,
-            solo2plus: 0,
-          })
-        }
-        const entry = map.get(id)
-        entry.total += 1
-        if (plateHasMultiple) {
-          entry.multiCount += 1
-        } else {
-          const servings = Number(item?.servings)
-          if (Number.isFinite(servings)) {
-            if (servings <= 1) {
-              entry.solo0to1 += 1
-            } else if (servings <= 2) {
-              entry.solo1to2 += 1
-            } else {
-              entry.solo2plus += 1
-            }
-          } else {
-            entry.solo0to1 += 1
-          }
-        }
-      }
+    for (const entry of coverageEntries) {
+      const id = String(entry?.menuItemId || '').trim()
+      if (!id) continue
+
+      map.set(id, {
+        name: entry?.name ? String(entry.name) : '',
+        total: Number(entry.total) || 0,
+        multiCount: Number(entry.multiCount) || 0,
+        solo0to1: Number(entry.solo0to1) || 0,
+        solo1to2: Number(entry.solo1to2) || 0,
+        solo2plus: Number(entry.solo2plus) || 0,
+      })
     }
 
     return map
-  }, [records])
+  }, [coverageEntries])
 
   const rows = useMemo(() => {
     const searchTerm = appliedSearch.trim().toLowerCase()
-    const baseItems = menuItems.length > 0 ? menuItems : []
-
-    const combined = baseItems.map((menuItem) => {
-      const coverage = coverageById.get(menuItem.id) || {
-        total: 0,
-        multiCount: 0,
-        solo0to1: 0,
-        solo1to2: 0,
-        solo2plus: 0,
-      }
-
-      return {
-        id: menuItem.id,
-        name: menuItem.name,
+    // The coverage payload lists every catalog item plus dataset-only IDs.
+    const combined = Array.from(coverageById.entries()).map(
+      ([id, coverage]) => ({
+        id,
         ...coverage,
-        inMenu: menuContextItems.has(menuItem.id),
-        contexts: Array.from(contextLabels.get(menuItem.id) || []),
-      }
-    })
-
-    // Include dataset-only IDs not in catalog
-    for (const [id, coverage] of coverageById.entries()) {
-      if (!combined.find((row) => row.id === id)) {
-        combined.push({
-          id,
-          name: '',
-          ...coverage,
-          inMenu: menuContextItems.has(id),
-          contexts: Array.from(contextLabels.get(id) || []),
-        })
-      }
-    }
+        inMenu: menuContextItems.has(id),
+        contexts: Array.from(contextLabels.get(id) || []),
+      }),
+    )
 
     const filtered = combined.filter((row) => {
       if (!searchTerm) return true
@@ -389,22 +313,11 @@ function CoveragePage() {
     appliedSearch,
     coverageById,
     menuContextItems,
-    menuItems,
     menuFilterEnabled,
     filterVersion,
   ])
 
-  const totalCatalog = menuItems.length
-  const coveredCount = useMemo(() => {
-    let count = 0
-    for (const menuItem of menuItems) {
-      const coverage = coverageById.get(menuItem.id)
-      if (coverage && coverage.total > 0) {
-        count += 1
-      }
-    }
-    return count
-  }, [coverageById, menuItems])
+  const totalCatalog = catalogCount
 
   const visibleCount = rows.length
 
@@ -518,9 +431,6 @@ function CoveragePage() {
             {datasetStatus === 'error' && datasetError ? (
               <p className="text-xs text-red-600">{datasetError}</p>
             ) : null}
-            {menuStatus === 'error' && menuError ? (
-              <p className="text-xs text-red-600">{menuError}</p>
-            ) : null}
             {menuContextStatus === 'error' && menuContextError ? (
               <p className="text-xs text-red-600">{menuContextError}</p>
             ) : null}
@@ -641,7 +551,7 @@ function CoveragePage() {
             </div>
           ) : null}
 
-          {datasetStatus === 'loading' || menuStatus === 'loading' ? (
+          {datasetStatus === 'loading' ? (
             <p className="text-sm text-slate-600">Loading coverage…</p>
           ) : null}
 
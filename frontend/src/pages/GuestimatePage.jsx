@@ -1,4 +1,4 @@
-import { useCallback, useMemo, useState } from 'react'
+import { useCallback, useMemo, useRef, useState } from 'react'
 
 import ApiTokenStatusCard from '../components/ApiTokenStatusCard.jsx'
 import { useApiToken } from '../components/ApiTokenProvider.jsx'
@@ -7,6 +7,21 @@ import { getDiningHallName } from '../lib/diningHalls.js'
 
 const SESSION_STORAGE_KEY = 'menumatch-guestimate-session'
 
+// Samples requested per /guestimate/sample call; the extras are queued and
+// their images preloaded while the current plate is being guessed.
+const PREFETCH_COUNT = 5
+// Refetch queued samples whose presigned URL is this close to expiring.
+const PRESIGN_EXPIRY_MARGIN_MS = 30 * 1000
+// Resamples for the 95% bootstrap intervals shown next to each metric.
+const ANALYSIS_BOOTSTRAP_RESAMPLES = 1000
+
+const samplingStrategies = [
+  { value: 'sequential', label: 'Shuffled' },
+  { value: 'stratified', label: 'Balanced by dining hall' },
+  { value: 'least_guessed', label: 'Least guessed first' },
+  { value: 'exclude_guessed', label: "Only plates I haven't guessed" },
+]
+
 const macros = [
   {
     key: 'kcal',
@@ -109,6 +124,13 @@ function formatPercent(value, options = {}) {
   }).format(numeric)
 }
 
+function formatInterval(interval, format) {
+  if (!Array.isArray(interval) || interval.length !== 2) {
+    return null
+  }
+  return `95% CI ${format(interval[0])} – ${format(interval[1])}`
+}
+
 function formatSampleContext(sample) {
   if (!sample) {
     return ''
@@ -164,6 +186,29 @@ function GuestimatePage() {
   const [analysisError, setAnalysisError] = useState('')
   const [analysis, setAnalysis] = useState(null)
   const [runSeed, setRunSeed] = useState('')
+  const [strategy, setStrategy] = useState('sequential')
+  const [hasNext, setHasNext] = useState(false)
+  const prefetchRef = useRef({ entries: [], hasNext: false })
+  // Resubmitting the same guess reuses its key so the API replays the
+  // original result instead of recording a duplicate.
+  const idempotencyRef = useRef({ request: '', key: '' })
+  // The dataset version the run started on; later pages and guesses pin to
+  // it so uploads mid-run do not shift sample positions.
+  const manifestVersionRef = useRef('')
+
+  const showSample = useCallback((entry, total, more) => {
+    setSubmitError('')
+    setGuessError('')
+    setSubmitStatus('idle')
+    setResult(null)
+    setGuess({ ...initialGuess })
+    setSample(entry.sample || null)
+    setSampleIndex(entry.index)
+    setTotalCount(total)
+    setHasNext(more)
+    setSampleStatus('success')
+    setMode('play')
+  }, [])
 
   const fetchSample = useCallback(
     async (index, seed = runSeed) => {
@@ -181,10 +226,22 @@ function GuestimatePage() {
       setGuess({ ...initialGuess })
 
       try {
-        const params = new URLSearchParams({ index: String(index) })
+        const params = new URLSearchParams({
+          index: String(index),
+          count: String(PREFETCH_COUNT),
+        })
         if (seed) {
           params.set('seed', seed)
         }
+        if (strategy !== 'sequential') {
+          params.set('strategy', strategy)
+        }
+        if (strategy === 'exclude_guessed') {
+          params.set('clientSessionId', getGuestimateSessionId())
+        }
+        if (manifestVersionRef.current) {
+          params.set('manifestVersion', manifestVersionRef.current)
+        }
 
         const response = await fetch(
           `${API_BASE_URL}/guestimate/sample?${params.toString()}`,
@@ -206,13 +263,31 @@ function GuestimatePage() {
         }
 
         const payload = await response.json()
-        setSample(payload?.sample || null)
-        setSampleIndex(typeof payload?.index === 'number' ? payload.index : index)
-        setTotalCount(
+        if (!manifestVersionRef.current && payload?.manifestVersion) {
+          manifestVersionRef.current = payload.manifestVersion
+        }
+        const fetchedAt = Date.now()
+        const entries = (
+          Array.isArray(payload?.samples)
+            ? payload.samples
+            : [{ index: payload?.index ?? index, sample: payload?.sample }]
+        ).map((entry) => ({ ...entry, fetchedAt }))
+        const [first, ...queued] = entries
+        const batchHasNext = Boolean(payload?.hasNext)
+
+        prefetchRef.current = { entries: queued, hasNext: batchHasNext }
+        for (const entry of queued) {
+          if (entry.sample?.imageUrl) {
+            const image = new Image()
+            image.src = entry.sample.imageUrl
+          }
+        }
+
+        showSample(
+          first,
           typeof payload?.totalCount === 'number' ? payload.totalCount : 0,
+          queued.length > 0 || batchHasNext,
         )
-        setSampleStatus('success')
-        setMode('play')
       } catch (error) {
         const message =
           error instanceof Error && error.message
@@ -222,7 +297,7 @@ function GuestimatePage() {
         setSampleError(message)
       }
     },
-    [authToken, openTokenModal, runSeed],
+    [authToken, openTokenModal, runSeed, showSample, strategy],
   )
 
   const loadAnalysis = useCallback(async () => {
@@ -235,7 +310,10 @@ function GuestimatePage() {
     setAnalysisError('')
 
     try {
-      const response = await fetch(`${API_BASE_URL}/guestimate/analysis`, {
+      const params = new URLSearchParams({
+        bootstrap: String(ANALYSIS_BOOTSTRAP_RESAMPLES),
+      })
+      const response = await fetch(`${API_BASE_URL}/guestimate/analysis?${params}`, {
         method: 'GET',
         headers: {
           Accept: 'application/json',
@@ -268,13 +346,14 @@ function GuestimatePage() {
   const handlePlay = () => {
     setAnalysisError('')
     const seed = createGuestimateRunSeed()
+    manifestVersionRef.current = ''
     setRunSeed(seed)
     fetchSample(0, seed)
   }
 
   const handleNextSample = () => {
     const nextIndex = sampleIndex + 1
-    if (totalCount > 0 && nextIndex >= totalCount) {
+    if (!hasNext || (totalCount > 0 && nextIndex >= totalCount)) {
       setMode('home')
       setSample(null)
       setResult(null)
@@ -282,7 +361,23 @@ function GuestimatePage() {
       return
     }
 
-    fetchSample(nextIndex)
+    const prefetched = prefetchRef.current
+    const queued = prefetched.entries[0]
+    const expiresInMs = (queued?.sample?.expiresIn || 0) * 1000
+    if (
+      queued &&
+      Date.now() - queued.fetchedAt < expiresInMs - PRESIGN_EXPIRY_MARGIN_MS
+    ) {
+      prefetched.entries = prefetched.entries.slice(1)
+      showSample(
+        queued,
+        totalCount,
+        prefetched.entries.length > 0 || prefetched.hasNext,
+      )
+      return
+    }
+
+    fetchSample(queued ? queued.index : nextIndex)
   }
 
   const parsedGuess = useMemo(() => {
@@ -327,16 +422,26 @@ function GuestimatePage() {
     setGuessError('')
 
     try {
+      const requestSignature = JSON.stringify([sample.objectKey, parsedGuess])
+      if (idempotencyRef.current.request !== requestSignature) {
+        idempotencyRef.current = {
+          request: requestSignature,
+          key: createGuestimateRunSeed(),
+        }
+      }
+
       const response = await fetch(`${API_BASE_URL}/guestimate/guess`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'X-Api-Key': authToken,
+          'Idempotency-Key': idempotencyRef.current.key,
         },
         body: JSON.stringify({
           objectKey: sample.objectKey,
           guess: parsedGuess,
           clientSessionId: getGuestimateSessionId(),
+          manifestVersion: manifestVersionRef.current || undefined,
         }),
       })
 
@@ -388,6 +493,19 @@ function GuestimatePage() {
           </p>
         </div>
         <div className="flex flex-wrap gap-2">
+          <select
+            value={strategy}
+            onChange={(event) => setStrategy(event.target.value)}
+            disabled={mode === 'play' || sampleStatus === 'loading'}
+            aria-label="Sampling strategy"
+            className="rounded-md border border-slate-300 bg-white px-3 py-2 text-sm text-slate-700 shadow-sm outline-none transition focus:border-slate-500 focus:ring-2 focus:ring-slate-200 disabled:cursor-not-allowed disabled:text-slate-400"
+          >
+            {samplingStrategies.map((option) => (
+              <option key={option.value} value={option.value}>
+                {option.label}
+              </option>
+            ))}
+          </select>
           <button
             type="button"
             onClick={handlePlay}
@@ -683,6 +801,10 @@ function GuestimatePage() {
                 <div className="rounded-md border border-slate-200 bg-slate-50 px-4 py-3 text-sm text-slate-600">
                   % MAE excludes macro/sample pairs where ground truth is under
                   100 kcal or 5 g. MAE, RMSE, and bias still use all guesses.
+                  Intervals come from resampling whole plates, so they widen
+                  when only a few samples have been guessed. Median and p90
+                  absolute errors are read from error sketches and are within
+                  1% of the exact values.
                 </div>
 
                 {Number(analysis.guessCount) > 0 ? (
@@ -699,6 +821,9 @@ function GuestimatePage() {
                           <th className="px-4 py-3 text-left font-semibold">
                             RMSE
                           </th>
+                          <th className="px-4 py-3 text-left font-semibold">
+                            Median / p90 AE
+                          </th>
                           <th className="px-4 py-3 text-left font-semibold">
                             % MAE
                           </th>
@@ -710,21 +835,46 @@ function GuestimatePage() {
                       <tbody className="divide-y divide-slate-200">
                         {macros.map((macro) => {
                           const row = analysisNutrients[macro.metricKey] || {}
+                          const intervals = row.confidenceIntervals || {}
+                          const quantiles = row.absErrorQuantiles || {}
+                          const formatMacroValue = (value) =>
+                            formatMacro(value, macro.unit, metricNumberOptions)
+                          const formatPercentValue = (value) =>
+                            formatPercent(value, metricNumberOptions)
                           return (
                             <tr key={macro.key} className="even:bg-slate-50">
                               <td className="px-4 py-3 font-medium text-slate-900">
                                 {macro.label}
                               </td>
                               <td className="px-4 py-3 text-slate-700">
-                                {formatMacro(row.mae, macro.unit, metricNumberOptions)}
+                                <div className="flex flex-col gap-0.5">
+                                  <span>{formatMacroValue(row.mae)}</span>
+                                  <span className="text-xs text-slate-500">
+                                    {formatInterval(intervals.mae, formatMacroValue)}
+                                  </span>
+                                </div>
                               </td>
                               <td className="px-4 py-3 text-slate-700">
-                                {formatMacro(row.rmse, macro.unit, metricNumberOptions)}
+                                <div className="flex flex-col gap-0.5">
+                                  <span>{formatMacroValue(row.rmse)}</span>
+                                  <span className="text-xs text-slate-500">
+                                    {formatInterval(intervals.rmse, formatMacroValue)}
+                                  </span>
+                                </div>
                               </td>
                               <td className="px-4 py-3 text-slate-700">
                                 <div className="flex flex-col gap-0.5">
-                                  <span>
-                                    {formatPercent(row.pmae, metricNumberOptions)}
+                                  <span>{formatMacroValue(quantiles.p50)}</span>
+                                  <span className="text-xs text-slate-500">
+                                    p90 {formatMacroValue(quantiles.p90)}
+                                  </span>
+                                </div>
+                              </td>
+                              <td className="px-4 py-3 text-slate-700">
+                                <div className="flex flex-col gap-0.5">
+                                  <span>{formatPercentValue(row.pmae)}</span>
+                                  <span className="text-xs text-slate-500">
+                                    {formatInterval(intervals.pmae, formatPercentValue)}
                                   </span>
                                   <span className="text-xs text-slate-500">
                                     n={formatNumber(row.percentCount, {
@@ -1,9 +1,10 @@
-import { useEffect, useMemo, useRef, useState } from 'react'
+import { useCallback, useEffect, useMemo, useRef, useState } from 'react'
 import MenuItemSearch from '../components/MenuItemSearch.jsx'
 import ApiTokenStatusCard from '../components/ApiTokenStatusCard.jsx'
 import { useApiToken } from '../components/ApiTokenProvider.jsx'
 import { API_BASE_URL } from '../lib/config.js'
 import { DINING_HALLS } from '../lib/diningHalls.js'
+import { computeDifferenceHash } from '../lib/perceptualHash.js'
 
 const MAX_FILE_SIZE_BYTES = 2 * 1024 * 1024
 const REQUIRED_IMAGE_SIZE = 1024
@@ -180,14 +181,16 @@ function UploadPage() {
       setMenuItemsError('')
       try {
         const params = new URLSearchParams({
-          hallid: metadata.diningHallId,
+          hallId: metadata.diningHallId,
           meal: metadata.mealtime,
           date: metadata.date,
         })
 
+        // The API returns the whole menu in name order, with serving sizes
+        // filled in from the catalog mirror.
         const response = await fetch(
-          `https://husky-eats.onrender.com/api/menu?${params.toString()}`,
-          { signal: controller.signal },
+          `${API_BASE_URL}/menu/search?${params.toString()}`,
+          { headers: { 'X-Api-Key': authToken }, signal: controller.signal },
         )
 
         if (!response.ok) {
@@ -199,103 +202,11 @@ function UploadPage() {
           return
         }
 
-        if (!Array.isArray(payload)) {
+        if (!Array.isArray(payload?.items)) {
           throw new Error('Unexpected response format.')
         }
 
-        const normalizeServingSize = (record) => {
-          if (!record || typeof record !== 'object') {
-            return ''
-          }
-
-          const candidate =
-            record.servingSize ??
-            record.serving_size ??
-            record.servingsize ??
-            record.serving ??
-            record.serving_description ??
-            record.servingDescription ??
-            record.portion ??
-            record.portionSize ??
-            record.portion_size ??
-            record.portionDescription ??
-            record.portion_description ??
-            ''
-
-          if (Array.isArray(candidate)) {
-            return candidate
-              .map((value) => (typeof value === 'string' ? value.trim() : ''))
-              .filter(Boolean)
-              .join(', ')
-          }
-          if (candidate && typeof candidate === 'object') {
-            if (typeof candidate.description === 'string') {
-              return candidate.description.trim()
-            }
-            if (typeof candidate.value === 'string') {
-              return candidate.value.trim()
-            }
-          }
-          return typeof candidate === 'string' ? candidate.trim() : ''
-        }
-
-        const uniqueById = new Map()
-        for (const item of payload) {
-          if (!item || item.id == null || !item.name) {
-            continue
-          }
-          const id = String(item.id)
-          if (!uniqueById.has(id)) {
-            uniqueById.set(id, {
-              id,
-              name: item.name,
-              station: item.station ?? '',
-              servingSize: normalizeServingSize(item),
-            })
-          }
-        }
-
-        const uniqueItems = Array.from(uniqueById.values()).sort((a, b) =>
-          a.name.localeCompare(b.name, undefined, { sensitivity: 'base' }),
-        )
-
-        const itemsWithServingSize = await Promise.all(
-          uniqueItems.map(async (item) => {
-            if (item.servingSize) {
-              return item
-            }
-
-            try {
-              const detailResponse = await fetch(
-                `https://husky-eats.onrender.com/api/menuitem/${item.id}`,
-                { signal: controller.signal },
-              )
-
-              if (!detailResponse.ok) {
-                return item
-              }
-
-              const detail = await detailResponse.json()
-              if (cancelled) {
-                return item
-              }
-
-              const servingSize = normalizeServingSize(detail)
-              if (!servingSize) {
-                return item
-              }
-
-              return { ...item, servingSize }
-            } catch (detailError) {
-              if (detailError.name === 'AbortError') {
-                throw detailError
-              }
-              return item
-            }
-          }),
-        )
-
-        setMenuItems(itemsWithServingSize)
+        setMenuItems(payload.items)
         setMenuItemsStatus('success')
       } catch (error) {
         if (cancelled || error.name === 'AbortError') {
@@ -315,6 +226,7 @@ function UploadPage() {
       controller.abort()
     }
   }, [
+    authToken,
     menuContextReady,
     metadata.date,
     metadata.diningHallId,
@@ -322,6 +234,28 @@ function UploadPage() {
     menuItemsRequestId,
   ])
 
+  const searchMenuItems = useCallback(
+    async (query, signal) => {
+      const params = new URLSearchParams({
+        q: query,
+        hallId: metadata.diningHallId,
+        meal: metadata.mealtime,
+        date: metadata.date,
+        limit: '20',
+      })
+      const response = await fetch(
+        `${API_BASE_URL}/menu/search?${params.toString()}`,
+        { headers: { 'X-Api-Key': authToken }, signal },
+      )
+      if (!response.ok) {
+        throw new Error(`Request failed with status ${response.status}`)
+      }
+      const payload = await response.json()
+      return Array.isArray(payload?.items) ? payload.items : []
+    },
+    [authToken, metadata.date, metadata.diningHallId, metadata.mealtime],
+  )
+
   const handleFileChange = (event) => {
     const file = event.target.files?.[0]
     validationTokenRef.current += 1
@@ -372,12 +306,21 @@ function UploadPage() {
         return
       }
 
+      let perceptualHash = null
+      try {
+        perceptualHash = computeDifferenceHash(img)
+      } catch (error) {
+        // Hashing is best-effort; the upload still works without it.
+        console.warn('Could not compute perceptual hash', error)
+      }
+
       setUploadError('')
       setPlateImage({
         file,
         previewUrl,
         width,
         height,
+        perceptualHash,
       })
     }
 
@@ -568,6 +511,9 @@ function UploadPage() {
       if (!metadataPayload.bucket) {
         delete metadataPayload.bucket
       }
+      if (plateImage.perceptualHash) {
+        metadataPayload.perceptualHash = plateImage.perceptualHash
+      }
 
       const metadataResponse = await fetch(`${API_BASE_URL}/uploads/metadata`, {
         method: 'POST',
@@ -596,11 +542,20 @@ function UploadPage() {
       resetForm()
 
       setSubmitStatus('success')
-      setSubmitMessage(
-        metadataResult?.objectKey
-          ? 'Upload saved. Ready for the next plate!'
-          : 'Upload saved.',
-      )
+      const nearDuplicateCount = metadataResult?.nearDuplicates?.length || 0
+      if (nearDuplicateCount > 0) {
+        setSubmitMessage(
+          `Upload saved, but it looks similar to ${nearDuplicateCount} existing ${
+            nearDuplicateCount === 1 ? 'plate' : 'plates'
+          }. Check the duplicates list before uploading more angles of the same plate.`,
+        )
+      } else {
+        setSubmitMessage(
+          metadataResult?.objectKey
+            ? 'Upload saved. Ready for the next plate!'
+            : 'Upload saved.',
+        )
+      }
     } catch (error) {
       console.error(error)
       setSubmitStatus('error')
@@ -898,6 +853,7 @@ function UploadPage() {
                             error={menuItemsError}
                             selectedId={item.menuItemId}
                             helperMessage={menuHelperMessage}
+                            searchItems={searchMenuItems}
                             onSelect={(menuItemId) =>
                               updateItemField(item.id, 'menuItemId', menuItemId)
                             }
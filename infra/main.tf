@@ -27,10 +27,20 @@ provider "aws" {
 # ---------- Naming helpers ----------
 
 locals {
-  name_prefix           = "${var.project}-${var.env}"
-  uploads_bucket_name   = "${local.name_prefix}-uploads"
-  metadata_table_name   = "${local.name_prefix}-metadata"
-  guestimate_table_name = "${local.name_prefix}-guestimates"
+  name_prefix               = "${var.project}-${var.env}"
+  uploads_bucket_name       = "${local.name_prefix}-uploads"
+  metadata_table_name       = "${local.name_prefix}-metadata"
+  guestimate_table_name     = "${local.name_prefix}-guestimates"
+  coverage_table_name       = "${local.name_prefix}-coverage"
+  item_index_table_name     = "${local.name_prefix}-item-index"
+  content_hash_table_name   = "${local.name_prefix}-content-hashes"
+  phash_index_table_name    = "${local.name_prefix}-phash-index"
+  idempotency_table_name    = "${local.name_prefix}-idempotency"
+  session_rollup_table_name = "${local.name_prefix}-session-rollups"
+  prediction_run_table_name = "${local.name_prefix}-prediction-runs"
+  traffic_capture           = var.traffic_capture_prefix == "" ? "" : "s3://${local.uploads_bucket_name}/${trimsuffix(var.traffic_capture_prefix, "/")}"
+  traffic_capture_source    = "${path.module}/../aws/lambdas/_shared/traffic_capture.py"
+  plate_coverage_source     = "${path.module}/../aws/lambdas/_shared/plate_coverage.py"
 }
 
 # ---------- Storage: S3 + DynamoDB ----------
@@ -60,15 +70,36 @@ resource "aws_s3_bucket_cors_configuration" "uploads" {
     allowed_headers = ["*"]
     allowed_methods = ["PUT", "GET", "HEAD"]
     allowed_origins = ["*"]
+    # Multipart clients read each part's ETag to complete the upload.
+    expose_headers  = ["ETag"]
     max_age_seconds = 3000
   }
 }
 
+resource "aws_s3_bucket_lifecycle_configuration" "uploads" {
+  bucket = aws_s3_bucket.uploads.id
+
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = var.multipart_abort_after_days
+    }
+  }
+}
+
 resource "aws_dynamodb_table" "metadata" {
   name         = local.metadata_table_name
   billing_mode = "PAY_PER_REQUEST"
   hash_key     = "objectKey"
 
+  # Feeds publish_dataset; keys are enough because it republishes from a scan.
+  stream_enabled   = true
+  stream_view_type = "KEYS_ONLY"
+
   attribute {
     name = "objectKey"
     type = "S"
@@ -96,12 +127,211 @@ resource "aws_dynamodb_table" "guestimates" {
     type = "S"
   }
 
+  # Set by guess compaction once a guess is archived to S3.
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_dynamodb_table" "coverage" {
+  name         = local.coverage_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "menuItemId"
+
+  attribute {
+    name = "menuItemId"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# One row per (menuItemId, upload) so item-centric lookups are a Query.
+resource "aws_dynamodb_table" "item_index" {
+  name         = local.item_index_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "menuItemId"
+  range_key    = "sortKey"
+
+  attribute {
+    name = "menuItemId"
+    type = "S"
+  }
+
+  attribute {
+    name = "sortKey"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# One row per distinct image content; claimed atomically with the metadata.
+resource "aws_dynamodb_table" "content_hashes" {
+  name         = local.content_hash_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "contentHash"
+
+  attribute {
+    name = "contentHash"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# Multi-index hashing for near-duplicate photos: one row per
+# (band of the perceptual hash, upload).
+resource "aws_dynamodb_table" "phash_index" {
+  name         = local.phash_index_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "band"
+  range_key    = "objectKey"
+
+  attribute {
+    name = "band"
+    type = "S"
+  }
+
+  attribute {
+    name = "objectKey"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# Replayable responses for POST /guestimate/guess keyed by Idempotency-Key.
+resource "aws_dynamodb_table" "idempotency" {
+  name         = local.idempotency_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotencyKey"
+
+  attribute {
+    name = "idempotencyKey"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# Running error sums per guessing session (plus one "overall" row), updated in
+# the same transaction as each guess; backs GET /guestimate/leaderboard.
+resource "aws_dynamodb_table" "session_rollups" {
+  name         = local.session_rollup_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "rollupId"
+
+  attribute {
+    name = "rollupId"
+    type = "S"
+  }
+
   tags = {
     Project = var.project
     Env     = var.env
   }
 }
 
+# Registered model runs: one "#run" header per run plus one columnar item per
+# submitted prediction batch (parallel objectKey/guess/ground-truth lists).
+resource "aws_dynamodb_table" "prediction_runs" {
+  name         = local.prediction_run_table_name
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "runId"
+  range_key    = "sortKey"
+
+  attribute {
+    name = "runId"
+    type = "S"
+  }
+
+  attribute {
+    name = "sortKey"
+    type = "S"
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# S3 upload notifications are delayed so metadata has time to arrive before
+# the reconciler checks for it.
+resource "aws_sqs_queue" "upload_events" {
+  name                       = "${local.name_prefix}-upload-events"
+  delay_seconds              = var.orphan_grace_seconds
+  visibility_timeout_seconds = 120
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+data "aws_iam_policy_document" "upload_events_queue" {
+  statement {
+    effect = "Allow"
+    principals {
+      type        = "Service"
+      identifiers = ["s3.amazonaws.com"]
+    }
+
+    actions   = ["sqs:SendMessage"]
+    resources = [aws_sqs_queue.upload_events.arn]
+
+    condition {
+      test     = "ArnEquals"
+      variable = "aws:SourceArn"
+      values   = [aws_s3_bucket.uploads.arn]
+    }
+  }
+}
+
+resource "aws_sqs_queue_policy" "upload_events" {
+  queue_url = aws_sqs_queue.upload_events.id
+  policy    = data.aws_iam_policy_document.upload_events_queue.json
+}
+
+resource "aws_s3_bucket_notification" "uploads" {
+  bucket = aws_s3_bucket.uploads.id
+
+  queue {
+    queue_arn     = aws_sqs_queue.upload_events.arn
+    events        = ["s3:ObjectCreated:*"]
+    filter_prefix = var.upload_prefix
+  }
+
+  depends_on = [aws_sqs_queue_policy.upload_events]
+}
+
 # ---------- IAM for Lambdas ----------
 
 data "aws_iam_policy_document" "lambda_assume_role" {
@@ -144,12 +374,23 @@ data "aws_iam_policy_document" "lambda_extra" {
       "dynamodb:Scan",
       "dynamodb:Query",
       "dynamodb:UpdateItem",
+      "dynamodb:DeleteItem",
+      "dynamodb:BatchWriteItem",
+      "dynamodb:BatchGetItem",
+      "dynamodb:ConditionCheckItem",
       "dynamodb:DescribeTable",
     ]
 
     resources = [
       aws_dynamodb_table.metadata.arn,
       aws_dynamodb_table.guestimates.arn,
+      aws_dynamodb_table.coverage.arn,
+      aws_dynamodb_table.item_index.arn,
+      aws_dynamodb_table.content_hashes.arn,
+      aws_dynamodb_table.phash_index.arn,
+      aws_dynamodb_table.idempotency.arn,
+      aws_dynamodb_table.session_rollups.arn,
+      aws_dynamodb_table.prediction_runs.arn,
     ]
   }
 
@@ -161,12 +402,59 @@ data "aws_iam_policy_document" "lambda_extra" {
       "s3:PutObject",
       "s3:GetObject",
       "s3:AbortMultipartUpload",
+      "s3:ListMultipartUploadParts",
+      "s3:DeleteObject",
     ]
 
     resources = [
       "${aws_s3_bucket.uploads.arn}/*",
     ]
   }
+
+  statement {
+    sid    = "S3UploadListing"
+    effect = "Allow"
+
+    # Needed for the orphan sweep and for HeadObject to report 404s.
+    actions = [
+      "s3:ListBucket",
+    ]
+
+    resources = [
+      aws_s3_bucket.uploads.arn,
+    ]
+  }
+
+  statement {
+    sid    = "MetadataStreamRead"
+    effect = "Allow"
+
+    actions = [
+      "dynamodb:GetRecords",
+      "dynamodb:GetShardIterator",
+      "dynamodb:DescribeStream",
+      "dynamodb:ListStreams",
+    ]
+
+    resources = [
+      aws_dynamodb_table.metadata.stream_arn,
+    ]
+  }
+
+  statement {
+    sid    = "UploadEventQueue"
+    effect = "Allow"
+
+    actions = [
+      "sqs:ReceiveMessage",
+      "sqs:DeleteMessage",
+      "sqs:GetQueueAttributes",
+    ]
+
+    resources = [
+      aws_sqs_queue.upload_events.arn,
+    ]
+  }
 }
 
 resource "aws_iam_policy" "lambda_extra" {
@@ -179,42 +467,171 @@ resource "aws_iam_role_policy_attachment" "lambda_extra_attach" {
   policy_arn = aws_iam_policy.lambda_extra.arn
 }
 
-# Build Lambda zip archives from source directories
+# Build Lambda zip archives from source directories. API functions also
+# bundle the shared traffic_capture module next to their handler, and the
+# two coverage writers share plate_coverage.
 
 data "archive_file" "get_dataset" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/get_dataset"
   output_path = "${path.module}/dist/get_dataset.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/get_dataset/get_dataset.py")
+    filename = "get_dataset.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
 }
 
 data "archive_file" "presign_upload" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/presign_upload"
   output_path = "${path.module}/dist/presign_upload.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/presign_upload/presign_upload.py")
+    filename = "presign_upload.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
 }
 
 data "archive_file" "presign_download" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/presign_download"
   output_path = "${path.module}/dist/presign_download.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/presign_download/presign_download.py")
+    filename = "presign_download.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
 }
 
 data "archive_file" "upload_metadata" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/upload_metadata"
   output_path = "${path.module}/dist/upload_metadata.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/upload_metadata/upload_metadata.py")
+    filename = "upload_metadata.py"
+  }
+
+  source {
+    content  = file(local.plate_coverage_source)
+    filename = "plate_coverage.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
 }
 
 data "archive_file" "get_dataset_item" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/get_dataset_item"
   output_path = "${path.module}/dist/get_dataset_item.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/get_dataset_item/get_dataset_item.py")
+    filename = "get_dataset_item.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
 }
 
 data "archive_file" "guestimate" {
   type        = "zip"
-  source_dir  = "${path.module}/../aws/lambdas/guestimate"
   output_path = "${path.module}/dist/guestimate.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/guestimate/guestimate.py")
+    filename = "guestimate.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
+}
+
+data "archive_file" "sync_catalog" {
+  type        = "zip"
+  source_dir  = "${path.module}/../aws/lambdas/sync_catalog"
+  output_path = "${path.module}/dist/sync_catalog.zip"
+}
+
+data "archive_file" "reconcile_uploads" {
+  type        = "zip"
+  source_dir  = "${path.module}/../aws/lambdas/reconcile_uploads"
+  output_path = "${path.module}/dist/reconcile_uploads.zip"
+}
+
+data "archive_file" "get_coverage" {
+  type        = "zip"
+  output_path = "${path.module}/dist/get_coverage.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/get_coverage/get_coverage.py")
+    filename = "get_coverage.py"
+  }
+
+  source {
+    content  = file(local.plate_coverage_source)
+    filename = "plate_coverage.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
+}
+
+data "archive_file" "get_duplicates" {
+  type        = "zip"
+  output_path = "${path.module}/dist/get_duplicates.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/get_duplicates/get_duplicates.py")
+    filename = "get_duplicates.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
+}
+
+data "archive_file" "search_menu_items" {
+  type        = "zip"
+  output_path = "${path.module}/dist/search_menu_items.zip"
+
+  source {
+    content  = file("${path.module}/../aws/lambdas/search_menu_items/search_menu_items.py")
+    filename = "search_menu_items.py"
+  }
+
+  source {
+    content  = file(local.traffic_capture_source)
+    filename = "traffic_capture.py"
+  }
+}
+
+data "archive_file" "publish_dataset" {
+  type        = "zip"
+  source_dir  = "${path.module}/../aws/lambdas/publish_dataset"
+  output_path = "${path.module}/dist/publish_dataset.zip"
 }
 
 # ---------- Lambda functions ----------
@@ -230,8 +647,13 @@ resource "aws_lambda_function" "get_dataset" {
 
   environment {
     variables = {
-      METADATA_TABLE = aws_dynamodb_table.metadata.name
-      AUTH_TOKEN     = var.auth_token
+      METADATA_TABLE         = aws_dynamodb_table.metadata.name
+      ITEM_INDEX_TABLE       = aws_dynamodb_table.item_index.name
+      AUTH_TOKEN             = var.auth_token
+      DATASET_BUCKET         = aws_s3_bucket.uploads.bucket
+      DATASET_PREFIX         = var.dataset_prefix
+      URL_EXPIRATION_SECONDS = tostring(var.url_expiration_seconds)
+      TRAFFIC_CAPTURE        = local.traffic_capture
     }
   }
 
@@ -256,6 +678,7 @@ resource "aws_lambda_function" "presign_upload" {
       UPLOAD_PREFIX          = var.upload_prefix
       URL_EXPIRATION_SECONDS = tostring(var.url_expiration_seconds)
       AUTH_TOKEN             = var.auth_token
+      TRAFFIC_CAPTURE        = local.traffic_capture
     }
   }
 
@@ -280,6 +703,7 @@ resource "aws_lambda_function" "presign_download" {
       UPLOAD_BUCKET          = aws_s3_bucket.uploads.bucket
       URL_EXPIRATION_SECONDS = tostring(var.url_expiration_seconds)
       AUTH_TOKEN             = var.auth_token
+      TRAFFIC_CAPTURE        = local.traffic_capture
     }
   }
 
@@ -300,8 +724,16 @@ resource "aws_lambda_function" "upload_metadata" {
 
   environment {
     variables = {
-      METADATA_TABLE = aws_dynamodb_table.metadata.name
-      AUTH_TOKEN     = var.auth_token
+      METADATA_TABLE     = aws_dynamodb_table.metadata.name
+      COVERAGE_TABLE     = aws_dynamodb_table.coverage.name
+      ITEM_INDEX_TABLE   = aws_dynamodb_table.item_index.name
+      CONTENT_HASH_TABLE = aws_dynamodb_table.content_hashes.name
+      PHASH_INDEX_TABLE  = aws_dynamodb_table.phash_index.name
+      UPLOAD_BUCKET      = aws_s3_bucket.uploads.bucket
+      AUTH_TOKEN         = var.auth_token
+      CATALOG_BUCKET     = aws_s3_bucket.uploads.bucket
+      CATALOG_PREFIX     = var.catalog_prefix
+      TRAFFIC_CAPTURE    = local.traffic_capture
     }
   }
 
@@ -322,8 +754,9 @@ resource "aws_lambda_function" "get_dataset_item" {
 
   environment {
     variables = {
-      METADATA_TABLE = aws_dynamodb_table.metadata.name
-      AUTH_TOKEN     = var.auth_token
+      METADATA_TABLE  = aws_dynamodb_table.metadata.name
+      AUTH_TOKEN      = var.auth_token
+      TRAFFIC_CAPTURE = local.traffic_capture
     }
   }
 
@@ -333,6 +766,30 @@ resource "aws_lambda_function" "get_dataset_item" {
   }
 }
 
+# Shared by the guestimate API function and its compaction function.
+locals {
+  guestimate_environment = {
+    METADATA_TABLE         = aws_dynamodb_table.metadata.name
+    GUESTIMATE_TABLE       = aws_dynamodb_table.guestimates.name
+    UPLOAD_BUCKET          = aws_s3_bucket.uploads.bucket
+    URL_EXPIRATION_SECONDS = tostring(var.url_expiration_seconds)
+    AUTH_TOKEN             = var.auth_token
+    HUSKYEATS_BASE_URL     = var.huskyeats_base_url
+    CATALOG_BUCKET         = aws_s3_bucket.uploads.bucket
+    CATALOG_PREFIX         = var.catalog_prefix
+    IDEMPOTENCY_TABLE      = aws_dynamodb_table.idempotency.name
+    SESSION_ROLLUP_TABLE   = aws_dynamodb_table.session_rollups.name
+    PREDICTION_RUN_TABLE   = aws_dynamodb_table.prediction_runs.name
+    DATASET_BUCKET         = aws_s3_bucket.uploads.bucket
+    DATASET_PREFIX         = var.dataset_prefix
+    GUESS_SHARDS           = tostring(var.guess_shards)
+    GUESS_ARCHIVE_BUCKET   = aws_s3_bucket.uploads.bucket
+    GUESS_ARCHIVE_PREFIX   = var.guess_archive_prefix
+    GUESS_HOT_DAYS         = tostring(var.guess_hot_days)
+    TRAFFIC_CAPTURE        = local.traffic_capture
+  }
+}
+
 resource "aws_lambda_function" "guestimate" {
   function_name = "${local.name_prefix}-guestimate"
   role          = aws_iam_role.lambda_exec.arn
@@ -344,14 +801,199 @@ resource "aws_lambda_function" "guestimate" {
   filename         = data.archive_file.guestimate.output_path
   source_code_hash = data.archive_file.guestimate.output_base64sha256
 
+  environment {
+    variables = local.guestimate_environment
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+# Scheduled guess compaction gets its own function: a run needs minutes and
+# more memory, and must not hold the API function's concurrency.
+resource "aws_lambda_function" "guestimate_compaction" {
+  function_name                  = "${local.name_prefix}-guestimate-compaction"
+  role                           = aws_iam_role.lambda_exec.arn
+  runtime                        = "python3.11"
+  handler                        = "guestimate.lambda_handler"
+  timeout                        = var.guess_compaction_timeout_seconds
+  memory_size                    = var.guess_compaction_memory_mb
+  reserved_concurrent_executions = 1
+
+  filename         = data.archive_file.guestimate.output_path
+  source_code_hash = data.archive_file.guestimate.output_base64sha256
+
+  environment {
+    variables = merge(local.guestimate_environment, {
+      GUESS_COMPACTION_MAX_ITEMS = tostring(var.guess_compaction_batch_size)
+      TRAFFIC_CAPTURE            = ""
+    })
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_function" "get_coverage" {
+  function_name = "${local.name_prefix}-get-coverage"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "get_coverage.lambda_handler"
+  timeout       = 30
+
+  filename         = data.archive_file.get_coverage.output_path
+  source_code_hash = data.archive_file.get_coverage.output_base64sha256
+
   environment {
     variables = {
-      METADATA_TABLE         = aws_dynamodb_table.metadata.name
-      GUESTIMATE_TABLE       = aws_dynamodb_table.guestimates.name
-      UPLOAD_BUCKET          = aws_s3_bucket.uploads.bucket
-      URL_EXPIRATION_SECONDS = tostring(var.url_expiration_seconds)
-      AUTH_TOKEN             = var.auth_token
-      HUSKYEATS_BASE_URL     = var.huskyeats_base_url
+      METADATA_TABLE     = aws_dynamodb_table.metadata.name
+      COVERAGE_TABLE     = aws_dynamodb_table.coverage.name
+      AUTH_TOKEN         = var.auth_token
+      CATALOG_BUCKET     = aws_s3_bucket.uploads.bucket
+      CATALOG_PREFIX     = var.catalog_prefix
+      HUSKYEATS_BASE_URL = var.huskyeats_base_url
+      DINING_HALL_IDS    = join(",", var.dining_hall_ids)
+      TRAFFIC_CAPTURE    = local.traffic_capture
+    }
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_function" "get_duplicates" {
+  function_name = "${local.name_prefix}-get-duplicates"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "get_duplicates.lambda_handler"
+  timeout       = 30
+
+  filename         = data.archive_file.get_duplicates.output_path
+  source_code_hash = data.archive_file.get_duplicates.output_base64sha256
+
+  environment {
+    variables = {
+      METADATA_TABLE    = aws_dynamodb_table.metadata.name
+      PHASH_INDEX_TABLE = aws_dynamodb_table.phash_index.name
+      AUTH_TOKEN        = var.auth_token
+      TRAFFIC_CAPTURE   = local.traffic_capture
+    }
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_function" "search_menu_items" {
+  function_name = "${local.name_prefix}-search-menu-items"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "search_menu_items.lambda_handler"
+  timeout       = 15
+  memory_size   = 256
+
+  filename         = data.archive_file.search_menu_items.output_path
+  source_code_hash = data.archive_file.search_menu_items.output_base64sha256
+
+  environment {
+    variables = {
+      CATALOG_BUCKET     = aws_s3_bucket.uploads.bucket
+      CATALOG_PREFIX     = var.catalog_prefix
+      HUSKYEATS_BASE_URL = var.huskyeats_base_url
+      AUTH_TOKEN         = var.auth_token
+      TRAFFIC_CAPTURE    = local.traffic_capture
+    }
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_function" "sync_catalog" {
+  function_name = "${local.name_prefix}-sync-catalog"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "sync_catalog.lambda_handler"
+  timeout       = 300
+  memory_size   = 256
+
+  filename         = data.archive_file.sync_catalog.output_path
+  source_code_hash = data.archive_file.sync_catalog.output_base64sha256
+
+  environment {
+    variables = {
+      CATALOG_BUCKET     = aws_s3_bucket.uploads.bucket
+      CATALOG_PREFIX     = var.catalog_prefix
+      HUSKYEATS_BASE_URL = var.huskyeats_base_url
+    }
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_function" "reconcile_uploads" {
+  function_name = "${local.name_prefix}-reconcile-uploads"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "reconcile_uploads.lambda_handler"
+  timeout       = 300
+
+  filename         = data.archive_file.reconcile_uploads.output_path
+  source_code_hash = data.archive_file.reconcile_uploads.output_base64sha256
+
+  environment {
+    variables = {
+      METADATA_TABLE       = aws_dynamodb_table.metadata.name
+      UPLOAD_BUCKET        = aws_s3_bucket.uploads.bucket
+      UPLOAD_PREFIX        = var.upload_prefix
+      ORPHAN_GRACE_SECONDS = tostring(var.orphan_grace_seconds)
+    }
+  }
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_lambda_event_source_mapping" "reconcile_uploads" {
+  event_source_arn = aws_sqs_queue.upload_events.arn
+  function_name    = aws_lambda_function.reconcile_uploads.arn
+  batch_size       = 10
+}
+
+resource "aws_lambda_function" "publish_dataset" {
+  function_name = "${local.name_prefix}-publish-dataset"
+  role          = aws_iam_role.lambda_exec.arn
+  runtime       = "python3.11"
+  handler       = "publish_dataset.lambda_handler"
+  timeout       = 120
+  memory_size   = 256
+
+  # One publisher at a time so pointer writes never race.
+  reserved_concurrent_executions = 1
+
+  filename         = data.archive_file.publish_dataset.output_path
+  source_code_hash = data.archive_file.publish_dataset.output_base64sha256
+
+  environment {
+    variables = {
+      METADATA_TABLE = aws_dynamodb_table.metadata.name
+      DATASET_BUCKET = aws_s3_bucket.uploads.bucket
+      DATASET_PREFIX = var.dataset_prefix
     }
   }
 
@@ -361,6 +1003,162 @@ resource "aws_lambda_function" "guestimate" {
   }
 }
 
+# Batches bursts of uploads into one republish per window.
+resource "aws_lambda_event_source_mapping" "publish_dataset" {
+  event_source_arn                   = aws_dynamodb_table.metadata.stream_arn
+  function_name                      = aws_lambda_function.publish_dataset.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 1000
+  maximum_batching_window_in_seconds = var.dataset_publish_window_seconds
+}
+
+# ---------- Scheduled jobs (EventBridge) ----------
+
+resource "aws_cloudwatch_event_rule" "sync_catalog" {
+  name                = "${local.name_prefix}-sync-catalog"
+  description         = "Mirror the Husky Eats menu item catalog into S3"
+  schedule_expression = var.catalog_sync_schedule
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_cloudwatch_event_target" "sync_catalog" {
+  rule = aws_cloudwatch_event_rule.sync_catalog.name
+  arn  = aws_lambda_function.sync_catalog.arn
+}
+
+resource "aws_lambda_permission" "sync_catalog_schedule" {
+  statement_id  = "AllowEventBridgeInvokeSyncCatalog"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.sync_catalog.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.sync_catalog.arn
+}
+
+# Backstop for uploads whose notification was lost or arrived early.
+resource "aws_cloudwatch_event_rule" "reconcile_uploads" {
+  name                = "${local.name_prefix}-reconcile-uploads"
+  description         = "Delete uploaded images that never received metadata"
+  schedule_expression = var.reconcile_schedule
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_cloudwatch_event_target" "reconcile_uploads" {
+  rule = aws_cloudwatch_event_rule.reconcile_uploads.name
+  arn  = aws_lambda_function.reconcile_uploads.arn
+}
+
+resource "aws_lambda_permission" "reconcile_uploads_schedule" {
+  statement_id  = "AllowEventBridgeInvokeReconcileUploads"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.reconcile_uploads.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.reconcile_uploads.arn
+}
+
+# Backstop in case a stream batch failed or the manifest was never published.
+resource "aws_cloudwatch_event_rule" "publish_dataset" {
+  name                = "${local.name_prefix}-publish-dataset"
+  description         = "Republish the dataset manifest if metadata changed"
+  schedule_expression = var.dataset_publish_schedule
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_cloudwatch_event_target" "publish_dataset" {
+  rule = aws_cloudwatch_event_rule.publish_dataset.name
+  arn  = aws_lambda_function.publish_dataset.arn
+}
+
+resource "aws_lambda_permission" "publish_dataset_schedule" {
+  statement_id  = "AllowEventBridgeInvokePublishDataset"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.publish_dataset.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.publish_dataset.arn
+}
+
+# Moves guesses older than guess_hot_days to the S3 cold tier.
+resource "aws_cloudwatch_event_rule" "compact_guesses" {
+  name                = "${local.name_prefix}-compact-guesses"
+  description         = "Archive old guesses to S3 and expire their table copies"
+  schedule_expression = var.guess_compaction_schedule
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_cloudwatch_event_target" "compact_guesses" {
+  rule  = aws_cloudwatch_event_rule.compact_guesses.name
+  arn   = aws_lambda_function.guestimate_compaction.arn
+  input = jsonencode({ action = "compact_guesses" })
+}
+
+resource "aws_lambda_permission" "compact_guesses_schedule" {
+  statement_id  = "AllowEventBridgeInvokeCompactGuesses"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.guestimate_compaction.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compact_guesses.arn
+}
+
+# Keeps API containers warm; handlers answer {"action": "warmup"} by loading
+# their caches and return before auth.
+locals {
+  warmup_functions = {
+    get_dataset       = aws_lambda_function.get_dataset
+    presign_upload    = aws_lambda_function.presign_upload
+    presign_download  = aws_lambda_function.presign_download
+    upload_metadata   = aws_lambda_function.upload_metadata
+    get_dataset_item  = aws_lambda_function.get_dataset_item
+    guestimate        = aws_lambda_function.guestimate
+    get_coverage      = aws_lambda_function.get_coverage
+    get_duplicates    = aws_lambda_function.get_duplicates
+    search_menu_items = aws_lambda_function.search_menu_items
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "warmup" {
+  name                = "${local.name_prefix}-warmup"
+  description         = "Warm the API Lambdas and prime their caches"
+  schedule_expression = var.warmup_schedule
+
+  tags = {
+    Project = var.project
+    Env     = var.env
+  }
+}
+
+resource "aws_cloudwatch_event_target" "warmup" {
+  for_each = local.warmup_functions
+
+  rule  = aws_cloudwatch_event_rule.warmup.name
+  arn   = each.value.arn
+  input = jsonencode({ action = "warmup" })
+}
+
+resource "aws_lambda_permission" "warmup" {
+  for_each = local.warmup_functions
+
+  statement_id  = "AllowEventBridgeWarmup"
+  action        = "lambda:InvokeFunction"
+  function_name = each.value.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.warmup.arn
+}
+
 # ---------- HTTP API (API Gateway v2) ----------
 
 resource "aws_apigatewayv2_api" "this" {
@@ -368,9 +1166,10 @@ resource "aws_apigatewayv2_api" "this" {
   protocol_type = "HTTP"
 
   cors_configuration {
-    allow_headers = ["content-type", "x-api-key", "authorization"]
-    allow_methods = ["OPTIONS", "GET", "POST"]
-    allow_origins = ["*"]
+    allow_headers  = ["content-type", "x-api-key", "authorization", "if-none-match", "idempotency-key"]
+    allow_methods  = ["OPTIONS", "GET", "POST"]
+    allow_origins  = ["*"]
+    expose_headers = ["etag"]
   }
 }
 
@@ -439,6 +1238,30 @@ resource "aws_apigatewayv2_integration" "guestimate" {
   payload_format_version = "2.0"
 }
 
+resource "aws_apigatewayv2_integration" "get_coverage" {
+  api_id                 = aws_apigatewayv2_api.this.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.get_coverage.invoke_arn
+  integration_method     = "POST"
+  payload_format_version = "2.0"
+}
+
+resource "aws_apigatewayv2_integration" "get_duplicates" {
+  api_id                 = aws_apigatewayv2_api.this.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.get_duplicates.invoke_arn
+  integration_method     = "POST"
+  payload_format_version = "2.0"
+}
+
+resource "aws_apigatewayv2_integration" "search_menu_items" {
+  api_id                 = aws_apigatewayv2_api.this.id
+  integration_type       = "AWS_PROXY"
+  integration_uri        = aws_lambda_function.search_menu_items.invoke_arn
+  integration_method     = "POST"
+  payload_format_version = "2.0"
+}
+
 # Routes: match what your frontend expects
 resource "aws_apigatewayv2_route" "get_dataset" {
   api_id    = aws_apigatewayv2_api.this.id
@@ -452,6 +1275,24 @@ resource "aws_apigatewayv2_route" "presign_upload" {
   target    = "integrations/${aws_apigatewayv2_integration.presign_upload.id}"
 }
 
+resource "aws_apigatewayv2_route" "multipart_parts" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "POST /uploads/multipart/parts"
+  target    = "integrations/${aws_apigatewayv2_integration.presign_upload.id}"
+}
+
+resource "aws_apigatewayv2_route" "multipart_complete" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "POST /uploads/multipart/complete"
+  target    = "integrations/${aws_apigatewayv2_integration.presign_upload.id}"
+}
+
+resource "aws_apigatewayv2_route" "multipart_abort" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "POST /uploads/multipart/abort"
+  target    = "integrations/${aws_apigatewayv2_integration.presign_upload.id}"
+}
+
 resource "aws_apigatewayv2_route" "presign_download" {
   api_id    = aws_apigatewayv2_api.this.id
   route_key = "POST /downloads/presign"
@@ -470,6 +1311,31 @@ resource "aws_apigatewayv2_route" "get_dataset_item" {
   target    = "integrations/${aws_apigatewayv2_integration.get_dataset_item.id}"
 }
 
+# More specific than /dataset/{objectKey+}, so API Gateway matches it first.
+resource "aws_apigatewayv2_route" "get_coverage" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /dataset/coverage"
+  target    = "integrations/${aws_apigatewayv2_integration.get_coverage.id}"
+}
+
+resource "aws_apigatewayv2_route" "get_duplicates" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /dataset/duplicates"
+  target    = "integrations/${aws_apigatewayv2_integration.get_duplicates.id}"
+}
+
+resource "aws_apigatewayv2_route" "search_menu_items" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /menu/search"
+  target    = "integrations/${aws_apigatewayv2_integration.search_menu_items.id}"
+}
+
+resource "aws_apigatewayv2_route" "get_dataset_manifest" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /dataset/manifest"
+  target    = "integrations/${aws_apigatewayv2_integration.get_dataset.id}"
+}
+
 resource "aws_apigatewayv2_route" "guestimate_sample" {
   api_id    = aws_apigatewayv2_api.this.id
   route_key = "GET /guestimate/sample"
@@ -488,6 +1354,36 @@ resource "aws_apigatewayv2_route" "guestimate_analysis" {
   target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
 }
 
+resource "aws_apigatewayv2_route" "guestimate_leaderboard" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /guestimate/leaderboard"
+  target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
+}
+
+resource "aws_apigatewayv2_route" "guestimate_guesses" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /guestimate/guesses"
+  target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
+}
+
+resource "aws_apigatewayv2_route" "guestimate_runs" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "POST /guestimate/runs"
+  target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
+}
+
+resource "aws_apigatewayv2_route" "guestimate_run_predictions" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "POST /guestimate/runs/{runId}/predictions"
+  target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
+}
+
+resource "aws_apigatewayv2_route" "guestimate_runs_compare" {
+  api_id    = aws_apigatewayv2_api.this.id
+  route_key = "GET /guestimate/runs/compare"
+  target    = "integrations/${aws_apigatewayv2_integration.guestimate.id}"
+}
+
 # Allow API Gateway to invoke the Lambdas
 resource "aws_lambda_permission" "get_dataset" {
   statement_id  = "AllowAPIGatewayInvokeGetDataset"
@@ -536,3 +1432,27 @@ resource "aws_lambda_permission" "guestimate" {
   principal     = "apigateway.amazonaws.com"
   source_arn    = "${aws_apigatewayv2_api.this.execution_arn}/*/*"
 }
+
+resource "aws_lambda_permission" "get_coverage" {
+  statement_id  = "AllowAPIGatewayInvokeGetCoverage"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_coverage.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.this.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "get_duplicates" {
+  statement_id  = "AllowAPIGatewayInvokeGetDuplicates"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.get_duplicates.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.this.execution_arn}/*/*"
+}
+
+resource "aws_lambda_permission" "search_menu_items" {
+  statement_id  = "AllowAPIGatewayInvokeSearchMenuItems"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.search_menu_items.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.this.execution_arn}/*/*"
+}
@@ -17,3 +17,38 @@ output "guestimate_table" {
   description = "DynamoDB table for human nutrition estimates"
   value       = aws_dynamodb_table.guestimates.name
 }
+
+output "coverage_table" {
+  description = "DynamoDB table for per-menu-item labeling coverage"
+  value       = aws_dynamodb_table.coverage.name
+}
+
+output "item_index_table" {
+  description = "DynamoDB table mapping menuItemId to labeled uploads"
+  value       = aws_dynamodb_table.item_index.name
+}
+
+output "content_hash_table" {
+  description = "DynamoDB table mapping image content hashes to uploads"
+  value       = aws_dynamodb_table.content_hashes.name
+}
+
+output "idempotency_table" {
+  description = "DynamoDB table holding replayable guess responses per Idempotency-Key"
+  value       = aws_dynamodb_table.idempotency.name
+}
+
+output "session_rollup_table" {
+  description = "DynamoDB table of per-session guess error rollups for the leaderboard"
+  value       = aws_dynamodb_table.session_rollups.name
+}
+
+output "prediction_run_table" {
+  description = "DynamoDB table of registered model runs and their columnar prediction batches"
+  value       = aws_dynamodb_table.prediction_runs.name
+}
+
+output "phash_index_table" {
+  description = "DynamoDB table indexing perceptual-hash bands for near-duplicate lookups"
+  value       = aws_dynamodb_table.phash_index.name
+}
@@ -38,3 +38,111 @@ variable "huskyeats_base_url" {
   type        = string
   default     = "https://husky-eats.onrender.com/api"
 }
+
+variable "dining_hall_ids" {
+  description = "Husky Eats dining hall IDs whose menus get_coverage fetches when a menu context names no hall"
+  type        = list(string)
+  default     = ["1", "3", "5", "6", "7", "15", "16", "42"]
+}
+
+variable "catalog_prefix" {
+  description = "S3 key prefix for the mirrored Husky Eats catalog"
+  type        = string
+  default     = "catalog/"
+}
+
+variable "catalog_sync_schedule" {
+  description = "EventBridge schedule expression for the catalog sync job"
+  type        = string
+  default     = "rate(6 hours)"
+}
+
+variable "dataset_prefix" {
+  description = "S3 key prefix for published dataset manifests"
+  type        = string
+  default     = "dataset/"
+}
+
+variable "dataset_publish_window_seconds" {
+  description = "Seconds the metadata stream batches changes before republishing the dataset manifest (max 300)"
+  type        = number
+  default     = 30
+}
+
+variable "dataset_publish_schedule" {
+  description = "EventBridge schedule expression for the dataset manifest safety-net republish"
+  type        = string
+  default     = "rate(1 hour)"
+}
+
+variable "guess_shards" {
+  description = "Partitions per sample in the guestimates table (1 = unsharded)"
+  type        = number
+  default     = 1
+}
+
+variable "multipart_abort_after_days" {
+  description = "Days before S3 aborts incomplete multipart uploads"
+  type        = number
+  default     = 2
+}
+
+variable "orphan_grace_seconds" {
+  description = "Seconds an upload may exist without metadata before it is deleted (max 900, the SQS delay limit)"
+  type        = number
+  default     = 900
+}
+
+variable "guess_archive_prefix" {
+  description = "S3 prefix in the uploads bucket for archived guesses and their aggregates"
+  type        = string
+  default     = "guesses/"
+}
+
+variable "traffic_capture_prefix" {
+  description = "S3 prefix in the uploads bucket for sanitized API traffic captures (empty disables capture)"
+  type        = string
+  default     = ""
+}
+
+variable "guess_hot_days" {
+  description = "Days guesses stay in DynamoDB before compaction archives them to S3"
+  type        = number
+  default     = 30
+}
+
+variable "guess_compaction_schedule" {
+  description = "EventBridge schedule expression for guess compaction"
+  type        = string
+  default     = "cron(30 3 * * ? *)"
+}
+
+variable "guess_compaction_timeout_seconds" {
+  description = "Timeout of the guess compaction function; runs stop early and resume next time"
+  type        = number
+  default     = 900
+}
+
+variable "guess_compaction_memory_mb" {
+  description = "Memory of the guess compaction function"
+  type        = number
+  default     = 1024
+}
+
+variable "guess_compaction_batch_size" {
+  description = "Guesses archived per compaction batch (GUESS_COMPACTION_MAX_ITEMS)"
+  type        = number
+  default     = 10000
+}
+
+variable "warmup_schedule" {
+  description = "EventBridge schedule expression for warming the API Lambdas"
+  type        = string
+  default     = "rate(5 minutes)"
+}
+
+variable "reconcile_schedule" {
+  description = "EventBridge schedule expression for the orphan upload sweep"
+  type        = string
+  default     = "rate(1 hour)"
+}